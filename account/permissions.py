@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from uuid import uuid4
+
+# Users' permissions, as checked by views and by templates through perms for every comment and reply. The permissions a
+# user has directly and through their groups are loaded together once and cached per user, under the permissions
+# version. Changing a user's permissions or groups clears their cached permissions, and changing a group's permissions
+# starts a new version, so all users' are loaded afresh, as any of them may be in the group. They're only cached when
+# the cache is shared between processes, as clearing them from a cache in one process's memory would leave the other
+# processes using them. Otherwise they're loaded from the database once per request, as ModelBackend does.
+
+PERMISSIONS_CACHE_KEY = 'account:permissions:{}'
+PERMISSIONS_VERSION_CACHE_KEY = 'account:permissions:version'
+
+
+def new_permissions_version():
+    '''
+    Starts a new permissions version, so permissions cached under earlier versions aren't used.
+    '''
+    version = uuid4().hex
+    cache.set(PERMISSIONS_VERSION_CACHE_KEY, version, None)
+    return version
+
+
+def cache_is_shared():
+    '''
+    Returns whether the cache is shared between processes, so clearing users' permissions clears them for all of them.
+    '''
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def clear_permissions(user_ids):
+    '''
+    Clears the cached permissions of the users with the ids given.
+    '''
+    cache.delete_many([PERMISSIONS_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+class CachedPermissionsBackend(ModelBackend):
+    '''
+    Model backend reading users' permissions from the cache, loading them from the database only when they aren't cached.
+    Without a shared cache it's a plain ModelBackend.
+    '''
+    def get_all_permissions(self, user_obj, obj=None):
+        if not cache_is_shared():
+            return super(CachedPermissionsBackend, self).get_all_permissions(user_obj, obj)
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = PERMISSIONS_CACHE_KEY.format(user_obj.pk)
+            cached = cache.get_many([key, PERMISSIONS_VERSION_CACHE_KEY])
+            version = cached.get(PERMISSIONS_VERSION_CACHE_KEY) or new_permissions_version()
+            if key in cached and cached[key][0] == version:
+                user_obj._perm_cache = set(cached[key][1])
+            else:
+                perms = super(CachedPermissionsBackend, self).get_all_permissions(user_obj)
+                cache.set(key, (version, frozenset(perms)), settings.PERMISSIONS_CACHE_TIMEOUT)
+        return user_obj._perm_cache
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+from account.permissions import clear_permissions, new_permissions_version
+
+
+@receiver(user_logged_in)
+def load_logged_in_permissions(sender, request, user, **kwargs):
+    # Users' permissions are cached as they log in, ready for the pages they go on to.
+    user.get_all_permissions()
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_changed_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        clear_permissions([instance.pk])
+    elif pk_set is not None:
+        clear_permissions(pk_set)
+    else:
+        # The users a permission or group was cleared from aren't known, so all users' permissions are loaded afresh.
+        new_permissions_version()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def clear_changed_group_permissions(sender, action, **kwargs):
+    if action.startswith('post_'):
+        new_permissions_version()
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Group)
+def clear_all_permissions(sender, **kwargs):
+    # Superusers have every permission, and deleting a permission or group removes it from everyone who had it.
+    new_permissions_version()
+
+
+@receiver(post_save, sender=User)
+def clear_saved_user_permissions(sender, instance, update_fields, **kwargs):
+    # New users may reuse the id of a deleted user, and superusers have every permission.
+    if update_fields is None or 'is_superuser' in update_fields:
+        clear_permissions([instance.pk])
@@ -26,12 +26,13 @@ class LoginModalContextTestCase(TestCase):
 
     def test_login_modal_form_not_provided_for_authenticated_user(self):
         '''
-        The login modal form shouldn't be added to the context where a user is already logged in.
+        The login modal form and next path shouldn't be added to the context where a user is already logged in.
         '''
         self.client.login(username='TestContextUser', password='tH1$isA7357')
 
         response = self.client.get('/tickets/')
         self.assertFalse(response.context['login_form'])
+        self.assertFalse(response.context.get('login_next'))
 
     def test_login_modal_form_not_provided_on_login_page(self):
         '''
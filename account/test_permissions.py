@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import cache
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+class CachedPermissionsBackendTestCase(TestCase):
+    '''
+    Tests for the cached permissions backend, with a cache shared between processes as CACHE_DIR gives.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com', password='tH1$isA7357')
+        cls.group = Group.objects.create(name='Admins')
+        cls.update_status = Permission.objects.get(codename='can_update_status')
+        cls.edit_comments = Permission.objects.get(codename='can_edit_all_comments')
+        cls.test_user.user_permissions.add(cls.update_status)
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_user(self):
+        return User.objects.get(pk=self.test_user.pk)
+
+    def test_permissions_loaded_once(self):
+        '''
+        A user's permissions should be loaded from the database once, and read from the cache after that.
+        '''
+        user = self.get_user()
+        with self.assertNumQueries(2):
+            self.assertTrue(user.has_perm('tickets.can_update_status'))
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('tickets.can_update_status'))
+            self.assertFalse(user.has_perm('tickets.can_edit_all_comments'))
+            self.assertEqual({'tickets.can_update_status'}, user.get_all_permissions())
+
+    def test_permissions_loaded_on_login(self):
+        '''
+        A user's permissions should be cached as they log in.
+        '''
+        self.client.login(username='TestUser', password='tH1$isA7357')
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('tickets.can_update_status'))
+
+    def test_user_permission_changes_clear_cache(self):
+        '''
+        Adding or removing a user's permissions, from either side, should clear their cached permissions.
+        '''
+        self.get_user().has_perm('tickets.can_update_status')
+        self.test_user.user_permissions.add(self.edit_comments)
+        self.assertTrue(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        self.update_status.user_set.remove(self.test_user)
+        self.assertFalse(self.get_user().has_perm('tickets.can_update_status'))
+        self.edit_comments.user_set.clear()
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+
+    def test_group_changes_clear_cache(self):
+        '''
+        Adding a user to a group, or permissions to their group, should clear their cached permissions.
+        '''
+        self.group.permissions.add(self.edit_comments)
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        self.test_user.groups.add(self.group)
+        self.assertTrue(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        self.group.permissions.remove(self.edit_comments)
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        self.group.permissions.add(self.edit_comments)
+        self.group.delete()
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+
+    def test_superuser_change_clears_cache(self):
+        '''
+        Making a user a superuser should clear their cached permissions, as superusers have every permission.
+        '''
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        user = self.get_user()
+        user.is_superuser = True
+        user.save(update_fields=['is_superuser'])
+        self.assertEqual(Permission.objects.count(), len(self.get_user().get_all_permissions()))
+
+    def test_inactive_and_anonymous_users_have_no_permissions(self):
+        '''
+        Inactive and anonymous users shouldn't have any permissions, without caching them.
+        '''
+        user = self.get_user()
+        user.is_active = False
+        with self.assertNumQueries(0):
+            self.assertEqual(set(), user.get_all_permissions())
+        self.client.logout()
+        response = self.client.get('/tickets/')
+        self.assertFalse(response.context['perms']['tickets']['can_update_status'])
+
+    def test_cleared_permissions_reach_other_processes(self):
+        '''
+        Clearing a user's cached permissions in another process sharing the cache should clear them for this one.
+        '''
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+        # Added without sending m2m_changed, so only the other process clears the cached permissions.
+        User.user_permissions.through.objects.create(user=self.test_user, permission=self.edit_comments)
+        self.assertFalse(self.get_user().has_perm('tickets.can_edit_all_comments'))
+
+        subprocess.run([sys.executable, '-c', 'import django; django.setup(); from account.permissions import '
+                        'clear_permissions; clear_permissions([{}])'.format(self.test_user.pk)],
+                       cwd=settings.BASE_DIR, check=True,
+                       env=dict(os.environ, DJANGO_SETTINGS_MODULE='issue_tracker.settings', CACHE_DIR=self.cache_dir,
+                                SECRET_KEY=settings.SECRET_KEY))
+        self.assertTrue(self.get_user().has_perm('tickets.can_edit_all_comments'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_permissions_not_cached_in_local_memory(self):
+        '''
+        With a cache in each process's memory, which other processes can't clear, permissions should be loaded from the
+        database for each user, as ModelBackend does.
+        '''
+        self.get_user().has_perm('tickets.can_update_status')
+        User.user_permissions.through.objects.create(user=self.test_user, permission=self.edit_comments)
+        user = self.get_user()
+        with self.assertNumQueries(2):
+            self.assertTrue(user.has_perm('tickets.can_edit_all_comments'))
+            self.assertTrue(user.has_perm('tickets.can_update_status'))
@@ -0,0 +1,275 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from io import StringIO
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, DateField, DateTimeField
+from django.utils import timezone
+from itertools import accumulate
+import random
+from tickets.models import Ticket, Label, Comment, Vote, Pageview
+from tickets import search
+from credits.models import Wallet, Credit, Debit
+from stats.models import DailyTotal
+from stats import rollups
+
+# Synthetic dataset for benchmarks and local testing at scale. Rows are generated a ticket at a time as dictionaries
+# with explicit ids, so they can refer to each other, and streamed to the database in batches with multi-row inserts,
+# or COPY on PostgreSQL. Engagement counters and daily totals are worked out as the rows are generated, and the search
+# index is rebuilt afterwards, so the data is as the signals would have left it.
+
+# Rows per unit of scale.
+USERS = 100
+LABELS = 20
+TICKETS = 1000
+COMMENTS_PER_TICKET = 4
+VOTES_PER_TICKET = 3
+VIEWS_PER_TICKET = 30
+DAYS = 180
+COST_PER_CREDIT = 60
+
+WORDS = ('login page error crash slow search ticket comment vote feature request dashboard chart export import '
+         'email notification mobile layout button form label filter roadmap payment wallet credit admin user '
+         'profile image upload timeout broken missing add improve support').split()
+
+MODELS = (User, Label, Ticket, Ticket.labels.through, Comment, Debit, Vote, Pageview, Wallet, Credit, DailyTotal)
+
+
+class Table(object):
+    '''
+    A model's columns, and the values to write for them from a row dictionary, filling in the fields' defaults.
+    '''
+    def __init__(self, model):
+        self.name = model._meta.db_table
+        self.fields = model._meta.concrete_fields
+        self.defaults = [None if field.primary_key else field.get_default() for field in self.fields]
+        self.adapters = [connection.ops.adapt_datetimefield_value if isinstance(field, DateTimeField) else
+                         connection.ops.adapt_datefield_value if isinstance(field, DateField) else None
+                         for field in self.fields]
+
+    def values(self, row):
+        values = []
+        for field, default, adapt in zip(self.fields, self.defaults, self.adapters):
+            value = row.get(field.attname, default)
+            values.append(adapt(value) if adapt and value is not None else value)
+        return values
+
+
+class InsertWriter(object):
+    '''
+    Writes rows with a prepared insert, executed for each of them.
+    '''
+    def write(self, table, rows):
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(table.name), ', '.join(connection.ops.quote_name(field.column) for field in table.fields),
+            ', '.join(['%s'] * len(table.fields)))
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [table.values(row) for row in rows])
+
+
+class CopyWriter(object):
+    '''
+    Writes rows with PostgreSQL's COPY, streaming them in its text format.
+    '''
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    def write(self, table, rows):
+        data = StringIO()
+        for row in rows:
+            data.write('\t'.join(self.format_value(value) for value in table.values(row)) + '\n')
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(
+                connection.ops.quote_name(table.name), ', '.join(connection.ops.quote_name(field.column) for field in table.fields)),
+                data)
+
+
+class Dataset(object):
+    '''
+    Generates a dataset of users with wallets and credits, labels, and tickets with comments, votes and pageviews.
+    The same scale and seed always generate the same data.
+    '''
+    def __init__(self, scale=1, seed=0, days=DAYS):
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.days = days
+        self.now = timezone.now()
+        self.next_ids = {model: 1 for model in MODELS}
+        self.site_totals = Counter()
+
+    def count(self, per_scale):
+        return max(int(per_scale * self.scale), 1)
+
+    def row(self, model, **fields):
+        fields['id'] = self.next_ids[model]
+        self.next_ids[model] += 1
+        return model, fields
+
+    def sentence(self, words):
+        return ' '.join(self.random.choice(WORDS) for n in range(words)).capitalize()
+
+    def date_after(self, start):
+        '''
+        Returns a random time between start and now, weighted towards start.
+        '''
+        return start + (self.now - start) * self.random.random() ** 2
+
+    def generate(self):
+        '''
+        Yields (model, row) for each row of the dataset, a ticket at a time along with its labels, comments, votes,
+        pageviews and daily totals. The site wide daily totals are added up in site_totals, by (metric, day).
+        '''
+        password = make_password('benchmark')
+        user_ids = []
+        wallets = {}
+        for n in range(self.count(USERS)):
+            model, user = self.row(User, password=password, date_joined=self.now - timedelta(days=self.days))
+            user.update(username='user{}'.format(user['id']), email='user{}@example.com'.format(user['id']))
+            user_ids.append(user['id'])
+            # Wallets are written once their balances are known, after the votes spending from them.
+            wallets[user['id']] = self.row(Wallet, user_id=user['id'], balance=0)
+            yield model, user
+        # Some users are much more active than others.
+        activity = list(accumulate(self.random.paretovariate(1.2) for user_id in user_ids))
+        spent = Counter()
+
+        def active_user():
+            return self.random.choices(user_ids, cum_weights=activity)[0]
+
+        label_ids = []
+        for n in range(self.count(LABELS)):
+            model, label = self.row(Label)
+            label['name'] = '{} {}'.format(self.random.choice(WORDS), label['id'])
+            label_ids.append(label['id'])
+            yield model, label
+        # A few labels are used on most tickets, and the rest much less.
+        label_use = list(accumulate(self.random.paretovariate(1) for label_id in label_ids))
+
+        for n in range(self.count(TICKETS)):
+            created = self.now - timedelta(days=self.days) * self.random.random()
+            ticket_model, ticket = self.row(Ticket, user_id=active_user(), created=created,
+                                            ticket_type=self.random.choices(('Bug', 'Feature'), (60, 40))[0],
+                                            title=self.sentence(self.random.randint(3, 8)),
+                                            content=self.sentence(self.random.randint(10, 60)),
+                                            view_count=0, vote_total=0, comment_count=0)
+            ticket_totals = Counter()
+            ticket_totals[rollups.TICKET_TYPE_METRICS[ticket['ticket_type']], timezone.localdate(created)] += 1
+            # Statuses are set in order, each after the last, as set_status does.
+            statuses = [status for status, name in Ticket.STATUS_CHOICES]
+            status = ticket['status'] = self.random.choices(statuses, (15, 45, 20, 20))[0]
+            previous = created
+            for field in Ticket.STATUS_FIELDS[:statuses.index(status)]:
+                previous = ticket[field] = self.date_after(previous)
+
+            for label_id in sorted(set(self.random.choices(label_ids, cum_weights=label_use, k=self.random.randint(0, 5)))):
+                yield self.row(Ticket.labels.through, ticket_id=ticket['id'], label_id=label_id)
+
+            if status != 'awaiting approval':
+                # Popular tickets get more comments, votes and views.
+                popularity = self.random.paretovariate(1.5) / 3
+
+                comments = []
+                for c in range(int(self.random.expovariate(1) * COMMENTS_PER_TICKET * popularity)):
+                    reply_to = self.random.choice(comments) if comments and self.random.random() < 0.3 else None
+                    model, comment = self.row(Comment, ticket_id=ticket['id'], user_id=active_user(),
+                                              reply_to_id=reply_to['id'] if reply_to else None,
+                                              content=self.sentence(self.random.randint(5, 30)),
+                                              created=self.date_after(reply_to['created'] if reply_to else ticket['approved']))
+                    if reply_to is None:
+                        comments.append(comment)
+                    ticket['comment_count'] += 1
+                    ticket_totals['comments', timezone.localdate(comment['created'])] += 1
+                    yield model, comment
+
+                voters = set(active_user() for v in range(int(self.random.expovariate(1) * VOTES_PER_TICKET * popularity)))
+                for voter in sorted(voters):
+                    voted = self.date_after(ticket['approved'])
+                    count = 1
+                    debit = None
+                    if ticket['ticket_type'] == 'Feature':
+                        count = self.random.randint(1, 10)
+                        model, debit = self.row(Debit, wallet_id=wallets[voter][1]['id'], amount=count, real_value=0, created=voted)
+                        spent[voter] += count
+                        yield model, debit
+                    yield self.row(Vote, user_id=voter, ticket_id=ticket['id'], count=count, created=voted,
+                                   transaction_id=debit['id'] if debit else None)
+                    ticket['vote_total'] += count
+                    ticket_totals['votes', timezone.localdate(voted)] += count
+
+                for v in range(int(VIEWS_PER_TICKET * popularity)):
+                    model, pageview = self.row(Pageview, ticket_id=ticket['id'], created=self.date_after(ticket['approved']))
+                    ticket['view_count'] += 1
+                    ticket_totals['views', timezone.localdate(pageview['created'])] += 1
+                    yield model, pageview
+            yield ticket_model, ticket
+
+            for (metric, day), total in sorted(ticket_totals.items()):
+                self.site_totals[metric, day] += total
+                if metric not in rollups.TICKET_TYPE_METRICS.values():
+                    yield self.row(DailyTotal, metric=metric, ticket_id=ticket['id'], date=day, total=total)
+
+        # Users are credited enough for the votes they've made, and some to spare, without going through Stripe.
+        for user_id in user_ids:
+            amount = spent[user_id] + self.random.randint(0, 50)
+            wallets[user_id][1]['balance'] = amount - spent[user_id]
+            yield wallets[user_id]
+            if amount:
+                model, credit = self.row(Credit, wallet_id=wallets[user_id][1]['id'], amount=amount,
+                                         real_value=amount * COST_PER_CREDIT, refunded=False,
+                                         created=self.now - timedelta(days=self.days) * self.random.random())
+                self.site_totals['sales', timezone.localdate(credit['created'])] += credit['real_value']
+                yield model, credit
+
+    def save(self, batch_size=5000, progress=None):
+        '''
+        Writes the dataset to the database after any existing rows, and returns the number of rows written for each model.
+        progress is called with the number of rows written so far after each batch.
+        '''
+        writer = CopyWriter() if connection.vendor == 'postgresql' else InsertWriter()
+        tables = {model: Table(model) for model in MODELS}
+        batches = {model: [] for model in MODELS}
+        counts = Counter()
+
+        def flush(model):
+            if batches[model]:
+                writer.write(tables[model], batches[model])
+                counts[model] += len(batches[model])
+                batches[model] = []
+                if progress:
+                    progress(sum(counts.values()))
+
+        with transaction.atomic():
+            self.next_ids = {model: (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1 for model in MODELS}
+            for model, row in self.generate():
+                batches[model].append(row)
+                if len(batches[model]) >= batch_size:
+                    flush(model)
+            for model in MODELS:
+                flush(model)
+
+            # Rows were given explicit ids, so the sequences need moving on past them.
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), list(MODELS)):
+                    cursor.execute(sql)
+            # Site wide totals are added to, as there may already be totals for the days.
+            for (metric, day), total in sorted(self.site_totals.items()):
+                rollups.add(metric, day, total)
+            search.rebuild()
+        return {model._meta.label: counts[model] for model in MODELS}
+
+
+def seed(scale=1, seed=0, **kwargs):
+    '''
+    Generates and saves a dataset, returning the number of rows written for each model.
+    '''
+    return Dataset(scale, seed).save(**kwargs)
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_databases, teardown_databases, override_settings
+import json
+from tickets.models import Ticket
+from tickets.pageviews import pageview_recorder
+from benchmarks import dataset, runner
+
+
+class Command(BaseCommand):
+    '''
+    Benchmarks the site's busiest pages against a synthetic dataset, in a test database created for the run.
+    '''
+    help = ('Seeds a test database with a synthetic dataset, and reports the latency percentiles, queries and throughput '
+            'of requests to the busiest pages. Results can be saved as a baseline, and compared with one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help='Size of the dataset, 1 being {} tickets and {} users.'.format(dataset.TICKETS, dataset.USERS))
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset.')
+        parser.add_argument('--requests', type=int, default=50, help='Number of requests to make in each scenario.')
+        parser.add_argument('--driver', choices=sorted(runner.DRIVERS), default='client',
+                            help='Make requests through the Django test client, or to a local WSGI server over HTTP.')
+        parser.add_argument('--scenario', dest='scenarios', action='append', choices=[s.name for s in runner.SCENARIOS],
+                            help='Scenario to run, may be given more than once. Defaults to all of them.')
+        parser.add_argument('--anonymous', action='store_true', help='Make requests without logging in.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database and its dataset for the next run, rather than destroying it.')
+        parser.add_argument('--save', metavar='PATH', help='Save the results as a baseline to a json file.')
+        parser.add_argument('--compare', metavar='PATH', help='Compare the results with a baseline saved earlier.')
+        parser.add_argument('--tolerance', type=float, default=10,
+                            help='Percentage latencies and throughput can change by before counting as a regression.')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1']):
+                results = self.benchmark(options)
+        finally:
+            # Buffered pageviews are written while the test database is still there.
+            pageview_recorder.flush()
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        if options['save']:
+            with open(options['save'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write('Saved baseline to {}.'.format(options['save']))
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def benchmark(self, options):
+        if not Ticket.objects.exists():
+            counts = dataset.seed(options['scale'], options['seed'])
+            self.stdout.write('Seeded {} database with {}.'.format(
+                connection.vendor, ', '.join('{} {}'.format(count, label) for label, count in sorted(counts.items()))))
+        cache.clear()
+
+        session_key = None
+        if not options['anonymous']:
+            client = Client()
+            client.force_login(User.objects.order_by('id').first())
+            session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        scenarios = [scenario for scenario in runner.SCENARIOS if scenario.name in (options['scenarios'] or [scenario.name])]
+        driver = runner.DRIVERS[options['driver']](session_key)
+        try:
+            results = runner.run(driver, scenarios, options['requests'])
+        finally:
+            driver.close()
+
+        self.stdout.write('{:<24} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            'scenario', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'sql ms', 'req/s'))
+        for name, result in results.items():
+            self.stdout.write('{:<24} {errors:>8} {p50_ms:>8} {p90_ms:>8} {p99_ms:>8} {queries:>8} {sql_ms:>8} '
+                              '{requests_per_second:>8}'.format(name, **result))
+
+        return {'scale': options['scale'], 'seed': options['seed'], 'driver': options['driver'],
+                'database': connection.vendor, 'anonymous': options['anonymous'], 'results': results}
+
+    def compare(self, results, path, tolerance):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        for setting in ('scale', 'seed', 'driver', 'database', 'anonymous'):
+            if baseline.get(setting) != results[setting]:
+                self.stderr.write('Baseline {} was {}, not {}, results may not be comparable.'.format(
+                    setting, baseline.get(setting), results[setting]))
+
+        self.stdout.write('\n{:<24} {:<20} {:>10} {:>10} {:>8}'.format('scenario', 'measure', 'baseline', 'now', 'change'))
+        regressions = 0
+        for name, measure, was, now, regressed in runner.compare(results['results'], baseline['results'], tolerance):
+            change = '{:+.0f}%'.format((now - was) / was * 100) if was else ''
+            self.stdout.write('{:<24} {:<20} {:>10} {:>10} {:>8}{}'.format(
+                name, measure, was, now, change, '  REGRESSED' if regressed else ''))
+            regressions += regressed
+
+        if regressions:
+            raise CommandError('{} measures regressed against the baseline.'.format(regressions))
+        self.stdout.write('No regressions against the baseline.')
@@ -0,0 +1,112 @@
+from copy import deepcopy
+from django.conf import settings
+from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases, override_settings
+from django.utils import timezone
+from tickets.models import Ticket, Comment
+from tickets.pageviews import pageview_recorder
+from stats.request_metrics import request_metrics, percentile
+from benchmarks import runner
+
+# Every third comment is a reply to the comment before it.
+REPLY_EVERY = 3
+# The loaders Django uses by default with APP_DIRS, which it wraps in the cached loader unless DEBUG is set.
+FILE_LOADERS = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+
+
+def template_settings(cached):
+    '''
+    Returns the TEMPLATES setting with the templates cached by the cached loader, or read from their files for every
+    render, whatever the setting is now.
+    '''
+    templates = deepcopy(settings.TEMPLATES)
+    for template in templates:
+        if template['BACKEND'] == 'django.template.backends.django.DjangoTemplates':
+            template['APP_DIRS'] = False
+            template['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', FILE_LOADERS)] if cached \
+                else FILE_LOADERS
+    return templates
+
+
+class Command(BaseCommand):
+    '''
+    Benchmarks rendering the ticket page's template for tickets with increasing numbers of comments.
+    '''
+    help = ('Renders the ticket page for tickets with increasing numbers of comments, in a test database created for the '
+            'run, reporting the template render time with and without the cached template loader.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, nargs='+', default=[0, 50, 500],
+                            help='Numbers of comments, including replies, on the tickets to render.')
+        parser.add_argument('--requests', type=int, default=50, help='Number of requests to make for each ticket.')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Make requests without logging in, rather than as an admin who can edit every comment.')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self.benchmark(options)
+        finally:
+            # Buffered pageviews are written while the test database is still there.
+            pageview_recorder.flush()
+            teardown_databases(old_config, verbosity=0)
+
+    def benchmark(self, options):
+        user = User.objects.create_user(username='benchmark', email='benchmark@example.com', password='benchmark')
+        user.user_permissions.set(Permission.objects.all())
+        session_key = None
+        if not options['anonymous']:
+            driver = runner.ClientDriver()
+            driver.client.force_login(user)
+            session_key = driver.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        self.stdout.write('{:>8} {:>10} {:>12} {:>12} {:>10} {:>8}'.format(
+            'comments', 'templates', 'render p50', 'render p90', 'wall p50', 'queries'))
+        for count in options['comments']:
+            ticket = self.create_ticket(user, count)
+            for cached in (False, True):
+                with override_settings(TEMPLATES=template_settings(cached)):
+                    cache.clear()
+                    result = self.render(ticket, session_key, options['requests'])
+                self.stdout.write('{:>8} {:>10} {:>12.2f} {:>12.2f} {:>10.2f} {:>8}'.format(
+                    count, 'cached' if cached else 'uncached', *result))
+
+    def create_ticket(self, user, count):
+        '''
+        Creates an approved feature request with count comments and replies.
+        '''
+        now = timezone.now()
+        ticket = Ticket.objects.create(user=user, ticket_type='Feature', title='{} comments'.format(count),
+                                       content='Benchmark ticket', approved=now)
+        comments = []
+        for n in range(count):
+            reply_to = comments[-1] if n % REPLY_EVERY == REPLY_EVERY - 1 else None
+            comment = Comment(ticket=ticket, user=user, content='Comment {}\n\nWith two paragraphs.'.format(n))
+            if reply_to is None:
+                comment.save()
+                comments.append(comment)
+            else:
+                comment.reply_to = reply_to
+                comment.save()
+        return ticket
+
+    def render(self, ticket, session_key, requests):
+        '''
+        Requests the ticket's page, returning the median and 90th percentile template render ms, the median request ms
+        and the queries per request.
+        '''
+        driver = runner.ClientDriver(session_key)
+        path = ticket.get_absolute_url()
+        # The first request compiles the templates, if they are cached.
+        driver.get(path)
+        request_metrics.reset()
+        for n in range(requests):
+            driver.get(path)
+        samples = request_metrics.samples('ticket')
+        template_ms = sorted(sample['template_ms'] for sample in samples)
+        wall_ms = sorted(sample['wall_ms'] for sample in samples)
+        return (percentile(template_ms, 50), percentile(template_ms, 90), percentile(wall_ms, 50),
+                sum(sample['queries'] for sample in samples) // len(samples))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+import time
+from benchmarks import dataset
+
+
+class Command(BaseCommand):
+    '''
+    Adds a synthetic dataset to the database, for testing the site locally at production scale.
+    '''
+    help = ('Generates users with wallets and credits, labels, and tickets with comments, votes and pageviews, '
+            'adding them to the database after any existing data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help='Size of the dataset, 1 being {} tickets, {} users and about {} pageviews.'.format(
+                                dataset.TICKETS, dataset.USERS, int(dataset.TICKETS * 0.85 * dataset.VIEWS_PER_TICKET)))
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset.')
+        parser.add_argument('--days', type=int, default=dataset.DAYS, help='Number of days of history to generate.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of rows of each table to write at once.')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+
+        def progress(rows):
+            if options['verbosity'] > 1:
+                self.stdout.write('{} rows written in {:.0f}s.'.format(rows, time.monotonic() - start))
+
+        counts = dataset.Dataset(options['scale'], options['seed'], options['days']).save(options['batch_size'], progress)
+        for label, count in sorted(counts.items()):
+            self.stdout.write('{:>10} {}'.format(count, label))
+        self.stdout.write('Generated {} rows in the {} database in {:.0f}s.'.format(
+            sum(counts.values()), connection.vendor, time.monotonic() - start))
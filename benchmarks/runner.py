@@ -0,0 +1,196 @@
+from http.cookies import SimpleCookie
+from socketserver import ThreadingMixIn
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.http import urlencode
+import threading
+import time
+from tickets.models import Ticket, Label
+from stats.request_metrics import request_metrics, percentile
+from stats.views import RoadmapView
+
+# Benchmarks of the site's busiest pages, requested through the Django test client or a local WSGI server.
+
+
+class ClientDriver(object):
+    '''
+    Requests pages in process through the Django test client.
+    '''
+    name = 'client'
+
+    def __init__(self, session_key=None):
+        self.client = Client()
+        if session_key:
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+    def get(self, path, headers=None):
+        extra = {'CONTENT_TYPE': headers['Content-Type']} if headers and 'Content-Type' in headers else {}
+        return self.client.get(path, **extra).status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class ServerDriver(object):
+    '''
+    Requests pages over HTTP from the site served by a WSGI server on a local port, in a thread of this process.
+    '''
+    name = 'server'
+
+    def __init__(self, session_key=None):
+        self.server = make_server('127.0.0.1', 0, WSGIHandler(), ThreadingWSGIServer, QuietRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.cookies = SimpleCookie()
+        if session_key:
+            self.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+    def get(self, path, headers=None):
+        request = Request(self.url + path, headers=dict(headers or {}))
+        if self.cookies:
+            request.add_header('Cookie', '; '.join('{}={}'.format(key, morsel.value) for key, morsel in self.cookies.items()))
+        try:
+            with urlopen(request) as response:
+                response.read()
+                self.cookies.load(', '.join(response.headers.get_all('Set-Cookie', [])))
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+DRIVERS = {driver.name: driver for driver in (ClientDriver, ServerDriver)}
+
+
+class Scenario(object):
+    '''
+    A page to benchmark, and the name of its URL the request metrics are recorded under.
+    paths is a function returning a list of paths to request in turn.
+    '''
+    def __init__(self, name, url_name, paths, headers=None):
+        self.name = name
+        self.url_name = url_name
+        self.paths = paths
+        self.headers = headers
+
+
+def ticket_paths():
+    return [reverse('ticket', kwargs={'pk': pk})
+            for pk in Ticket.objects.exclude(status='awaiting approval').order_by('-view_count').values_list('id', flat=True)[:50]]
+
+
+def roadmap_feed_paths():
+    '''
+    Returns the paths of the first three pages of the roadmap feed, following its cursors.
+    '''
+    paths = [reverse('roadmap')]
+    tickets, cursor = RoadmapView().get_tickets()
+    while cursor is not None and len(paths) < 3:
+        paths.append(reverse('roadmap') + '?' + urlencode({'cursor': cursor}))
+        tickets, cursor = RoadmapView().get_tickets(cursor)
+    return paths
+
+
+def labels_paths(count):
+    '''
+    Returns a function returning the path of the tickets list filtered by the most used labels.
+    '''
+    def paths():
+        labels = Label.objects.annotate(tickets=Count('ticket')).order_by('-tickets', 'id').values_list('id', flat=True)[:count]
+        return [reverse('tickets-list') + '?' + urlencode([('labels', label) for label in labels])]
+    return paths
+
+
+SCENARIOS = [
+    Scenario('index', 'index', lambda: [reverse('index')]),
+    Scenario('tickets-list', 'tickets-list', lambda: [reverse('tickets-list')]),
+    Scenario('tickets-list-filtered', 'tickets-list',
+             lambda: [reverse('tickets-list') + '?ticket_type=Feature&status=doing&order_by=-vote_count']),
+    Scenario('tickets-list-deep-page', 'tickets-list', lambda: [reverse('tickets-list') + '?page=last']),
+] + [
+    Scenario('tickets-list-{}-labels'.format(count), 'tickets-list', labels_paths(count)) for count in range(1, 11)
+] + [
+    Scenario('ticket', 'ticket', ticket_paths),
+    Scenario('roadmap', 'roadmap', lambda: [reverse('roadmap')]),
+    Scenario('roadmap-feed', 'roadmap', roadmap_feed_paths, headers={'Content-Type': 'application/json'}),
+]
+
+
+def run_scenario(driver, scenario, requests, warmup=2):
+    '''
+    Requests a scenario's pages, returning the latency percentiles, mean queries per request, and throughput.
+    '''
+    paths = scenario.paths()
+    for n in range(warmup):
+        driver.get(paths[n % len(paths)], scenario.headers)
+
+    request_metrics.reset()
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for n in range(requests):
+        request_start = time.perf_counter()
+        if driver.get(paths[n % len(paths)], scenario.headers) >= 400:
+            errors += 1
+        latencies.append((time.perf_counter() - request_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    samples = request_metrics.samples(scenario.url_name)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p90_ms': round(percentile(latencies, 90), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': round(sum(sample['queries'] for sample in samples) / max(len(samples), 1), 1),
+        'sql_ms': round(sum(sample['sql_ms'] for sample in samples) / max(len(samples), 1), 2),
+        'requests_per_second': round(requests / elapsed, 1),
+    }
+
+
+def run(driver, scenarios, requests):
+    '''
+    Runs each scenario with the driver, returning a dictionary of their results by name.
+    '''
+    return {scenario.name: run_scenario(driver, scenario, requests) for scenario in scenarios}
+
+
+def compare(results, baseline, tolerance=10):
+    '''
+    Compares results with a baseline's, returning a list of (scenario, measure, baseline value, value, regressed) for each
+    measure of the scenarios in both. Latencies more than tolerance percent slower, throughputs more than tolerance
+    percent lower, and any more queries count as regressions.
+    '''
+    comparisons = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for measure in ('p50_ms', 'p90_ms', 'p99_ms', 'queries', 'requests_per_second'):
+            was, now = baseline[name][measure], result[measure]
+            if measure == 'queries':
+                regressed = now > was
+            elif measure == 'requests_per_second':
+                regressed = now < was * (1 - tolerance / 100)
+            else:
+                regressed = now > was * (1 + tolerance / 100)
+            comparisons.append((name, measure, was, now, regressed))
+    return comparisons
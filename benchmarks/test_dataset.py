@@ -0,0 +1,95 @@
+from django.test import TestCase, modify_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum, F
+from django.utils.six import StringIO
+from tickets.models import Ticket, Comment, Vote
+from tickets.search import search_tickets
+from credits.models import Wallet
+from stats.models import DailyTotal
+from stats import rollups
+from benchmarks.dataset import Dataset, seed
+
+
+# The app is only installed with DEBUG or BENCHMARKS set, so it's installed for its tests.
+@modify_settings(INSTALLED_APPS={'append': 'benchmarks'})
+class DatasetTestCase(TestCase):
+    '''
+    Class to test the synthetic benchmark dataset is consistent, as if it had been created through the site.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = seed(scale=0.05, seed=1)
+
+    def get_daily_totals(self):
+        return set(DailyTotal.objects.values_list('metric', 'ticket', 'date').annotate(Sum('total')))
+
+    def test_rows_written(self):
+        '''
+        Seeding should write the rows generated for each model, scaled down from the full dataset.
+        '''
+        self.assertEqual(50, self.counts['tickets.Ticket'])
+        self.assertEqual(5, self.counts['auth.User'])
+        self.assertEqual(self.counts['tickets.Comment'], Comment.objects.count())
+        self.assertEqual(self.counts['tickets.Vote'], Vote.objects.count())
+
+    def test_same_seed_generates_same_data(self):
+        '''
+        Datasets generated with the same scale and seed should be the same.
+        '''
+        first, second = list(Dataset(0.05, 2).generate()), list(Dataset(0.05, 2).generate())
+
+        self.assertEqual([(model, row['id'], row.get('title')) for model, row in first],
+                         [(model, row['id'], row.get('title')) for model, row in second])
+
+    def test_counters_and_totals_match_source_rows(self):
+        '''
+        Ticket counters should need no rebuilding, and the daily totals and search index should be built.
+        '''
+        out = StringIO()
+        call_command('rebuild_ticket_counters', stdout=out)
+        self.assertIn('Rebuilt counters for 0 tickets.', out.getvalue())
+
+        generated_totals = self.get_daily_totals()
+        rollups.rebuild()
+        self.assertEqual(self.get_daily_totals(), generated_totals)
+
+        ticket = Ticket.objects.first()
+        self.assertIn(ticket, search_tickets(Ticket.objects.all(), ticket.title))
+
+    def test_statuses_set_in_order(self):
+        '''
+        Each status should be set after the one before it, and only on tickets that have reached it.
+        '''
+        self.assertFalse(Ticket.objects.filter(approved=None).exclude(doing=None).exists())
+        self.assertFalse(Ticket.objects.filter(approved__lt=F('created')).exists())
+        self.assertFalse(Ticket.objects.filter(doing__lt=F('approved')).exists())
+        self.assertFalse(Ticket.objects.filter(done__lt=F('doing')).exists())
+
+    def test_statuses_stored(self):
+        '''
+        Each ticket's stored status should be the one its status dates give.
+        '''
+        for ticket in Ticket.objects.all():
+            self.assertEqual(ticket.get_status_from_dates(), ticket.status)
+
+    def test_added_after_existing_data(self):
+        '''
+        A second dataset should be added after the first, adding to the site wide daily totals.
+        '''
+        seed(scale=0.05, seed=2)
+
+        self.assertEqual(100, Ticket.objects.count())
+        self.assertEqual(10, User.objects.count())
+        self.assertEqual(100, DailyTotal.objects.filter(metric__in=('bugs', 'features')).aggregate(Sum('total'))['total__sum'])
+        Ticket.objects.create(user=User.objects.first(), title='Test ticket', content='Test content')
+
+    def test_wallet_balances_match_transactions(self):
+        '''
+        Each wallet's balance should be its credits less the debits for its votes.
+        '''
+        for wallet in Wallet.objects.all():
+            credits = wallet.credit_set.aggregate(Sum('amount'))['amount__sum'] or 0
+            debits = wallet.debit_set.aggregate(Sum('amount'))['amount__sum'] or 0
+            self.assertEqual(credits - debits, wallet.balance)
+            self.assertGreaterEqual(wallet.balance, 0)
@@ -0,0 +1,45 @@
+from django.test import TestCase, modify_settings
+from django.core.management import get_commands
+from benchmarks.dataset import seed
+from benchmarks.runner import ClientDriver, SCENARIOS, run, compare
+
+
+# The app is only installed with DEBUG or BENCHMARKS set, so it's installed for its tests.
+@modify_settings(INSTALLED_APPS={'append': 'benchmarks'})
+class RunnerTestCase(TestCase):
+    '''
+    Class to test benchmark scenarios run, and their results are compared with baselines.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        seed(scale=0.02)
+
+    def test_commands_installed_with_app(self):
+        '''
+        The benchmark commands should be available while the app is installed.
+        '''
+        self.assertTrue({'benchmark', 'benchmark_templates', 'generate_data'} <= set(get_commands()))
+
+    def test_scenarios_run(self):
+        '''
+        Each scenario should make its requests without errors, recording latencies, queries and throughput.
+        '''
+        results = run(ClientDriver(), SCENARIOS, requests=2)
+
+        self.assertEqual(set(scenario.name for scenario in SCENARIOS), set(results))
+        for name, result in results.items():
+            self.assertEqual(0, result['errors'], name)
+            self.assertGreater(result['requests_per_second'], 0)
+        self.assertGreater(results['ticket']['queries'], 0)
+
+    def test_compare_flags_regressions(self):
+        '''
+        Slower latencies and lower throughput beyond the tolerance, and any more queries, should count as regressions.
+        '''
+        baseline = {'ticket': {'p50_ms': 10, 'p90_ms': 20, 'p99_ms': 30, 'queries': 5, 'requests_per_second': 100}}
+        results = {'ticket': {'p50_ms': 10.5, 'p90_ms': 25, 'p99_ms': 20, 'queries': 6, 'requests_per_second': 80},
+                   'index': {'p50_ms': 1, 'p90_ms': 1, 'p99_ms': 1, 'queries': 1, 'requests_per_second': 1}}
+
+        regressed = [measure for name, measure, was, now, regressed in compare(results, baseline, tolerance=10) if regressed]
+
+        self.assertEqual(['p90_ms', 'queries', 'requests_per_second'], regressed)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from credits.models import Wallet, Credit, Debit
+from credits.models import Wallet, Credit, Debit, WebhookEvent
 
 # Register your models here.
 
@@ -20,4 +20,12 @@ class WalletAdmin(admin.ModelAdmin):
     inlines = (DebitAdmin, CreditAdmin)
 
 
+class WebhookEventAdmin(admin.ModelAdmin):
+    model = WebhookEvent
+    list_display = ('event_id', 'event_type', 'received', 'processed', 'attempts', 'error')
+    list_filter = ('event_type', 'processed')
+    readonly_fields = ('event_id', 'event_type', 'payload', 'received', 'processed', 'locked_until', 'attempts', 'error')
+
+
 admin.site.register(Wallet, WalletAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CreditsConfig(AppConfig):
     name = 'credits'
+
+    def ready(self):
+        import credits.signals  # noqa: F401
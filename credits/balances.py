@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+# Users' wallet balances, as shown on every page. They're cached per user, and the cache is cleared by Wallet.credit and
+# Wallet.debit whenever the balance changes, so in steady state pages don't query the user's permissions or wallet.
+
+WALLET_BALANCE_CACHE_KEY = 'credits:wallet_balance:{}'
+
+
+def get_wallet_balance(user):
+    '''
+    Returns a logged in user's wallet balance, 0 if they don't have a wallet yet, or None if they can't have one.
+    '''
+    key = WALLET_BALANCE_CACHE_KEY.format(user.id)
+    # Cached in a tuple, so a balance of None can be told apart from a missing one.
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    balance = None
+    if not user.has_perm('credits.cant_have_wallet'):
+        try:
+            balance = user.wallet.balance
+        except ObjectDoesNotExist:
+            balance = 0
+    cache.set(key, (balance,), settings.WALLET_BALANCE_CACHE_TIMEOUT)
+    return balance
+
+
+def clear_wallet_balance(user_id):
+    '''
+    Clears a user's cached wallet balance, so it's read from their wallet next time.
+    '''
+    cache.delete(WALLET_BALANCE_CACHE_KEY.format(user_id))
@@ -1,4 +1,4 @@
-from credits.models import Wallet
+from credits.balances import get_wallet_balance
 
 
 def wallet_contents(request):
@@ -6,9 +6,6 @@ def wallet_contents(request):
     Adds the user's wallet balance to the context if they're logged in.
     '''
     add_context = {}
-    if request.user.is_authenticated and not request.user.has_perm('credits.cant_have_wallet'):
-        try:
-            add_context['wallet_balance'] = request.user.wallet.balance
-        except Wallet.DoesNotExist:
-            add_context['wallet_balance'] = 0
+    if request.user.is_authenticated:
+        add_context['wallet_balance'] = get_wallet_balance(request.user)
     return add_context
@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from credits.models import PaymentIntent
+from credits.waiters import PaymentWaiter, payment_waiter
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    '''
+    Benchmarks how many requests waiting on payments a web worker can hold, and how they affect other pages.
+    By default requests are made over HTTP to a gunicorn worker started with the site's config and GUNICORN_THREADS
+    threads, against the configured database. --in-process benchmarks the waiters alone, in threads of this process.
+    '''
+    help = ('Holds increasing numbers of concurrent requests waiting on a payment in a gunicorn worker, reporting how '
+            'many it held, how quickly another page loaded meanwhile, and how quickly they were woken.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--waiters', type=int, nargs='+', default=[5, 20, 50],
+                            help='Numbers of concurrent waiters to benchmark.')
+        parser.add_argument('--hold', type=float, default=3,
+                            help='Seconds to hold the waiters for before completing the payment.')
+        parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 20)),
+                            help='Threads for the gunicorn worker, defaulting to GUNICORN_THREADS.')
+        parser.add_argument('--in-process', action='store_true',
+                            help='Hold bare waiters in threads of this process, rather than requests to gunicorn.')
+
+    def handle(self, *args, **options):
+        if options['in_process']:
+            self.stdout.write('{:>8} {:>10} {:>12} {:>10} {:>10} {:>10}'.format(
+                'waiters', 'start ms', 'KB/waiter', 'DB checks', 'wake p50', 'wake max'))
+            for count in options['waiters']:
+                self.stdout.write('{:>8} {:>10.1f} {:>12.1f} {:>10} {:>10.2f} {:>10.2f}'.format(
+                    count, *self.benchmark_in_process(count, options['hold'])))
+            return
+
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError('The gunicorn worker needs a database it can share, not an in-memory one.')
+        user, created = User.objects.get_or_create(username='benchmark_payment_waiters')
+        client = Client()
+        client.force_login(user)
+        server = GunicornServer(options['threads'], client.cookies[settings.SESSION_COOKIE_NAME].value)
+        try:
+            self.stdout.write('gunicorn worker with {} threads.'.format(options['threads']))
+            self.stdout.write('{:>8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+                'waiters', 'held', '202s', 'page p50', 'page max', 'wake p50', 'wake max'))
+            for count in options['waiters']:
+                self.stdout.write('{:>8} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                    count, *self.benchmark_gunicorn(server, user, count, options['hold'])))
+        finally:
+            server.close()
+            if created:
+                user.delete()
+            else:
+                PaymentIntent.objects.filter(user=user, intent_id__startswith='pi_benchmark').delete()
+
+    def benchmark_gunicorn(self, server, user, count, hold):
+        '''
+        Returns the number of requests held waiting and turned away with a 202, the median and max ms taken to load the
+        home page while they were held, and the median and max ms between completing the payment and their responses.
+        '''
+        intent = PaymentIntent.objects.create(user=user, intent_id='pi_benchmark{}'.format(count),
+                                              credits=1, amount=100)
+        path = reverse('check_intent', kwargs={'pk': intent.pk})
+        statuses = []
+        responded = []
+
+        def wait():
+            statuses.append(server.get(path))
+            responded.append(time.monotonic())
+
+        threads = [threading.Thread(target=wait) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + hold
+        page_times = []
+        # Give the waiters a moment to reach the worker before timing other pages.
+        time.sleep(min(hold, 0.5))
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            server.get(reverse('index'))
+            page_times.append((time.monotonic() - start) * 1000)
+
+        completed = time.monotonic()
+        with transaction.atomic():
+            PaymentIntent.objects.filter(pk=intent.pk).update(complete=True)
+            payment_waiter.notify(intent.pk)
+        for thread in threads:
+            thread.join()
+
+        wake_times = [(at - completed) * 1000 for at, status in zip(responded, statuses) if status == 200]
+        return (statuses.count(200), statuses.count(202), percentile(page_times, 50), max(page_times or [0]),
+                percentile(wake_times, 50), max(wake_times or [0]))
+
+    def benchmark_in_process(self, count, hold):
+        '''
+        Returns the time taken to start the waiters, their memory use, the DB checks they made while waiting,
+        and the median and max ms between waking each waiter and it returning.
+        '''
+        checks = []
+        waiter = PaymentWaiter(lambda intent_pks: checks.append(1) or [], max_waiters=count)
+        woken = {}
+
+        def wait(intent_pk):
+            waiter.wait(intent_pk, lambda: False, timeout=hold + 60)
+            woken[intent_pk] = time.monotonic()
+
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.monotonic()
+        threads = [threading.Thread(target=wait, args=(intent_pk,)) for intent_pk in range(count)]
+        for thread in threads:
+            thread.start()
+        while waiter.waiting < count:
+            time.sleep(0.001)
+        started = time.monotonic() - start
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory
+
+        time.sleep(hold)
+        checks_while_waiting = len(checks)
+        wake_times = {}
+        for intent_pk in range(count):
+            wake_times[intent_pk] = time.monotonic()
+            waiter.wake(intent_pk)
+        for thread in threads:
+            thread.join()
+
+        latencies = [(woken[intent_pk] - wake_times[intent_pk]) * 1000 for intent_pk in range(count)]
+        return started * 1000, memory / count, checks_while_waiting, percentile(latencies, 50), max(latencies)
+
+
+class GunicornServer(object):
+    '''
+    A gunicorn worker serving the site on a local port, started with the site's gunicorn config.
+    '''
+    def __init__(self, threads, session_key):
+        with socket.socket() as free_socket:
+            free_socket.bind(('127.0.0.1', 0))
+            port = free_socket.getsockname()[1]
+        self.url = 'http://127.0.0.1:{}'.format(port)
+        self.headers = {'Host': settings.ALLOWED_HOSTS[0],
+                        'Cookie': '{}={}'.format(settings.SESSION_COOKIE_NAME, session_key)}
+        self.process = subprocess.Popen(
+            [os.path.join(os.path.dirname(sys.executable), 'gunicorn'), '-c', 'gunicorn.conf.py', '--workers', '1',
+             '--bind', '127.0.0.1:{}'.format(port), '--log-level', 'warning', 'issue_tracker.wsgi:application'],
+            cwd=settings.BASE_DIR, env=dict(os.environ, GUNICORN_THREADS=str(threads)))
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise CommandError('gunicorn failed to start.')
+                time.sleep(0.1)
+
+    def get(self, path):
+        try:
+            with urlopen(Request(self.url + path, headers=self.headers), timeout=60) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from credits.models import WebhookEvent
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def process_event(event):
+    '''
+    Processes an event in one of the worker's threads, closing the thread's DB connection afterwards.
+    Events that fail on any error are left locked with the error, to be retried later like any other failure, up to
+    WEBHOOK_MAX_ATTEMPTS times, so one bad event can't stop the worker.
+    '''
+    try:
+        return event.process()
+    except Exception as error:
+        logger.exception('Failed to process webhook event %s.', event.event_id)
+        try:
+            WebhookEvent.objects.filter(pk=event.pk).update(error='{}: {}'.format(type(error).__name__, error))
+        except DatabaseError:
+            pass
+        return False
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    '''
+    Worker processing the Stripe webhook events in the inbox.
+    '''
+    help = 'Processes Stripe webhook events as they are received, fulfilling successful payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.WEBHOOK_WORKER_THREADS,
+                            help='Number of events to process at once.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once there are no events left to process, rather than waiting for more.')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            while True:
+                events = WebhookEvent.objects.claim(options['threads'] * 2)
+                if events:
+                    results = list(executor.map(process_event, events))
+                    processed += results.count(True)
+                    failed += results.count(False)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(settings.WEBHOOK_POLL_INTERVAL)
+
+        self.stdout.write('Processed {} webhook events, {} failed.'.format(processed, failed))
@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+import json
+import logging
 import stripe
+from credits.balances import clear_wallet_balance
+from credits.stripe_client import stripe_client
+from credits.waiters import payment_waiter
+
+logger = logging.getLogger(__name__)
 
 stripe.api_key = settings.STRIPE_SECRET
 
@@ -25,28 +33,38 @@ class Wallet(models.Model):
     def __str__(self):
         return '{}\'s wallet'.format(self.user.username)
 
+    def clear_cached_balance(self):
+        '''
+        Clears the user's cached balance, and again on commit, in case another request caches the old one before then.
+        '''
+        clear_wallet_balance(self.user_id)
+        transaction.on_commit(lambda: clear_wallet_balance(self.user_id))
+
     def credit(self, amount=0, real_value=0, transaction_id=None):
         '''
         Credits the user's wallet with an amount, logs it and associates the transaction with a real value, and a Stripe transaction.
+        The balance is added to in the DB, rather than saving the one read earlier, so concurrent changes aren't lost.
         '''
-        self.balance += amount
-        transaction = Credit.objects.create(wallet=self, amount=amount, real_value=real_value, stripe_transaction_id=transaction_id)
-        transaction.save()
-        self.save()
+        with transaction.atomic():
+            Wallet.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+            Credit.objects.create(wallet=self, amount=amount, real_value=real_value, stripe_transaction_id=transaction_id)
+            self.refresh_from_db(fields=['balance'])
+            self.clear_cached_balance()
         return self.balance
 
     def debit(self, amount=0, real_value=0):
         '''
         Debits an amount from the users wallet and logs it.
+        The balance is only taken from if it covers the amount when updated, so concurrent debits can't overspend.
         '''
-        if self.balance >= amount:
-            self.balance -= amount
-            transaction = Debit.objects.create(wallet=self, amount=amount, real_value=real_value)
-            transaction.save()
-            self.save()
-            return transaction
-        else:
-            return False
+        with transaction.atomic():
+            if Wallet.objects.filter(pk=self.pk, balance__gte=amount).update(balance=F('balance') - amount):
+                debit = Debit.objects.create(wallet=self, amount=amount, real_value=real_value)
+                self.refresh_from_db(fields=['balance'])
+                self.clear_cached_balance()
+                return debit
+            else:
+                return False
 
 
 class Transaction(models.Model):
@@ -86,7 +104,7 @@ class Credit(Transaction):
         '''
         if self.can_refund:
             try:
-                refund = stripe.Refund.create(charge=self.stripe_transaction_id)
+                refund = stripe_client.create_refund(self.stripe_transaction_id)
                 if refund['status'] == 'succeeded':
                     self.wallet.debit(self.amount, refund['amount'])
                     self.refunded = True
@@ -111,29 +129,31 @@ class Debit(Transaction):
 class PaymentIntentManager(models.Manager):
     def create_payment_intent(self, user, credits, amount):
         '''
-        Reuses or creates a payment intent for a new transaction.
+        Reuses or creates a payment intent for a new transaction. Makes at most one call to Stripe.
         '''
         try:
             payment_intent = self.get(user=user, complete=False)
             payment_intent.update(credits, amount)
         except PaymentIntent.DoesNotExist:
-            stripe_payment_intent = stripe.PaymentIntent.create(amount=amount, currency=settings.STRIPE_CURRENCY)
-            intent_id = stripe_payment_intent.id
-            payment_intent = self.create(user=user, intent_id=intent_id, credits=credits, amount=amount)
+            stripe_payment_intent = stripe_client.create_payment_intent(amount)
+            payment_intent = self.create(user=user, intent_id=stripe_payment_intent.id, credits=credits, amount=amount,
+                                         client_secret=stripe_payment_intent.client_secret)
 
-        payment_intent.save()
         return payment_intent
 
 
 class PaymentIntent(models.Model):
     '''
     Model to associate a Stripe payment intent with a prospective transaction.
+    The amount is only changed once Stripe has been updated, so it's always the amount Stripe has for the intent.
     '''
     user = models.ForeignKey(User)
     intent_id = models.CharField(max_length=100)
     credits = models.IntegerField(default=0)
     amount = models.IntegerField(default=0)
     complete = models.BooleanField(default=False)
+    # Client secret for the stripe.js api to take payment, stored so it doesn't need retrieving from Stripe.
+    client_secret = models.CharField(max_length=255, blank=True, default='')
 
     objects = PaymentIntentManager()
 
@@ -141,21 +161,18 @@ class PaymentIntent(models.Model):
         '''
         Retrives the actual payment intent from Stripe
         '''
-        return stripe.PaymentIntent.retrieve(self.intent_id)
-
-    @property
-    def client_secret(self):
-        '''
-        Returns the client secret from for the payment intent to be used by the stripe.js api to take payment.
-        '''
-        intent = self.retrieve_intent()
-        return intent.client_secret
+        return stripe_client.retrieve_payment_intent(self.intent_id)
 
     def update(self, credits=0, amount=0):
         '''
-        Updates the payment intent, both in the DB and in Stripe.
+        Updates the payment intent, both in the DB and in Stripe. Stripe is only called if the amount has changed,
+        or to fetch the client secret of intents created before it was stored.
         '''
-        stripe.PaymentIntent.modify(self.intent_id, amount=amount)
+        if amount != self.amount:
+            intent = stripe_client.modify_payment_intent(self.intent_id, amount)
+            self.client_secret = intent.client_secret
+        elif not self.client_secret:
+            self.client_secret = self.retrieve_intent().client_secret
         self.credits = credits
         self.amount = amount
         self.save()
@@ -164,11 +181,100 @@ class PaymentIntent(models.Model):
         '''
         Completes the payment, checks the correct amount has been recieved, and
         credits the users wallet the correct number of credits.
+        Intents are only marked complete, and credited, once, however many times they're fulfilled.
         '''
+        if self.complete:
+            return True
         intent = self.retrieve_intent()
-        if intent.amount_received == self.amount == intent.charges.data[0].amount:
-            wallet = Wallet.objects.get_or_create(user=self.user)[0]
-            wallet.credit(self.credits, self.amount, intent.charges.data[0].id)
+        charges = intent.charges.data
+        if charges and intent.amount_received == self.amount == charges[0].amount:
+            with transaction.atomic():
+                if PaymentIntent.objects.filter(pk=self.pk, complete=False).update(complete=True):
+                    wallet = Wallet.objects.get_or_create(user=self.user)[0]
+                    wallet.credit(self.credits, self.amount, charges[0].id)
+                    payment_waiter.notify(self.pk)
             self.complete = True
-            self.save()
         return self.complete
+
+    def wait_until_complete(self, timeout):
+        '''
+        Waits up to timeout seconds for the payment to be fulfilled, woken when it is. Returns whether it's complete.
+        Raises WaitersFull, without waiting, if the process is already holding as many waiting requests as it allows.
+        '''
+        if not self.complete:
+            self.complete = payment_waiter.wait(self.pk, PaymentIntent.objects.filter(pk=self.pk, complete=True).exists, timeout)
+        return self.complete
+
+
+class WebhookEventManager(models.Manager):
+    def receive(self, event):
+        '''
+        Stores a Stripe event in the inbox to be processed, unless it's already been received. Returns whether it was new.
+        '''
+        return self.get_or_create(event_id=event['id'], defaults={'event_type': event['type'], 'payload': json.dumps(event)})[1]
+
+    def claim(self, limit):
+        '''
+        Claims up to limit unprocessed events, locking them for WEBHOOK_RETRY_DELAY seconds, so they aren't
+        processed by any other worker. If processing fails the event is retried once its lock expires.
+        '''
+        now = timezone.now()
+        pending = self.filter(Q(locked_until=None) | Q(locked_until__lt=now), processed=None, attempts__lt=settings.WEBHOOK_MAX_ATTEMPTS)
+        claimed = []
+        for event in pending.order_by('received')[:limit]:
+            # Only claimed if no other worker has locked it since it was read.
+            if self.filter(pk=event.pk, locked_until=event.locked_until) \
+                    .update(locked_until=now + timedelta(seconds=settings.WEBHOOK_RETRY_DELAY), attempts=F('attempts') + 1):
+                event.attempts += 1
+                claimed.append(event)
+        return claimed
+
+
+class WebhookEvent(models.Model):
+    '''
+    Inbox of events received from Stripe's webhook, which are processed by the process_webhooks command.
+    '''
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.TextField()
+    received = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, default=None)
+    locked_until = models.DateTimeField(null=True, default=None)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    objects = WebhookEventManager()
+
+    def __str__(self):
+        return '{} event {} received @ {}'.format(self.event_type, self.event_id, self.received.strftime('%d/%m/%y %H:%M'))
+
+    def process(self):
+        '''
+        Handles the event, fulfilling the payment intent for successful payments. Returns whether it was processed,
+        if not the error is recorded and the event is left to be retried. Malformed events are processed with an error,
+        as retrying them can't help.
+        '''
+        self.error = ''
+        if self.event_type == 'payment_intent.succeeded':
+            try:
+                intent_id = json.loads(self.payload)['data']['object']['id']
+            except (ValueError, KeyError, TypeError):
+                intent_id = None
+                self.error = 'Malformed event, without the payment intent\'s id.'
+            try:
+                if intent_id is not None and not PaymentIntent.objects.get(intent_id=intent_id).fulfill():
+                    self.error = 'Amount received doesn\'t match the payment intent.'
+            except PaymentIntent.DoesNotExist:
+                # Payment has been made, but the order cannot be fulfilled. Payment probably needs refunding by a human being...
+                self.error = 'Payment succeeded, but failed to find payment intent in tracker DB.'
+            except stripe.error.StripeError as error:
+                self.error = str(error)
+                logger.warning('Failed to process webhook event %s: %s', self.event_id, error)
+                self.save(update_fields=['error'])
+                return False
+
+        if self.error:
+            logger.error('Webhook event %s needs attention: %s', self.event_id, self.error)
+        self.processed = timezone.now()
+        self.save(update_fields=['processed', 'error'])
+        return True
@@ -0,0 +1,9 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from credits.balances import clear_wallet_balance
+
+
+@receiver(user_logged_in)
+def clear_logged_in_wallet_balance(sender, request, user, **kwargs):
+    # Users' balances are read afresh when they log in, rather than relying on one cached in an earlier session.
+    clear_wallet_balance(user.id)
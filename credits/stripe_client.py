@@ -0,0 +1,74 @@
+from django.conf import settings
+import logging
+import threading
+import time
+import stripe
+
+logger = logging.getLogger(__name__)
+
+
+class StripeClient(object):
+    '''
+    Wrapper for the Stripe API calls the site makes. Requests are sent through a single HTTP client, which keeps
+    a session, and so its connections to Stripe, open in each thread. The number of calls made, errors, and the time
+    they take are recorded for each operation.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self.http_client = None
+
+    def call(self, operation, method, *args, **kwargs):
+        '''
+        Calls a Stripe API method, recording how long it took.
+        '''
+        if self.http_client is None:
+            self.http_client = stripe.default_http_client = stripe.http_client.RequestsClient(timeout=settings.STRIPE_TIMEOUT)
+
+        start = time.monotonic()
+        failed = False
+        try:
+            return method(*args, **kwargs)
+        except stripe.error.StripeError:
+            failed = True
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self.record(operation, duration, failed)
+            logger.info('Stripe %s took %.0fms%s.', operation, duration * 1000, ' and failed' if failed else '')
+
+    def record(self, operation, duration, failed=False):
+        with self._lock:
+            metrics = self._metrics.setdefault(operation, {'calls': 0, 'errors': 0, 'total_seconds': 0, 'max_seconds': 0})
+            metrics['calls'] += 1
+            metrics['errors'] += failed
+            metrics['total_seconds'] += duration
+            metrics['max_seconds'] = max(metrics['max_seconds'], duration)
+
+    @property
+    def metrics(self):
+        '''
+        Returns a dictionary of each operation's calls, errors, and total, average and maximum time taken in seconds.
+        '''
+        with self._lock:
+            return {operation: dict(metrics, avg_seconds=metrics['total_seconds'] / metrics['calls'])
+                    for operation, metrics in self._metrics.items()}
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics = {}
+
+    def create_payment_intent(self, amount):
+        return self.call('payment_intent.create', stripe.PaymentIntent.create, amount=amount, currency=settings.STRIPE_CURRENCY)
+
+    def retrieve_payment_intent(self, intent_id):
+        return self.call('payment_intent.retrieve', stripe.PaymentIntent.retrieve, intent_id)
+
+    def modify_payment_intent(self, intent_id, amount):
+        return self.call('payment_intent.modify', stripe.PaymentIntent.modify, intent_id, amount=amount)
+
+    def create_refund(self, charge_id):
+        return self.call('refund.create', stripe.Refund.create, charge=charge_id)
+
+
+stripe_client = StripeClient()
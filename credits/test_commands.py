@@ -0,0 +1,138 @@
+from django.test import TransactionTestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.six import StringIO
+from unittest import mock
+from credits.models import Wallet, Credit, PaymentIntent, WebhookEvent
+from credits.tests_support import FakeStripe
+
+
+class ProcessWebhooksTestCase(TransactionTestCase):
+    '''
+    Class to test the process_webhooks management command against a fake Stripe.
+    '''
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                  password='tH1$isA7357')
+        self.fake_stripe = FakeStripe().__enter__()
+        self.addCleanup(self.fake_stripe.__exit__)
+
+    def create_paid_intent(self, credits, amount):
+        intent = self.fake_stripe.add_payment_intent(amount, amount_received=amount)
+        return PaymentIntent.objects.create(user=self.test_user, intent_id=intent['id'], credits=credits, amount=amount)
+
+    def receive(self, event_id, intent_id):
+        WebhookEvent.objects.receive({'id': event_id, 'type': 'payment_intent.succeeded', 'data': {'object': {'id': intent_id}}})
+
+    def process_webhooks(self):
+        out = StringIO()
+        # A single thread, as the SQLite test database only allows one connection to write at a time.
+        call_command('process_webhooks', once=True, threads=1, stdout=out)
+        return out.getvalue()
+
+    def test_process_webhooks_fulfills_payments(self):
+        '''
+        Successful payment events should fulfill their payment intents, crediting the users' wallets.
+        '''
+        intents = [self.create_paid_intent(10, 600), self.create_paid_intent(5, 300)]
+        for n, intent in enumerate(intents):
+            self.receive('evt_test{}'.format(n), intent.intent_id)
+        WebhookEvent.objects.receive({'id': 'evt_other', 'type': 'charge.succeeded', 'data': {'object': {'id': 'ch_test'}}})
+
+        self.assertIn('Processed 3 webhook events, 0 failed.', self.process_webhooks())
+
+        self.assertEqual(15, Wallet.objects.get(user=self.test_user).balance)
+        self.assertEqual(2, PaymentIntent.objects.filter(complete=True).count())
+        self.assertFalse(WebhookEvent.objects.filter(processed=None).exists())
+
+    def test_process_webhooks_credits_each_payment_once(self):
+        '''
+        A payment intent should only be credited once, even if Stripe sends more than one event for it.
+        '''
+        intent = self.create_paid_intent(10, 600)
+        for event_id in ('evt_test1', 'evt_test2', 'evt_test3'):
+            self.receive(event_id, intent.intent_id)
+
+        self.process_webhooks()
+
+        self.assertEqual(10, Wallet.objects.get(user=self.test_user).balance)
+        self.assertEqual(1, Credit.objects.count())
+
+    def test_process_webhooks_retries_stripe_errors(self):
+        '''
+        Events that fail due to a Stripe error should be left unprocessed with the error, to be retried later.
+        '''
+        PaymentIntent.objects.create(user=self.test_user, intent_id='pi_unknown', credits=10, amount=600)
+        self.receive('evt_test1', 'pi_unknown')
+
+        with self.assertLogs('credits.models', 'WARNING'):
+            self.assertIn('Processed 0 webhook events, 1 failed.', self.process_webhooks())
+
+        event = WebhookEvent.objects.get()
+        self.assertIsNone(event.processed)
+        self.assertEqual(1, event.attempts)
+        self.assertIn('No such payment_intent', event.error)
+        # The event is locked until it's due to be retried.
+        self.assertEqual([], WebhookEvent.objects.claim(10))
+
+    def test_process_webhooks_records_unknown_intents(self):
+        '''
+        Events for payment intents that aren't in the DB need a human to sort out, so should be processed with an error.
+        '''
+        self.receive('evt_test1', 'pi_unknown')
+
+        with self.assertLogs('credits.models', 'ERROR'):
+            self.assertIn('Processed 1 webhook events, 0 failed.', self.process_webhooks())
+
+        self.assertIn('failed to find payment intent', WebhookEvent.objects.get().error)
+
+    def test_process_webhooks_records_malformed_events(self):
+        '''
+        Events without a payment intent id can't be processed however often they're retried, so should be processed
+        with an error, without stopping the worker processing the other events.
+        '''
+        intent = self.create_paid_intent(10, 600)
+        WebhookEvent.objects.receive({'id': 'evt_malformed', 'type': 'payment_intent.succeeded'})
+        self.receive('evt_test1', intent.intent_id)
+
+        with self.assertLogs('credits.models', 'ERROR'):
+            self.assertIn('Processed 2 webhook events, 0 failed.', self.process_webhooks())
+
+        self.assertIn('Malformed event', WebhookEvent.objects.get(event_id='evt_malformed').error)
+        self.assertEqual(10, Wallet.objects.get(user=self.test_user).balance)
+
+    def test_process_webhooks_records_intents_without_charges(self):
+        '''
+        Events for payment intents without a charge should be processed with an error, rather than crashing the worker.
+        '''
+        intent = self.fake_stripe.add_payment_intent(600)
+        PaymentIntent.objects.create(user=self.test_user, intent_id=intent['id'], credits=10, amount=600)
+        self.receive('evt_test1', intent['id'])
+
+        with self.assertLogs('credits.models', 'ERROR'):
+            self.assertIn('Processed 1 webhook events, 0 failed.', self.process_webhooks())
+
+        self.assertIn('doesn\'t match', WebhookEvent.objects.get().error)
+
+    def test_process_webhooks_survives_unexpected_errors(self):
+        '''
+        Unexpected errors processing an event should be recorded on it to retry, and the other events still processed.
+        '''
+        intent = self.create_paid_intent(10, 600)
+        self.receive('evt_test1', intent.intent_id)
+        self.receive('evt_test2', 'pi_other')
+
+        original_process = WebhookEvent.process
+
+        def process(event):
+            if event.event_id == 'evt_test2':
+                raise RuntimeError('Something unexpected.')
+            return original_process(event)
+
+        with mock.patch.object(WebhookEvent, 'process', process), \
+                self.assertLogs('credits.management.commands.process_webhooks', 'ERROR'):
+            self.assertIn('Processed 1 webhook events, 1 failed.', self.process_webhooks())
+
+        event = WebhookEvent.objects.get(event_id='evt_test2')
+        self.assertIsNone(event.processed)
+        self.assertEqual('RuntimeError: Something unexpected.', event.error)
@@ -1,6 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from credits.models import Wallet
+from credits.balances import get_wallet_balance
+from credits.views import WalletView
 
 
 class WalletContextTestCase(TestCase):
@@ -17,6 +22,7 @@ class WalletContextTestCase(TestCase):
         Wallet.objects.create(user=cls.test_user)
 
     def setUp(self):
+        cache.clear()
         self.client.logout()
 
     def test_anonymous_user_no_wallet(self):
@@ -66,3 +72,47 @@ class WalletContextTestCase(TestCase):
 
         response = self.client.get('/tickets/')
         self.assertEqual(response.context.get('wallet_balance'), 0)
+
+    def test_wallet_balance_cached(self):
+        '''
+        A user's wallet balance and permissions shouldn't be queried again once their balance has been cached.
+        '''
+        self.client.login(username='TestContextUser', password='tH1$isA7357')
+        self.client.get('/tickets/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/tickets/')
+        self.assertEqual(0, response.context.get('wallet_balance'))
+        self.assertFalse(any('credits_wallet' in query['sql'] for query in queries))
+
+    def test_wallet_balance_cleared_by_credit_and_debit(self):
+        '''
+        The cached wallet balance should be updated when the wallet is credited or debited.
+        '''
+        self.client.login(username='TestContextUser', password='tH1$isA7357')
+        wallet = Wallet.objects.get(user=self.test_user)
+        self.client.get('/tickets/')
+
+        wallet.credit(10)
+        response = self.client.get('/tickets/')
+        self.assertEqual(10, response.context.get('wallet_balance'))
+
+        wallet.debit(4)
+        response = self.client.get('/tickets/')
+        self.assertEqual(6, response.context.get('wallet_balance'))
+
+    def test_wallet_page_reads_balance_afresh(self):
+        '''
+        The wallet page should show the balance from the wallet, rather than the cache, as it may have been credited
+        by another process.
+        '''
+        self.client.login(username='TestContextUser', password='tH1$isA7357')
+        self.client.get('/tickets/')
+        Wallet.objects.filter(user=self.test_user).update(balance=25)
+
+        response = self.client.get('/tickets/')
+        self.assertEqual(0, response.context.get('wallet_balance'))
+
+        request = RequestFactory().get('/credits/')
+        request.user = User.objects.get(id=self.test_user.id)
+        WalletView.as_view()(request)
+        self.assertEqual(25, get_wallet_balance(request.user))
@@ -1,8 +1,15 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
-from credits.models import Wallet, Credit, Debit
+from django.db import connection, OperationalError
+from credits.models import Wallet, Credit, Debit, PaymentIntent
+from credits.tests_support import FakeStripe
+from credits.stripe_client import stripe_client
+from tickets.models import Ticket, Vote
 from django.utils import timezone
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import time
+import stripe
 
 
 class WalletModelTestCase(TestCase):
@@ -100,6 +107,45 @@ class WalletModelTestCase(TestCase):
         self.assertEqual(20, wallet.balance)
 
 
+class WalletConcurrencyTestCase(TransactionTestCase):
+    '''
+    Class to stress test concurrent debits from a wallet, through votes for a feature.
+    '''
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                  password='tH1$isA7357')
+        Wallet.objects.create(user=self.test_user).credit(100)
+        self.feature = Ticket.objects.create(user=self.test_user, title='Test ticket', content='Test ticket', ticket_type='Feature')
+
+    def vote(self, credits):
+        '''
+        Votes for the feature with the user and wallet loaded afresh, as they would be by separate requests.
+        '''
+        try:
+            while True:
+                try:
+                    return self.feature.vote(User.objects.get(pk=self.test_user.pk), credits)['success']
+                except OperationalError:  # SQLite locks the whole database for writes, so retry any refused ones.
+                    time.sleep(0.01)
+        finally:
+            connection.close()
+
+    def test_concurrent_votes_never_overspend(self):
+        '''
+        Votes made at once from many threads should never take the balance below zero,
+        and every credit taken should be matched by a debit and a vote.
+        '''
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(self.vote, [7] * 40))
+
+        wallet = Wallet.objects.get(user=self.test_user)
+        self.assertGreaterEqual(wallet.balance, 0)
+        self.assertEqual(100 // 7, results.count(True))
+        self.assertEqual(results.count(True), Debit.objects.filter(wallet=wallet).count())
+        self.assertEqual(results.count(True), Vote.objects.filter(ticket=self.feature).count())
+        self.assertEqual(100 - 7 * results.count(True), wallet.balance)
+
+
 class CreditTestCase(TestCase):
     '''
     Class to test Credit model.
@@ -182,3 +228,69 @@ class CreditTestCase(TestCase):
         self.test_user.wallet.save()
 
         self.assertTrue(transaction.can_refund)
+
+
+class PaymentIntentTestCase(TestCase):
+    '''
+    Class to test the PaymentIntent model against a fake Stripe.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+
+    def setUp(self):
+        self.fake_stripe = FakeStripe().__enter__()
+        self.addCleanup(self.fake_stripe.__exit__)
+        stripe_client.reset_metrics()
+
+    def test_create_payment_intent_stores_client_secret(self):
+        '''
+        Creating a payment intent should make one call to Stripe, and store the intent's client secret.
+        '''
+        intent = PaymentIntent.objects.create_payment_intent(self.test_user, 10, 600)
+
+        self.assertEqual([('POST', '/v1/payment_intents')], self.fake_stripe.requests)
+        self.assertEqual(self.fake_stripe.payment_intents[intent.intent_id]['client_secret'],
+                         PaymentIntent.objects.get(pk=intent.pk).client_secret)
+
+    def test_reused_payment_intent_only_updated_if_amount_changes(self):
+        '''
+        Reusing a payment intent for the same amount shouldn't call Stripe, and for a different amount should only modify it.
+        '''
+        intent = PaymentIntent.objects.create_payment_intent(self.test_user, 10, 600)
+        self.fake_stripe.requests.clear()
+
+        self.assertEqual(intent.pk, PaymentIntent.objects.create_payment_intent(self.test_user, 10, 600).pk)
+        self.assertEqual([], self.fake_stripe.requests)
+
+        PaymentIntent.objects.create_payment_intent(self.test_user, 5, 300)
+        self.assertEqual([('POST', '/v1/payment_intents/{}'.format(intent.intent_id))], self.fake_stripe.requests)
+        self.assertEqual(300, self.fake_stripe.payment_intents[intent.intent_id]['amount'])
+        self.assertEqual((5, 300), PaymentIntent.objects.values_list('credits', 'amount').get(pk=intent.pk))
+
+    def test_reused_payment_intent_without_client_secret_retrieves_it(self):
+        '''
+        Payment intents stored before their client secret was should retrieve it from Stripe once.
+        '''
+        stripe_intent = self.fake_stripe.add_payment_intent(600)
+        PaymentIntent.objects.create(user=self.test_user, intent_id=stripe_intent['id'], credits=10, amount=600)
+
+        for n in range(2):
+            intent = PaymentIntent.objects.create_payment_intent(self.test_user, 10, 600)
+
+        self.assertEqual(stripe_intent['client_secret'], intent.client_secret)
+        self.assertEqual([('GET', '/v1/payment_intents/{}'.format(stripe_intent['id']))], self.fake_stripe.requests)
+
+    def test_stripe_calls_recorded_in_metrics(self):
+        '''
+        Calls to Stripe should be counted and timed for each operation, including any that fail.
+        '''
+        PaymentIntent.objects.create_payment_intent(self.test_user, 10, 600)
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            stripe_client.retrieve_payment_intent('pi_unknown')
+
+        metrics = stripe_client.metrics
+        self.assertEqual((1, 0), (metrics['payment_intent.create']['calls'], metrics['payment_intent.create']['errors']))
+        self.assertEqual((1, 1), (metrics['payment_intent.retrieve']['calls'], metrics['payment_intent.retrieve']['errors']))
+        self.assertGreater(metrics['payment_intent.create']['avg_seconds'], 0)
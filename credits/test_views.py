@@ -0,0 +1,119 @@
+from django.test import TestCase, RequestFactory, override_settings
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.exceptions import PermissionDenied
+from credits.models import WebhookEvent, PaymentIntent
+from credits.views import StripeWebhookView, CheckIntentView
+from credits.tests_support import sign_webhook
+import json
+import time
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookViewTestCase(TestCase):
+    '''
+    Class to test the Stripe webhook view.
+    '''
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.event = {'id': 'evt_test1', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': 'pi_test1'}}}
+
+    def post(self, body, secret='whsec_test'):
+        request = self.factory.post('/credits/webhook/', body, content_type='application/json',
+                                    HTTP_STRIPE_SIGNATURE=sign_webhook(body, secret))
+        return StripeWebhookView.as_view()(request)
+
+    def test_webhook_stores_event_once(self):
+        '''
+        Events should be stored in the inbox and acknowledged, and events resent by Stripe only stored once.
+        '''
+        for n in range(2):
+            response = self.post(json.dumps(self.event))
+            self.assertEqual(200, response.status_code)
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(('evt_test1', 'payment_intent.succeeded', None), (event.event_id, event.event_type, event.processed))
+        self.assertEqual(self.event, json.loads(event.payload))
+
+    def test_webhook_rejects_invalid_events(self):
+        '''
+        Payloads that aren't JSON Stripe events should be rejected with a 400, and not stored.
+        '''
+        self.assertEqual(400, self.post('not json').status_code)
+        self.assertEqual(400, self.post(json.dumps({'type': 'payment_intent.succeeded'})).status_code)
+        self.assertEqual(400, self.post(json.dumps(['evt_1', 'payment_intent.succeeded'])).status_code)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_webhook_rejects_unsigned_events(self):
+        '''
+        Events not signed with the webhook secret should be rejected with a 400, and not stored.
+        '''
+        self.assertEqual(400, self.post(json.dumps(self.event), secret='whsec_other').status_code)
+        request = self.factory.post('/credits/webhook/', json.dumps(self.event), content_type='application/json')
+        self.assertEqual(400, StripeWebhookView.as_view()(request).status_code)
+        with self.settings(STRIPE_WEBHOOK_SECRET=None):
+            self.assertEqual(400, self.post(json.dumps(self.event)).status_code)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+@override_settings(PAYMENT_WAIT_TIMEOUT=0.1)
+class CheckIntentViewTestCase(TestCase):
+    '''
+    Class to test the view long-polling payment intents for completion.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+        cls.other_user = User.objects.create_user(username='OtherUser', email='test@test.com',
+                                                  password='tH1$isA7357')
+        cls.intent = PaymentIntent.objects.create(user=cls.test_user, intent_id='pi_test', credits=10, amount=600)
+
+    def get(self, user):
+        request = RequestFactory().get('/credits/payment-success/{}/'.format(self.intent.pk))
+        request.user = user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return CheckIntentView.as_view()(request, pk=self.intent.pk)
+
+    def test_check_intent_returns_success_once_complete(self):
+        '''
+        A complete intent should be reported straight away.
+        '''
+        PaymentIntent.objects.filter(pk=self.intent.pk).update(complete=True)
+        start = time.monotonic()
+        self.assertEqual({'success': True}, json.loads(self.get(self.test_user).content.decode()))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_check_intent_waits_then_returns_failure(self):
+        '''
+        An incomplete intent should be waited on until the timeout, then reported unsuccessful.
+        '''
+        start = time.monotonic()
+        self.assertEqual({'success': False}, json.loads(self.get(self.test_user).content.decode()))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    @override_settings(PAYMENT_MAX_WAITERS=0)
+    def test_check_intent_asks_for_retry_when_full(self):
+        '''
+        When the worker can't hold another waiting request, an incomplete intent should be answered with a 202 straight
+        away, asking the page to retry, while a complete one is still reported.
+        '''
+        start = time.monotonic()
+        response = self.get(self.test_user)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('2', response['Retry-After'])
+        self.assertEqual({'success': False}, json.loads(response.content.decode()))
+
+        PaymentIntent.objects.filter(pk=self.intent.pk).update(complete=True)
+        response = self.get(self.test_user)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'success': True}, json.loads(response.content.decode()))
+
+    def test_check_intent_only_for_intents_user(self):
+        '''
+        Only the user who made the payment intent can check it.
+        '''
+        with self.assertRaises(PermissionDenied):
+            self.get(self.other_user)
@@ -0,0 +1,124 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.six import StringIO
+from credits.models import PaymentIntent
+from credits.waiters import PaymentWaiter, WaitersFull, payment_waiter
+from credits.tests_support import FakeStripe
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+
+class PaymentWaiterTestCase(TestCase):
+    '''
+    Class to test waiting for payment intents to complete.
+    '''
+    def wait_in_thread(self, waiter, is_complete, timeout=5, intent_pk=1):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        waiting = waiter.waiting
+        future = executor.submit(waiter.wait, intent_pk, is_complete, timeout)
+        while waiter.waiting == waiting and not future.done():
+            time.sleep(0.001)
+        return future
+
+    def test_wait_returns_straight_away_if_complete(self):
+        '''
+        Waiting on a complete intent should return true without waiting.
+        '''
+        self.assertTrue(PaymentWaiter(lambda intent_pks: []).wait(1, lambda: True, timeout=5))
+
+    def test_wait_woken_by_wake(self):
+        '''
+        Waiters should be woken, without checking the DB again, when woken for their intent.
+        '''
+        waiter = PaymentWaiter(lambda intent_pks: [])
+        checks = []
+        future = self.wait_in_thread(waiter, lambda: checks.append(1) and False)
+
+        waiter.wake(2)
+        time.sleep(0.05)
+        self.assertFalse(future.done())
+
+        start = time.monotonic()
+        waiter.wake(1)
+        self.assertTrue(future.result(timeout=1))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(1, len(checks))
+        self.assertEqual(0, waiter.waiting)
+
+    def test_wait_times_out(self):
+        '''
+        Waiting should return false once the timeout has passed.
+        '''
+        start = time.monotonic()
+        self.assertFalse(PaymentWaiter(lambda intent_pks: []).wait(1, lambda: False, timeout=0.1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    @override_settings(PAYMENT_WAIT_RECHECK_INTERVAL=0.05)
+    def test_wait_rechecks_without_notifications(self):
+        '''
+        Without notifications from other processes, waiters should notice completions by rechecking the DB,
+        with one check for every intent being waited on.
+        '''
+        checks = []
+
+        def find_complete(intent_pks):
+            checks.append(sorted(intent_pks))
+            return [2] if len(checks) == 3 else []
+
+        waiter = PaymentWaiter(find_complete)
+        first = self.wait_in_thread(waiter, lambda: False, intent_pk=1, timeout=0.5)
+        second = self.wait_in_thread(waiter, lambda: False, intent_pk=2)
+        self.assertTrue(second.result(timeout=5))
+        self.assertFalse(first.result(timeout=5))
+        self.assertEqual([[1, 2]] * 3, checks[:3])
+
+    def test_wait_refused_once_full(self):
+        '''
+        Once max_waiters requests are waiting, more should be refused without waiting, until one finishes.
+        '''
+        waiter = PaymentWaiter(lambda intent_pks: [], max_waiters=1)
+        future = self.wait_in_thread(waiter, lambda: False)
+        with self.assertRaises(WaitersFull):
+            waiter.wait(2, lambda: True, timeout=5)
+        waiter.wake(1)
+        self.assertTrue(future.result(timeout=1))
+        self.assertTrue(waiter.wait(2, lambda: True, timeout=5))
+
+    def test_benchmark_payment_waiters(self):
+        '''
+        The benchmark command should report on each number of waiters held in process.
+        '''
+        out = StringIO()
+        call_command('benchmark_payment_waiters', waiters=[1, 5], hold=0, in_process=True, stdout=out)
+        self.assertEqual(3, len(out.getvalue().strip().splitlines()))
+
+
+class FulfillWakesWaiterTestCase(TransactionTestCase):
+    '''
+    Class to test fulfilling a payment intent wakes requests waiting on it.
+    '''
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                  password='tH1$isA7357')
+        self.fake_stripe = FakeStripe().__enter__()
+        self.addCleanup(self.fake_stripe.__exit__)
+
+    @override_settings(PAYMENT_WAIT_RECHECK_INTERVAL=60)
+    def test_fulfill_wakes_waiter(self):
+        '''
+        A request waiting on an intent should be woken as soon as it's fulfilled.
+        '''
+        stripe_intent = self.fake_stripe.add_payment_intent(600, amount_received=600)
+        intent = PaymentIntent.objects.create(user=self.test_user, intent_id=stripe_intent['id'], credits=10, amount=600)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(PaymentIntent.objects.get(pk=intent.pk).wait_until_complete, 30)
+            while not payment_waiter.waiting:
+                time.sleep(0.001)
+            # Let the waiter finish checking the DB, as SQLite only allows one connection to write at a time.
+            time.sleep(0.1)
+
+            intent.fulfill()
+            self.assertTrue(future.result(timeout=5))
@@ -0,0 +1,112 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl
+import hmac
+import json
+import threading
+import time
+from hashlib import sha256
+import stripe
+
+# Support for the credits tests. FakeStripe is a local stand in for the parts of Stripe's API the site uses, for testing
+# payments without a network or Stripe account.
+
+
+def sign_webhook(payload, secret):
+    '''
+    Returns the Stripe-Signature header Stripe would send with a webhook payload signed with the secret.
+    '''
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode('utf-8'), '{}.{}'.format(timestamp, payload).encode('utf-8'), sha256).hexdigest()
+    return 't={},v1={}'.format(timestamp, signature)
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', len(content))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_request(self):
+        fake = self.server.fake_stripe
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        fake.requests.append((self.command, self.path))
+
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if parts[:2] != ['v1', 'payment_intents']:
+            return self.respond(404, {'error': {'type': 'invalid_request_error', 'message': 'Unrecognized request URL'}})
+
+        with fake.lock:
+            if len(parts) == 2 and self.command == 'POST':
+                intent = fake.add_payment_intent(int(params['amount']))
+            elif len(parts) == 3 and parts[2] in fake.payment_intents:
+                intent = fake.payment_intents[parts[2]]
+                if self.command == 'POST' and 'amount' in params:
+                    intent['amount'] = int(params['amount'])
+            else:
+                return self.respond(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+            return self.respond(200, intent)
+
+    do_GET = do_POST = handle_request
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeStripe(object):
+    '''
+    Serves fake payment intents on a local port, and points the stripe library at it while in use as a context manager.
+    Records each request made to it in requests, as (method, path).
+    '''
+    def __init__(self):
+        self.payment_intents = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def add_payment_intent(self, amount, amount_received=0):
+        '''
+        Adds a payment intent for an amount, with a charge for the amount received if anything has been.
+        '''
+        intent_id = 'pi_fake{}'.format(len(self.payment_intents) + 1)
+        charges = [{'id': 'ch_fake{}'.format(len(self.payment_intents) + 1), 'object': 'charge', 'amount': amount_received}] \
+            if amount_received else []
+        self.payment_intents[intent_id] = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'amount_received': amount_received,
+            'client_secret': '{}_secret_fake'.format(intent_id),
+            'currency': 'gbp',
+            'charges': {'object': 'list', 'data': charges},
+        }
+        return self.payment_intents[intent_id]
+
+    def pay(self, intent_id):
+        '''
+        Marks a payment intent as paid in full, as if the customer had completed payment.
+        '''
+        intent = self.payment_intents[intent_id]
+        intent['amount_received'] = intent['amount']
+        intent['charges']['data'] = [{'id': intent_id.replace('pi_', 'ch_'), 'object': 'charge', 'amount': intent['amount']}]
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStripeHandler)
+        self.server.fake_stripe = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.original_api = (stripe.api_base, stripe.api_key)
+        stripe.api_base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        stripe.api_key = stripe.api_key or 'sk_test_fake'
+        return self
+
+    def __exit__(self, *exc_info):
+        stripe.api_base, stripe.api_key = self.original_api
+        self.server.shutdown()
+        self.server.server_close()
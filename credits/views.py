@@ -13,11 +13,11 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from datetime import timedelta
 import json
-from credits.forms import GetCreditsForm
-from credits.models import PaymentIntent, Credit
 import stripe
-
-stripe.api_key = settings.STRIPE_SECRET
+from credits.forms import GetCreditsForm
+from credits.balances import clear_wallet_balance
+from credits.models import PaymentIntent, Credit, WebhookEvent
+from credits.waiters import WaitersFull
 
 # Create your views here.
 
@@ -35,10 +35,15 @@ class HasWalletMixin(LoginRequiredMixin, UserPassesTestMixin):
 
 class WalletView(HasWalletMixin, TemplateView):
     '''
-    Wallet view. Uses the existing wallet_amount context variable.
+    Wallet view. Uses the existing wallet_balance context variable, read afresh rather than from the cache, as credits
+    bought are added by the webhook worker, which may not share the web processes' cache.
     '''
     template_name = 'wallet.html'
 
+    def get(self, request, *args, **kwargs):
+        clear_wallet_balance(request.user.id)
+        return super(WalletView, self).get(request, *args, **kwargs)
+
 
 class GetCreditsView(HasWalletMixin, FormView, ContextMixin):
     '''
@@ -61,7 +66,6 @@ class GetCreditsView(HasWalletMixin, FormView, ContextMixin):
         no_credits = form.cleaned_data['no_credits']
         charge = no_credits * self.cost_per_credit
         intent = PaymentIntent.objects.create_payment_intent(user=self.request.user, credits=no_credits, amount=charge)
-        intent.save()
         return render(self.request, 'get_credits_pay.html',
                       {'client_secret': intent.client_secret, 'stripe_publishable': settings.STRIPE_PUBLISHABLE,
                        'charge': '{:.2f}'.format(charge / 100), 'no_credits': no_credits, 'intent_db_id': intent.id})
@@ -110,7 +114,9 @@ class RefundView(HasWalletMixin, SingleObjectMixin, TemplateView, View):
 
 class CheckIntentView(LoginRequiredMixin, SingleObjectMixin, View):
     '''
-    View to poll payment intents for completion.
+    View to long-poll payment intents for completion. Responds as soon as the intent is complete,
+    or with success false after PAYMENT_WAIT_TIMEOUT seconds, when the page asks again.
+    If the worker is already holding PAYMENT_MAX_WAITERS requests, responds 202 straight away, for the page to retry.
     '''
     model = PaymentIntent
     http_method_names = ['get']
@@ -119,8 +125,13 @@ class CheckIntentView(LoginRequiredMixin, SingleObjectMixin, View):
         intent = self.get_object()
         if intent.user != request.user:
             raise PermissionDenied()
-        if intent.complete:
-            messages.success(self.request, 'Payment successful.')
+        try:
+            if intent.wait_until_complete(settings.PAYMENT_WAIT_TIMEOUT):
+                messages.success(self.request, 'Payment successful.')
+        except WaitersFull:
+            response = HttpResponse(json.dumps({'success': False}), content_type='application/json', status=202)
+            response['Retry-After'] = settings.PAYMENT_WAIT_RETRY_AFTER
+            return response
         response = {'success': intent.complete}
         return HttpResponse(json.dumps(response), content_type='application/json')
 
@@ -137,27 +148,24 @@ class StripeWebhookView(View):
 
     def post(self, request):
         '''
-        Checks validity of posted payment event json and deals with it as apropriate.
+        Checks the posted payment event is signed by Stripe with the webhook secret, and stores it to be processed by
+        the process_webhooks command. Stripe is answered straight away, and any event it resends is only stored once.
         '''
-        payload = request.body
-
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            # Without the secret no event can be trusted.
+            return HttpResponse(status=400)
         try:
-            event = stripe.Event.construct_from(json.loads(payload), stripe.api_key)
+            payload = request.body.decode('utf-8')
+            # The check Webhook.construct_event makes, without building an Event before the payload's shape is checked.
+            stripe.WebhookSignature.verify_header(payload, request.META.get('HTTP_STRIPE_SIGNATURE', ''),
+                                                  settings.STRIPE_WEBHOOK_SECRET, stripe.Webhook.DEFAULT_TOLERANCE)
+            event = json.loads(payload)
         except (ValueError, stripe.error.SignatureVerificationError):
-            # Invalid payload or invalid signature
+            # Invalid payload or signature
+            return HttpResponse(status=400)
+        if not isinstance(event, dict) or 'id' not in event or 'type' not in event:
             return HttpResponse(status=400)
 
-        event_dict = event.to_dict()
-
-        if event_dict['type'] == "payment_intent.succeeded":
-            # If the event is a successful payment, match it to a stored intent object, and fulfill the payment.
-            intent = event_dict['data']['object']
-            try:
-                payment_intent = PaymentIntent.objects.get(intent_id=intent['id'])
-                payment_intent.fulfill()
-            except PaymentIntent.DoesNotExist:
-                # If the payment intent doesn't exist in the system, something needs to be done by a human being...
-                # Payment has been made, but the order cannot be fulfilled. Payment probably needs refunding.
-                print('Payment succeded, but failed to find payment intent in tracker DB.')
+        WebhookEvent.objects.receive(event)
 
         return HttpResponse(status=200)
@@ -0,0 +1,163 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+import logging
+import select
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WaitersFull(Exception):
+    '''
+    Raised when a process is already holding as many waiting requests as PAYMENT_MAX_WAITERS allows.
+    '''
+
+
+class PaymentWaiter(object):
+    '''
+    Lets requests wait for payment intents to complete, woken by a notification from fulfillment rather than querying the
+    DB over and over. A waiting request holds a sleeping thread, but no DB connection. As each holds one of the web
+    worker's threads, at most max_waiters wait at once, so the rest are left for other pages.
+
+    On PostgreSQL completions are sent to every process with NOTIFY, and a thread in each process LISTENs for them.
+    On other DBs only completions in the same process wake waiters, so a thread in each process also checks the DB for
+    every intent being waited on, with one call to find_complete every recheck_interval seconds.
+    '''
+    channel = 'payment_intent_complete'
+
+    def __init__(self, find_complete, max_waiters=None):
+        self.find_complete = find_complete
+        self._max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._listener = None
+        self._rechecker = None
+
+    @property
+    def waiting(self):
+        '''
+        Returns the number of requests waiting.
+        '''
+        with self._lock:
+            return self._count_waiting()
+
+    @property
+    def max_waiters(self):
+        return settings.PAYMENT_MAX_WAITERS if self._max_waiters is None else self._max_waiters
+
+    @property
+    def recheck_interval(self):
+        return settings.PAYMENT_WAIT_RECHECK_INTERVAL
+
+    def wait(self, intent_pk, is_complete, timeout):
+        '''
+        Waits up to timeout seconds for a payment intent to complete. is_complete is called to check the DB before waiting.
+        Returns whether the intent is complete, or raises WaitersFull if max_waiters requests are already waiting.
+        '''
+        event = threading.Event()
+        with self._lock:
+            if self._count_waiting() >= self.max_waiters:
+                raise WaitersFull()
+            self._waiting.setdefault(intent_pk, set()).add(event)
+        try:
+            if not self._start_listener():
+                self._start_rechecker()
+            # Checked once registered, so a completion can't be missed between checking and waiting.
+            if is_complete():
+                return True
+            if not connection.in_atomic_block:
+                connection.close()
+            return event.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiting[intent_pk].discard(event)
+                if not self._waiting[intent_pk]:
+                    del self._waiting[intent_pk]
+
+    def wake(self, intent_pk):
+        '''
+        Wakes any requests in this process waiting on a payment intent.
+        '''
+        with self._lock:
+            for event in self._waiting.get(intent_pk, ()):
+                event.set()
+
+    def notify(self, intent_pk, using='default'):
+        '''
+        Notifies waiters that a payment intent is complete, once the current transaction commits.
+        '''
+        if connections[using].vendor == 'postgresql':
+            with connections[using].cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, str(intent_pk)])
+        transaction.on_commit(lambda: self.wake(intent_pk), using)
+
+    def _start_listener(self):
+        '''
+        Starts the thread listening for completions from other processes, if the DB supports it. Returns whether it's running.
+        '''
+        if connection.vendor != 'postgresql':
+            return False
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='payment-waiter', daemon=True)
+                self._listener.start()
+        return True
+
+    def _listen(self):
+        while True:
+            listen_connection = None
+            try:
+                listen_connection = connection.get_new_connection(connection.get_connection_params())
+                listen_connection.autocommit = True
+                with listen_connection.cursor() as cursor:
+                    cursor.execute('LISTEN {}'.format(self.channel))
+                while True:
+                    if select.select([listen_connection], [], [], 60) != ([], [], []):
+                        listen_connection.poll()
+                        while listen_connection.notifies:
+                            self.wake(int(listen_connection.notifies.pop(0).payload))
+            except Exception:
+                logger.exception('Payment waiter stopped listening for notifications, reconnecting.')
+                if listen_connection is not None:
+                    listen_connection.close()
+                time.sleep(self.recheck_interval)
+
+    def _start_rechecker(self):
+        '''
+        Starts the thread checking the DB for completions other processes made, when they can't be notified.
+        '''
+        with self._lock:
+            if self._rechecker is None or not self._rechecker.is_alive():
+                self._rechecker = threading.Thread(target=self._recheck, name='payment-rechecker', daemon=True)
+                self._rechecker.start()
+
+    def _recheck(self):
+        while True:
+            time.sleep(self.recheck_interval)
+            with self._lock:
+                intent_pks = list(self._waiting)
+            if not intent_pks:
+                continue
+            try:
+                for intent_pk in self.find_complete(intent_pks):
+                    self.wake(intent_pk)
+            except Exception:
+                logger.exception('Payment waiter failed to check for completed payment intents.')
+            finally:
+                connection.close()
+
+    def _count_waiting(self):
+        return sum(len(events) for events in self._waiting.values())
+
+
+def find_complete_intents(intent_pks):
+    '''
+    Returns the pks of the payment intents given that are complete.
+    '''
+    return apps.get_model('credits', 'PaymentIntent').objects.filter(pk__in=intent_pks, complete=True) \
+        .values_list('pk', flat=True)
+
+
+payment_waiter = PaymentWaiter(find_complete_intents)
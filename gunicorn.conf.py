@@ -0,0 +1,24 @@
+import os
+
+# Threaded workers, so requests waiting on payments (see credits.waiters) only hold a thread, not a whole worker.
+# At most PAYMENT_MAX_WAITERS of the threads are held by them at once, a quarter by default.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 20))
+
+
+def post_worker_init(worker):
+    '''
+    Compiles the templates as the worker starts, before it handles any requests.
+    '''
+    from issue_tracker.warmup import warm_templates
+    worker.log.info('Warmed %s templates.', warm_templates())
+
+
+def worker_exit(server, worker):
+    '''
+    Writes any buffered pageviews, and finishes uploading any staged images, before the worker exits.
+    '''
+    from tickets.pageviews import pageview_recorder
+    from tickets.uploads import media_uploader
+    pageview_recorder.flush()
+    media_uploader.shutdown()
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
@@ -9,3 +10,11 @@ class StaticStorage(S3Boto3Storage):
 class MediaStorage(S3Boto3Storage):
     location = settings.AWS_MEDIA_LOCATION
     file_overwrite = False
+
+
+class StagingStorage(FileSystemStorage):
+    '''
+    Local storage for uploaded media waiting to be uploaded to the media storage in the background.
+    '''
+    def __init__(self):
+        super(StagingStorage, self).__init__(location=settings.MEDIA_STAGING_ROOT)
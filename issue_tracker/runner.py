@@ -0,0 +1,22 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    '''
+    Test runner overriding the settings tests rely on for the whole run. Query budgets are enforced, so tests of a page
+    fail if it makes more queries than its budget, and pageviews are written as they're recorded, so tests see them.
+    '''
+    test_settings = {
+        'QUERY_BUDGETS_ENFORCED': True,
+        'PAGEVIEW_BATCH_SIZE': 1,
+    }
+
+    def setup_test_environment(self, **kwargs):
+        super(TestRunner, self).setup_test_environment(**kwargs)
+        self.settings_override = override_settings(**self.test_settings)
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        super(TestRunner, self).teardown_test_environment(**kwargs)
@@ -46,7 +46,14 @@ INSTALLED_APPS = [
     'storages',
 ]
 
+# The benchmarks app, with its benchmark, benchmark_templates and generate_data commands, is only installed if $DEBUG or
+# $BENCHMARKS is set, so they can't be run against the production database by mistake.
+
+if DEBUG or 'BENCHMARKS' in os.environ:
+    INSTALLED_APPS.append('benchmarks')
+
 MIDDLEWARE = [
+    'stats.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +65,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'issue_tracker.urls'
 
+# Unless $DEBUG is set, Django's default loaders keep compiled templates in the cached loader, so each is compiled once
+# per process, and gunicorn workers compile them all as they start (see issue_tracker.warmup).
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -95,6 +105,51 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# If $CACHE_DIR is set the cache is kept there, and shared between gunicorn workers, otherwise it's local to each process.
+
+if 'CACHE_DIR' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# The index page stats are cached until a ticket or vote changes them, or for at most INDEX_STATS_CACHE_TIMEOUT seconds,
+# as bugs fixed this week changes with the date, and other processes' caches aren't cleared.
+
+INDEX_STATS_CACHE_TIMEOUT = 300
+
+# The resolution times on the all tickets stats page are cached until a ticket or label changes them, or for at most
+# RESOLUTION_TIMES_CACHE_TIMEOUT seconds, as other processes' caches aren't cleared.
+
+RESOLUTION_TIMES_CACHE_TIMEOUT = 300
+
+# Users' wallet balances are cached until their wallet is credited or debited, or for at most
+# WALLET_BALANCE_CACHE_TIMEOUT seconds, as other processes' caches aren't cleared.
+
+WALLET_BALANCE_CACHE_TIMEOUT = 300
+
+# Users' permissions are cached until their permissions or groups, or their groups' permissions change, or for at most
+# PERMISSIONS_CACHE_TIMEOUT seconds. They're only cached when CACHE_DIR is set, so changes clear them for every worker.
+
+PERMISSIONS_CACHE_TIMEOUT = 300
+
+
+# Authentication
+# https://docs.djangoproject.com/en/1.11/topics/auth/customizing/#specifying-authentication-backends
+
+AUTHENTICATION_BACKENDS = ['account.permissions.CachedPermissionsBackend']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -168,6 +223,55 @@ LOGIN_REDIRECT_URL = 'index'
 LOGOUT_REDIRECT_URL = 'index'
 LOGIN_URL = 'login'
 
+# Ticket pageviews are buffered and written in batches of PAGEVIEW_BATCH_SIZE, or after PAGEVIEW_FLUSH_INTERVAL seconds,
+# by a background thread. A batch size of 1 writes each view in its request, as the test runner does. Up to PAGEVIEW_MAX_PENDING views are held
+# if writing fails.
+
+PAGEVIEW_BATCH_SIZE = int(os.environ.get('PAGEVIEW_BATCH_SIZE', 50))
+PAGEVIEW_FLUSH_INTERVAL = int(os.environ.get('PAGEVIEW_FLUSH_INTERVAL', 10))
+PAGEVIEW_MAX_PENDING = 10000
+
+# Visitors' viewed tickets are remembered in a cookie, so each view is only counted once, for up to this many tickets.
+
+PAGEVIEW_COOKIE_MAX_TICKETS = 200
+
+# Images attached to tickets are uploaded to the media storage with their renditions as the ticket is saved.
+# If $DEFER_MEDIA_UPLOADS is set they're written to $MEDIA_STAGING_DIR instead, and uploaded by MEDIA_UPLOAD_THREADS
+# background threads, so requests don't wait on S3 or resizing. Failed uploads are retried after MEDIA_UPLOAD_RETRY_DELAY
+# seconds, up to MEDIA_UPLOAD_MAX_ATTEMPTS times. Staged images are lost if the staging directory is, so only set it
+# where $MEDIA_STAGING_DIR is on a disk kept across restarts and deploys, which Heroku dynos' disks aren't.
+
+DEFER_MEDIA_UPLOADS = 'DEFER_MEDIA_UPLOADS' in os.environ
+MEDIA_STAGING_ROOT = os.environ.get('MEDIA_STAGING_DIR', os.path.join(BASE_DIR, 'media_staging'))
+MEDIA_UPLOAD_THREADS = 2
+MEDIA_UPLOAD_RETRY_DELAY = 5
+MEDIA_UPLOAD_MAX_ATTEMPTS = 5
+
+# If $TICKETS_CURSOR_PAGINATION is set the tickets list is paginated with cursors instead of page numbers,
+# which keeps deep pages fast and skips counting the total number of tickets.
+
+TICKETS_CURSOR_PAGINATION = 'TICKETS_CURSOR_PAGINATION' in os.environ
+
+# Each request's wall time, queries, SQL time and template render time are recorded for the last REQUEST_METRICS_WINDOW
+# requests to each view, and summarised at /stats/requests/ for staff users.
+# Views listed in QUERY_BUDGETS log a warning when a request makes more queries than its budget, or fail if
+# QUERY_BUDGETS_ENFORCED is set, as it always is when running tests by the test runner.
+
+REQUEST_METRICS_WINDOW = int(os.environ.get('REQUEST_METRICS_WINDOW', 1000))
+QUERY_BUDGETS = {
+    'index': 10,
+    'tickets-list': 10,
+    'ticket': 20,
+    'labels': 6,
+    'roadmap': 8,
+    'ticket_stats': 12,
+    'all_ticket_stats': 18,
+    'transaction_stats': 8,
+}
+QUERY_BUDGETS_ENFORCED = 'QUERY_BUDGETS_ENFORCED' in os.environ
+
+TEST_RUNNER = 'issue_tracker.runner.TestRunner'
+
 # Sent emails will be printed to the console.
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -178,3 +282,23 @@ STRIPE_PUBLISHABLE = os.environ.get('STRIPE_PUBLISHABLE')
 STRIPE_SECRET = os.environ.get('STRIPE_SECRET')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
 STRIPE_CURRENCY = 'gbp'
+STRIPE_TIMEOUT = 20  # Seconds to wait for a response from Stripe's API.
+
+# Requests waiting for a payment to complete are held for up to PAYMENT_WAIT_TIMEOUT seconds, inside Heroku's 30 second limit.
+# Each holds one of the web worker's GUNICORN_THREADS threads, so only PAYMENT_MAX_WAITERS wait at once in each worker,
+# leaving the rest for other pages. Any more are answered with a 202 straight away, and asked to retry after
+# PAYMENT_WAIT_RETRY_AFTER seconds. Without PostgreSQL to notify them of payments, a thread in each worker checks the DB
+# for all of them every PAYMENT_WAIT_RECHECK_INTERVAL seconds.
+
+PAYMENT_WAIT_TIMEOUT = 20
+PAYMENT_WAIT_RECHECK_INTERVAL = 2
+PAYMENT_MAX_WAITERS = int(os.environ.get('PAYMENT_MAX_WAITERS', int(os.environ.get('GUNICORN_THREADS', 20)) // 4))
+PAYMENT_WAIT_RETRY_AFTER = 2
+
+# Stripe webhook events are stored on receipt, and processed by the process_webhooks command with
+# WEBHOOK_WORKER_THREADS threads. Failed events are retried after WEBHOOK_RETRY_DELAY seconds, up to WEBHOOK_MAX_ATTEMPTS times.
+
+WEBHOOK_WORKER_THREADS = int(os.environ.get('WEBHOOK_WORKER_THREADS', 4))
+WEBHOOK_POLL_INTERVAL = 1
+WEBHOOK_RETRY_DELAY = 60
+WEBHOOK_MAX_ATTEMPTS = 5
@@ -0,0 +1,21 @@
+from django.test import SimpleTestCase
+from django.template import engines
+from issue_tracker.warmup import cached_loader, warm_templates
+
+
+class WarmTemplatesTestCase(SimpleTestCase):
+    '''
+    Tests for warming the cached template loader.
+    '''
+    def test_warm_templates_compiles_every_template(self):
+        '''
+        Every template should be in the cached loader after warming it, so rendering them doesn't read their files.
+        Tests run without DEBUG, so the default loaders include the cached loader.
+        '''
+        loader = cached_loader(engines['django'])
+        self.assertIsNotNone(loader)
+        loader.reset()
+        compiled = warm_templates()
+        self.assertGreater(compiled, 0)
+        self.assertIn('ticket_detail.html', loader.get_template_cache)
+        self.assertIn('registration/login_form.html', loader.get_template_cache)
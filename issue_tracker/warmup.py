@@ -0,0 +1,50 @@
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.utils import get_app_template_dirs
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(dirs):
+    '''
+    Yields the names of the templates in the template directories given.
+    '''
+    for template_dir in dirs:
+        for path, subdirs, files in os.walk(template_dir):
+            for filename in files:
+                yield os.path.relpath(os.path.join(path, filename), template_dir).replace(os.sep, '/')
+
+
+def cached_loader(engine):
+    '''
+    Returns a Django template engine's cached loader, which its loaders are wrapped in by default unless DEBUG is set,
+    or None if it doesn't have one.
+    '''
+    for loader in engine.engine.template_loaders:
+        if isinstance(loader, CachedLoader):
+            return loader
+    return None
+
+
+def warm_templates():
+    '''
+    Compiles every template, so the cached template loader has them all before the first request that renders them,
+    rather than the first requests to each page after a worker starts compiling their templates. Engines without a
+    cached loader are skipped, as they'd keep nothing. Returns the number of templates compiled.
+    '''
+    compiled = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates) or cached_loader(engine) is None:
+            continue
+        names = set(template_names(list(engine.engine.dirs) + list(get_app_template_dirs('templates'))))
+        for name in sorted(names):
+            try:
+                engine.get_template(name)
+                compiled += 1
+            # Not every file in a template directory is a template for this engine.
+            except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError) as error:
+                logger.debug('Skipped warming template %s: %s', name, error)
+    return compiled
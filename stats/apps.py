@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class StatsConfig(AppConfig):
     name = 'stats'
+
+    def ready(self):
+        import stats.signals  # noqa: F401
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from tickets.models import Ticket
+from stats.resolution import resolution_times
+
+# Figures shown on the index page. They're cached, and the cache is cleared by stats.signals whenever
+# a ticket or vote is saved or deleted, so in steady state the index page makes no aggregate queries.
+
+INDEX_STATS_CACHE_KEY = 'stats:index'
+
+
+def last_x_days(queryset, status, days):
+    '''
+    Function for filtering a queryset for a given status being set in the last X days.
+    '''
+    start_date = timezone.now().date() - timedelta(days=days)
+    return queryset.filter(**{status + '__date__gte': start_date})
+
+
+def interval_string(interval, limit=2):
+    '''
+    Converts a timedelta interval to a string of years, months, days, hours, minutes. Uses only largest results up to limit.
+    '''
+    intervals = (
+        ('year', timedelta(days=365).total_seconds()),
+        ('month', timedelta(days=30).total_seconds()),
+        # ('week', timedelta(days=7).total_seconds()),
+        ('day', timedelta(days=1).total_seconds()),
+        ('hour', timedelta(hours=1).total_seconds()),
+        ('minute', timedelta(minutes=1).total_seconds()),
+    )
+
+    seconds = interval.total_seconds()
+    result = []
+
+    for interval_name, interval_seconds in intervals:
+        if seconds >= interval_seconds:
+            count = seconds // interval_seconds
+            seconds %= interval_seconds
+            result.append('{:.0f} {}{}'.format(count, interval_name, 's' if count > 1 else ''))
+
+    return ' '.join(result[0:limit])
+
+
+def calculate_index_stats():
+    '''
+    Returns a dictionary of the index page figures, calculated from the tickets.
+    '''
+    stats = {}
+    stats['bugs_this_week'] = last_x_days(Ticket.objects.filter(status='done', ticket_type='Bug'), 'done', 7).count()
+    stats['features_coming_soon'] = Ticket.objects.filter(status='doing', ticket_type='Feature').count()
+    stats['total_features_implemented'] = Ticket.objects.filter(status='done', ticket_type='Feature').count()
+    # The median, as the mean is skewed by the few bugs that took much longer than the rest.
+    bug_times = resolution_times(Ticket.objects.filter(status='done', ticket_type='Bug'))[None]
+    if 'resolution' in bug_times:
+        stats['median_time_to_bugfix'] = interval_string(timedelta(seconds=bug_times['resolution']['median']))
+    try:
+        stats['most_requested_feature_url'] = Ticket.objects.filter(status__in=('approved', 'doing'), ticket_type='Feature') \
+            .order_by('-vote_total')[0].get_absolute_url()
+    except (IndexError, Ticket.DoesNotExist):
+        stats['most_requested_feature_url'] = None
+    return stats
+
+
+def get_index_stats():
+    '''
+    Returns the index page figures from the cache, calculating and caching them if they aren't there.
+    '''
+    stats = cache.get(INDEX_STATS_CACHE_KEY)
+    if stats is None:
+        stats = calculate_index_stats()
+        cache.set(INDEX_STATS_CACHE_KEY, stats, settings.INDEX_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def clear_index_stats():
+    '''
+    Clears the cached index page figures, so they're recalculated on the next request.
+    '''
+    cache.delete(INDEX_STATS_CACHE_KEY)
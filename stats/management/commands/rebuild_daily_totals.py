@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from stats import rollups
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds the daily totals used by the stats charts.
+    '''
+    help = 'Rebuilds the daily stats totals from the ticket, comment, pageview, vote, credit and debit tables.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rollups.rebuild()
+        self.stdout.write('Rebuilt {} daily totals.'.format(rows))
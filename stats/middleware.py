@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+import logging
+import time
+from stats.request_metrics import request_metrics, QueryBudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class TimedCursorWrapper(CursorWrapper):
+    '''
+    Cursor wrapper adding the SQL and time in seconds of each query executed through it to a list of queries.
+    '''
+    def __init__(self, cursor, db, queries):
+        super(TimedCursorWrapper, self).__init__(cursor, db)
+        self.queries = queries
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            self.queries.append({'sql': sql, 'time': time.perf_counter() - start})
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.queries.append({'sql': sql, 'time': time.perf_counter() - start})
+
+
+def time_queries(connection, queries):
+    '''
+    Wraps the cursors the connection makes in TimedCursorWrapper, adding the queries executed through them to a list.
+    Returns a function undoing it.
+    '''
+    originals = {}
+    for name in ('make_cursor', 'make_debug_cursor'):
+        originals[name] = connection.__dict__.get(name)
+        make = getattr(connection, name)
+        setattr(connection, name, lambda cursor, make=make: TimedCursorWrapper(make(cursor), connection, queries))
+
+    def undo():
+        for name, original in originals.items():
+            if original is None:
+                delattr(connection, name)
+            else:
+                setattr(connection, name, original)
+    return undo
+
+
+class RequestMetricsMiddleware(object):
+    '''
+    Middleware recording each request's wall time, number of queries, time spent in SQL and time spent rendering
+    its template response, by the name of the URL requested.
+    Queries are counted and timed by wrapping the cursors the connections make during the request, whether or not
+    DEBUG is on, without keeping Django's query log.
+
+    Requests to views with a query budget in settings.QUERY_BUDGETS making more queries than it are logged,
+    or raise QueryBudgetExceeded if settings.QUERY_BUDGETS_ENFORCED is set, as it is when running tests.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.template_render_ms = 0
+        queries = []
+        undos = [time_queries(connection, queries) for connection in connections.all()]
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000
+            for undo in undos:
+                undo()
+
+        if request.resolver_match is not None:
+            url_name = request.resolver_match.view_name
+            sql_ms = sum(query['time'] for query in queries) * 1000
+            request_metrics.record(url_name, wall_ms, len(queries), sql_ms, request.template_render_ms)
+            self.check_query_budget(url_name, queries)
+        return response
+
+    def process_template_response(self, request, response):
+        '''
+        Times the template response's rendering, which happens after all middleware has processed it.
+        '''
+        render_start = time.perf_counter()
+
+        def record_render_time(response):
+            request.template_render_ms = (time.perf_counter() - render_start) * 1000
+
+        response.add_post_render_callback(record_render_time)
+        return response
+
+    def check_query_budget(self, url_name, queries):
+        budget = settings.QUERY_BUDGETS.get(url_name)
+        if budget is None or len(queries) <= budget:
+            return
+        message = '{} made {} queries, over its budget of {}.'.format(url_name, len(queries), budget)
+        if settings.QUERY_BUDGETS_ENFORCED:
+            raise QueryBudgetExceeded(message + ' Queries:\n' + '\n'.join(query['sql'] for query in queries))
+        logger.warning(message)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 02:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+# Fills the daily totals as stats.rollups first aggregated them. The sources are kept here, rather than taken from
+# stats.rollups, so later changes there don't change this.
+
+
+def fill_daily_totals(apps, schema_editor):
+    '''
+    Fills the daily totals from the existing tickets, comments, pageviews, votes, credits and debits.
+    '''
+    DailyTotal = apps.get_model('stats', 'DailyTotal')
+    Ticket = apps.get_model('tickets', 'Ticket')
+    # metric: (queryset, aggregate giving its total, whether it's also kept per ticket)
+    sources = {
+        'bugs': (Ticket.objects.filter(ticket_type='Bug'), Count('id'), False),
+        'features': (Ticket.objects.filter(ticket_type='Feature'), Count('id'), False),
+        'comments': (apps.get_model('tickets', 'Comment').objects.all(), Count('id'), True),
+        'views': (apps.get_model('tickets', 'Pageview').objects.all(), Count('id'), True),
+        'votes': (apps.get_model('tickets', 'Vote').objects.all(), Sum('count'), True),
+        'sales': (apps.get_model('credits', 'Credit').objects.filter(real_value__gte=1), Sum('real_value'), False),
+        'refunds': (apps.get_model('credits', 'Debit').objects.filter(real_value__gte=1), Sum('real_value'), False),
+    }
+    rows = []
+    for metric, (queryset, total, per_ticket) in sources.items():
+        queryset = queryset.order_by().annotate(day=TruncDate('created'))
+        for group in (['day'], ['day', 'ticket']) if per_ticket else (['day'],):
+            for row in queryset.values(*group).annotate(total=total):
+                rows.append(DailyTotal(metric=metric, ticket_id=row.get('ticket'), date=row['day'], total=row['total']))
+    DailyTotal.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('tickets', '0013_ticket_search_index'),
+        ('credits', '0003_auto_20191020_1305'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('bugs', 'Bug reports'), ('features', 'Feature requests'), ('comments', 'Comments'), ('views', 'Views'), ('votes', 'Votes'), ('sales', 'Sales'), ('refunds', 'Refunds')], max_length=10)),
+                ('date', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tickets.Ticket')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='dailytotal',
+            index_together=set([('metric', 'ticket', 'date')]),
+        ),
+        migrations.RunPython(fill_daily_totals, migrations.RunPython.noop),
+    ]
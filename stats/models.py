@@ -1,3 +1,33 @@
 from django.db import models
+from tickets.models import Ticket
 
 # Create your models here.
+
+
+class DailyTotal(models.Model):
+    '''
+    Pre-aggregated daily total for a stats metric, either site wide (no ticket) or for a single ticket.
+    Maintained as events happen by stats.signals, and rebuilt from the source tables by the rebuild_daily_totals command.
+    '''
+    METRIC_CHOICES = (
+        ('bugs', 'Bug reports'),
+        ('features', 'Feature requests'),
+        ('comments', 'Comments'),
+        ('views', 'Views'),
+        ('votes', 'Votes'),
+        ('sales', 'Sales'),
+        ('refunds', 'Refunds'),
+    )
+
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES)
+    ticket = models.ForeignKey(Ticket, null=True, blank=True, on_delete=models.CASCADE)
+    date = models.DateField()
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        # Not unique, as concurrent events on a new day may each create a row, totals are summed when read.
+        index_together = [('metric', 'ticket', 'date')]
+
+    def __str__(self):
+        return '{} {} on {:%d/%m/%y}: {}'.format(self.get_metric_display(), 'for ticket {}'.format(self.ticket_id)
+                                                 if self.ticket_id else 'site wide', self.date, self.total)
@@ -0,0 +1,67 @@
+from collections import deque
+from django.conf import settings
+import threading
+
+# Costs of the most recent requests to each view, recorded by stats.middleware.RequestMetricsMiddleware.
+
+MEASURES = ('wall_ms', 'queries', 'sql_ms', 'template_ms')
+PERCENTILES = (50, 90, 99)
+
+
+class QueryBudgetExceeded(Exception):
+    '''
+    Raised when a request makes more queries than its view's budget, if budgets are enforced.
+    '''
+
+
+def percentile(values, n):
+    '''
+    Returns the nth percentile of a sorted list of values, by the nearest rank method.
+    '''
+    return values[max(int(round(n / 100 * len(values))) - 1, 0)]
+
+
+class RequestMetrics(object):
+    '''
+    Keeps the last window requests' wall time, query count, SQL time and template render time for each view,
+    and summarises them as percentiles.
+    '''
+    def __init__(self, window=None):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, url_name, wall_ms, queries, sql_ms, template_ms):
+        with self._lock:
+            if url_name not in self._samples:
+                self._samples[url_name] = deque(maxlen=self.window or settings.REQUEST_METRICS_WINDOW)
+            self._samples[url_name].append((wall_ms, queries, sql_ms, template_ms))
+
+    def samples(self, url_name):
+        '''
+        Returns a list of the recorded requests to a view, as dictionaries of each measure.
+        '''
+        with self._lock:
+            return [dict(zip(MEASURES, sample)) for sample in self._samples.get(url_name, ())]
+
+    def summary(self):
+        '''
+        Returns a dictionary of each view's number of recorded requests, and the percentiles of each measure.
+        '''
+        with self._lock:
+            samples = {url_name: list(view_samples) for url_name, view_samples in self._samples.items()}
+        summary = {}
+        for url_name, view_samples in samples.items():
+            summary[url_name] = {'requests': len(view_samples)}
+            for measure, values in zip(MEASURES, zip(*view_samples)):
+                values = sorted(values)
+                summary[url_name][measure] = dict(('p{}'.format(n), round(percentile(values, n), 2)) for n in PERCENTILES)
+                summary[url_name][measure]['max'] = round(values[-1], 2)
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+
+request_metrics = RequestMetrics()
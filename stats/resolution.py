@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+import numpy
+from tickets.models import Ticket, Label
+from stats.request_metrics import percentile
+
+# How long tickets take over each stage of their status, summarised by the mean, median and high percentiles, as a few
+# very old tickets skew the mean. The durations are worked out in the database as seconds, read straight from the
+# cursor into a NumPy array, and summarised a column at a time. The summaries shown on the all tickets stats page are
+# cached, and the cache is cleared by stats.signals whenever a ticket or its labels change.
+
+RESOLUTION_TIMES_CACHE_KEY = 'stats:resolution_times'
+# How many of the most used labels' tickets are summarised on the all tickets stats page.
+RESOLUTION_TIME_LABELS = 10
+
+# (name, verbose name, status date it starts from, status date it ends at)
+STAGES = (
+    ('approval', 'Approval', 'created', 'approved'),
+    ('start', 'Approval to starting', 'approved', 'doing'),
+    ('completion', 'Starting to done', 'doing', 'done'),
+    ('resolution', 'Total', 'created', 'done'),
+)
+PERCENTILES = (50, 90, 99)
+
+
+def seconds_between(connection, start, end):
+    '''
+    Returns SQL for the number of seconds between two of the tickets table's datetime columns, null if either is null.
+    '''
+    start, end = ('{}.{}'.format(connection.ops.quote_name(Ticket._meta.db_table), connection.ops.quote_name(column))
+                  for column in (start, end))
+    if connection.vendor == 'postgresql':
+        return 'CAST(EXTRACT(EPOCH FROM {} - {}) AS DOUBLE PRECISION)'.format(end, start)
+    else:
+        return '(JULIANDAY({}) - JULIANDAY({})) * 86400.0'.format(end, start)
+
+
+def fetch_rows(queryset):
+    '''
+    Returns a values_list queryset's rows as tuples straight from the cursor, without converting their values.
+    '''
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return []
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def summarise(durations):
+    '''
+    Returns the count, mean, median, 90th and 99th percentiles of a sorted array of durations in seconds.
+    '''
+    summary = {'count': len(durations), 'mean': float(numpy.mean(durations))}
+    for n in PERCENTILES:
+        summary['median' if n == 50 else 'p{}'.format(n)] = float(percentile(durations, n))
+    return summary
+
+
+def summarise_stages(durations):
+    '''
+    Returns summaries by stage of an array of each stage's duration by ticket, NaN for stages a ticket hasn't finished,
+    for the stages any of the tickets finished.
+    '''
+    summaries = {}
+    for (stage, verbose_name, start, end), column in zip(STAGES, durations.T):
+        column = numpy.sort(column[~numpy.isnan(column)])
+        if column.size:
+            summaries[stage] = summarise(column)
+    return summaries
+
+
+def resolution_times(queryset=None, group_by=None, total=False):
+    '''
+    Returns summaries by stage of how long the tickets in the queryset, all tickets by default, took over each stage.
+    Summaries are returned in a dictionary keyed by the values of group_by, a field of the tickets such as 'ticket_type'
+    or 'labels__name', or under None for all the tickets if it isn't given. If total is set, the summaries of all the
+    groups' tickets together are included under None too, which only makes sense if each ticket has one value of group_by.
+    '''
+    queryset = Ticket.objects.all() if queryset is None else queryset
+    connection = connections[queryset.db]
+    stages = [stage for stage, verbose_name, start, end in STAGES]
+    queryset = queryset.annotate(**{stage: RawSQL(seconds_between(connection, start, end), ())
+                                    for stage, verbose_name, start, end in STAGES})
+
+    if group_by is None:
+        rows = fetch_rows(queryset.order_by().values_list(*stages))
+        return {None: summarise_stages(numpy.array(rows, dtype=float).reshape(-1, len(stages)))}
+
+    rows = numpy.array(fetch_rows(queryset.order_by(group_by).values_list(group_by, *stages)), dtype=object)
+    rows = rows.reshape(-1, len(stages) + 1)
+    groups, durations = rows[:, 0], rows[:, 1:].astype(float)
+    # The rows are in order of their group, so each group's rows are those between where the group changes.
+    bounds = numpy.flatnonzero(groups[1:] != groups[:-1]) + 1
+    summaries = {group_rows[0]: summarise_stages(group_durations)
+                 for group_rows, group_durations in zip(numpy.split(groups, bounds), numpy.split(durations, bounds))
+                 if group_rows.size and group_rows[0] is not None}
+    if total:
+        summaries[None] = summarise_stages(durations)
+    return summaries
+
+
+def calculate_grouped_resolution_times():
+    '''
+    Returns a list of the names and summaries by stage of all tickets, each ticket type and the most used labels,
+    with empty summaries for types and labels without tickets.
+    '''
+    labels = list(Label.objects.annotate(tickets=Count('ticket')).order_by('-tickets', 'name')[:RESOLUTION_TIME_LABELS])
+    by_type = resolution_times(group_by='ticket_type', total=True)
+    by_label = resolution_times(Ticket.objects.filter(labels__in=labels), group_by='labels__name')
+    return [('All tickets', by_type[None])] + \
+        [(noun, by_type.get(ticket_type, {})) for ticket_type, noun in Ticket.TICKET_TYPE_CHOICES] + \
+        [(label.name, by_label.get(label.name, {})) for label in labels]
+
+
+def get_grouped_resolution_times():
+    '''
+    Returns the grouped summaries from the cache, calculating and caching them if they aren't there.
+    '''
+    groups = cache.get(RESOLUTION_TIMES_CACHE_KEY)
+    if groups is None:
+        groups = calculate_grouped_resolution_times()
+        cache.set(RESOLUTION_TIMES_CACHE_KEY, groups, settings.RESOLUTION_TIMES_CACHE_TIMEOUT)
+    return groups
+
+
+def clear_resolution_times():
+    '''
+    Clears the cached grouped summaries, so they're recalculated on the next request.
+    '''
+    cache.delete(RESOLUTION_TIMES_CACHE_KEY)
@@ -0,0 +1,101 @@
+from collections import Counter
+from django.apps import apps as django_apps
+from django.db.models import F, Q, Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from stats.models import DailyTotal
+
+# Daily totals for the stats charts. Each event adds to the site wide row for its metric and day, and to the
+# ticket's row if it belongs to one, so reading a chart only touches a row per day in the range.
+
+TICKET_TYPE_METRICS = {'Bug': 'bugs', 'Feature': 'features'}
+
+
+def add(metric, day, amount, ticket_id=None, using='default'):
+    '''
+    Adds an amount to the daily totals of a metric for a day, site wide and for the ticket if given.
+    '''
+    for row_ticket_id in ([None, ticket_id] if ticket_id else [None]):
+        add_to_row(metric, day, amount, row_ticket_id, using)
+
+
+def add_to_row(metric, day, amount, ticket_id=None, using='default'):
+    '''
+    Adds an amount to a single daily total, the site wide one unless a ticket is given, creating it if needed.
+    '''
+    updated = DailyTotal.objects.using(using).filter(metric=metric, ticket_id=ticket_id, date=day) \
+        .update(total=F('total') + amount)
+    if not updated:
+        DailyTotal.objects.using(using).create(metric=metric, ticket_id=ticket_id, date=day, total=amount)
+
+
+def subtract(metric, day, amount, ticket_id=None, using='default'):
+    '''
+    Takes an amount off the daily totals of a metric for a day. Rows are never created here, as a ticket's own rows
+    may already have been deleted along with it.
+    '''
+    DailyTotal.objects.using(using).filter(Q(ticket=None) | Q(ticket_id=ticket_id), metric=metric, date=day) \
+        .update(total=F('total') - amount)
+
+
+def add_pageviews(pageviews, using='default'):
+    '''
+    Adds a batch of pageviews to the daily view totals, with a single write to the site wide total for each day,
+    and to each ticket's for each day.
+    '''
+    ticket_views = Counter((view.ticket_id, timezone.localdate(view.created)) for view in pageviews)
+    day_views = Counter()
+    for (ticket_id, day), views in ticket_views.items():
+        day_views[day] += views
+    for day, views in day_views.items():
+        add_to_row('views', day, views, using=using)
+    for (ticket_id, day), views in ticket_views.items():
+        add_to_row('views', day, views, ticket_id, using)
+
+
+def daily_totals(metric, ticket=None, start=None, end=None):
+    '''
+    Returns a list of {'date': 'YYYY-MM-DD', 'total': n} for each day with a total for the metric between the dates,
+    site wide or for the given ticket.
+    '''
+    queryset = DailyTotal.objects.filter(metric=metric, ticket=ticket)
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    return [{'date': row['date'].isoformat(), 'total': row['total']}
+            for row in queryset.values('date').annotate(total=Sum('total')).order_by('date')]
+
+
+def metric_sources(apps):
+    '''
+    Returns the querysets each metric is counted from, the aggregate giving its total, and whether it is also kept per ticket.
+    '''
+    Ticket = apps.get_model('tickets', 'Ticket')
+    return {
+        'bugs': (Ticket.objects.filter(ticket_type='Bug'), Count('id'), False),
+        'features': (Ticket.objects.filter(ticket_type='Feature'), Count('id'), False),
+        'comments': (apps.get_model('tickets', 'Comment').objects.all(), Count('id'), True),
+        'views': (apps.get_model('tickets', 'Pageview').objects.all(), Count('id'), True),
+        'votes': (apps.get_model('tickets', 'Vote').objects.all(), Sum('count'), True),
+        'sales': (apps.get_model('credits', 'Credit').objects.filter(real_value__gte=1), Sum('real_value'), False),
+        'refunds': (apps.get_model('credits', 'Debit').objects.filter(real_value__gte=1), Sum('real_value'), False),
+    }
+
+
+def rebuild(apps=django_apps):
+    '''
+    Replaces all daily totals with ones aggregated from the source tables. Returns the number of rows written.
+    Should be run in a transaction.
+    '''
+    DailyTotal = apps.get_model('stats', 'DailyTotal')
+    rows = []
+    for metric, (queryset, total, per_ticket) in metric_sources(apps).items():
+        queryset = queryset.order_by().annotate(day=TruncDate('created'))
+        for group in (['day'], ['day', 'ticket']) if per_ticket else (['day'],):
+            for row in queryset.values(*group).annotate(total=total):
+                rows.append(DailyTotal(metric=metric, ticket_id=row.get('ticket'), date=row['day'], total=row['total']))
+
+    DailyTotal.objects.all().delete()
+    DailyTotal.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,100 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from tickets.models import Ticket, Label, Pageview, Vote, Comment
+from tickets.signals import pageviews_flushed
+from credits.models import Credit, Debit
+from stats import rollups, dashboard, resolution
+from stats.models import DailyTotal
+
+
+@receiver(post_save, sender=Ticket)
+def total_ticket(sender, instance, created, raw, using, **kwargs):
+    if created and not raw and instance.ticket_type in rollups.TICKET_TYPE_METRICS:
+        rollups.add(rollups.TICKET_TYPE_METRICS[instance.ticket_type], timezone.localdate(instance.created), 1, using=using)
+
+
+@receiver(pre_delete, sender=Ticket)
+def untotal_ticket_pageviews(sender, instance, using, **kwargs):
+    # A ticket's pageviews are bulk deleted with it, without signals, so its view totals are taken off the
+    # site wide ones here, before its own rows are deleted.
+    for day, views in DailyTotal.objects.using(using).filter(metric='views', ticket=instance).values_list('date', 'total'):
+        rollups.subtract('views', day, views, using=using)
+
+
+@receiver(post_delete, sender=Ticket)
+def untotal_ticket(sender, instance, using, **kwargs):
+    if instance.ticket_type in rollups.TICKET_TYPE_METRICS:
+        rollups.subtract(rollups.TICKET_TYPE_METRICS[instance.ticket_type], timezone.localdate(instance.created), 1, using=using)
+
+
+@receiver(post_save, sender=Pageview)
+def total_pageview(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        rollups.add('views', timezone.localdate(instance.created), 1, instance.ticket_id, using)
+
+
+@receiver(pageviews_flushed, sender=Pageview)
+def total_pageviews(sender, pageviews, **kwargs):
+    rollups.add_pageviews(pageviews)
+
+
+@receiver(post_save, sender=Vote)
+def total_vote(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        rollups.add('votes', timezone.localdate(instance.created), instance.count, instance.ticket_id, using)
+
+
+@receiver(post_delete, sender=Vote)
+def untotal_vote(sender, instance, using, **kwargs):
+    rollups.subtract('votes', timezone.localdate(instance.created), instance.count, instance.ticket_id, using)
+
+
+@receiver(post_save, sender=Comment)
+def total_comment(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        rollups.add('comments', timezone.localdate(instance.created), 1, instance.ticket_id, using)
+
+
+@receiver(post_delete, sender=Comment)
+def untotal_comment(sender, instance, using, **kwargs):
+    rollups.subtract('comments', timezone.localdate(instance.created), 1, instance.ticket_id, using)
+
+
+# Only transactions with a real value count towards sales and refunds, as in the rest of the stats.
+
+@receiver(post_save, sender=Credit)
+def total_sale(sender, instance, created, raw, using, **kwargs):
+    if created and not raw and instance.real_value >= 1:
+        rollups.add('sales', timezone.localdate(instance.created), instance.real_value, using=using)
+
+
+@receiver(post_save, sender=Debit)
+def total_refund(sender, instance, created, raw, using, **kwargs):
+    if created and not raw and instance.real_value >= 1:
+        rollups.add('refunds', timezone.localdate(instance.created), instance.real_value, using=using)
+
+
+# The index page stats depend on tickets' statuses and votes.
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def clear_index_stats(sender, using, **kwargs):
+    # Cleared again on commit, in case another request recalculates them from the old data before then.
+    dashboard.clear_index_stats()
+    transaction.on_commit(dashboard.clear_index_stats, using)
+
+
+# The resolution times depend on tickets' status dates and types, and their labels.
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+@receiver(post_save, sender=Label)
+@receiver(post_delete, sender=Label)
+@receiver(m2m_changed, sender=Ticket.labels.through)
+def clear_resolution_times(sender, using, **kwargs):
+    resolution.clear_resolution_times()
+    transaction.on_commit(resolution.clear_resolution_times, using)
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from tickets.models import Ticket
+from stats.request_metrics import RequestMetrics, QueryBudgetExceeded, request_metrics
+
+
+class RequestMetricsTestCase(TestCase):
+    '''
+    Class to test request metrics are summarised as percentiles over a rolling window.
+    '''
+    def test_summary_percentiles(self):
+        '''
+        The summary should give the number of requests, and percentiles and maximum of each measure, for each view.
+        '''
+        metrics = RequestMetrics(window=100)
+        for n in range(1, 101):
+            metrics.record('ticket', wall_ms=n, queries=n % 10, sql_ms=n / 2, template_ms=0)
+
+        summary = metrics.summary()['ticket']
+
+        self.assertEqual(100, summary['requests'])
+        self.assertEqual({'p50': 50, 'p90': 90, 'p99': 99, 'max': 100}, summary['wall_ms'])
+        self.assertEqual(9, summary['queries']['max'])
+        self.assertEqual(25, summary['sql_ms']['p50'])
+
+    def test_only_window_kept(self):
+        '''
+        Only the most recent requests up to the window size should be kept for each view.
+        '''
+        metrics = RequestMetrics(window=3)
+        for n in range(5):
+            metrics.record('ticket', wall_ms=n, queries=n, sql_ms=0, template_ms=0)
+
+        self.assertEqual([2, 3, 4], [sample['queries'] for sample in metrics.samples('ticket')])
+
+
+class RequestMetricsMiddlewareTestCase(TestCase):
+    '''
+    Class to test the middleware records what each request costs, and enforces query budgets.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+        cls.staff_user = User.objects.create_user(username='StaffUser', email='staff@test.com',
+                                                  password='tH1$isA7357', is_staff=True)
+
+        cls.test_ticket = Ticket.objects.create(user=cls.test_user, title='Test ticket', content='Test content')
+        cls.test_ticket.set_status('approved')
+
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+
+    def test_requests_recorded_by_url_name(self):
+        '''
+        Each request should be recorded under its URL's name, with the queries it made and time rendering its template.
+        '''
+        self.client.get('/')
+        self.client.get('/tickets/{}/'.format(self.test_ticket.id))
+        self.client.get('/tickets/{}/'.format(self.test_ticket.id))
+
+        self.assertEqual(1, len(request_metrics.samples('index')))
+        ticket_samples = request_metrics.samples('ticket')
+        self.assertEqual(2, len(ticket_samples))
+        for sample in ticket_samples:
+            self.assertGreater(sample['queries'], 0)
+            self.assertGreater(sample['template_ms'], 0)
+            self.assertGreaterEqual(sample['wall_ms'], sample['template_ms'])
+
+    def test_queries_counted_without_query_log(self):
+        '''
+        Queries should be counted and timed without Django's query log, which should be left as it was.
+        '''
+        query_log = list(connection.queries_log)
+        self.client.get('/')
+
+        self.assertGreater(request_metrics.samples('index')[0]['queries'], 0)
+        self.assertEqual(query_log, list(connection.queries_log))
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_unresolved_requests_not_recorded(self):
+        '''
+        Requests not matching a URL should not be recorded.
+        '''
+        self.client.get('/not-a-page/')
+
+        self.assertEqual({}, request_metrics.summary())
+
+    @override_settings(QUERY_BUDGETS={'index': 0}, QUERY_BUDGETS_ENFORCED=True)
+    def test_query_budget_enforced(self):
+        '''
+        Requests making more queries than their view's budget should raise an error when budgets are enforced.
+        '''
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/')
+
+    def test_query_budgets_enforced_when_testing(self):
+        '''
+        The test runner should enforce the query budgets.
+        '''
+        self.assertTrue(settings.QUERY_BUDGETS_ENFORCED)
+
+    @override_settings(QUERY_BUDGETS={'index': 0}, QUERY_BUDGETS_ENFORCED=False)
+    def test_query_budget_logged(self):
+        '''
+        Requests making more queries than their view's budget should log a warning when budgets are not enforced.
+        '''
+        with self.assertLogs('stats.middleware', 'WARNING') as logs:
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('over its budget of 0', logs.output[0])
+
+    def test_request_metrics_view_staff_only(self):
+        '''
+        The request metrics should only be accessible to staff users, as json including each view's query budget.
+        '''
+        response = self.client.get('/stats/requests/')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username='TestUser', password='tH1$isA7357')
+        response = self.client.get('/stats/requests/')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username='StaffUser', password='tH1$isA7357')
+        self.client.get('/')
+        response = self.client.get('/stats/requests/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, response.json()['index']['requests'])
+        self.assertEqual(10, response.json()['index']['query_budget'])
@@ -0,0 +1,122 @@
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import timedelta
+from tickets.models import Ticket, Label
+from stats.resolution import resolution_times, summarise, get_grouped_resolution_times
+
+DAY = timedelta(days=1).total_seconds()
+
+
+class ResolutionTimesTestCase(TestCase):
+    '''
+    Tests for the resolution time analytics.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com', password='tH1$isA7357')
+        cls.label = Label.objects.create(name='Label')
+        now = timezone.now()
+        # Bugs done after 1 to 10 days, each approved a day after it was created and started a day before it was done.
+        for n in range(1, 11):
+            ticket = Ticket.objects.create(user=cls.test_user, title='Bug {}'.format(n), content='Test', ticket_type='Bug')
+            ticket.created = now - timedelta(days=n)
+            ticket.approved = now - timedelta(days=n - 1)
+            ticket.doing = now - timedelta(days=1)
+            ticket.done = now
+            ticket.save()
+            if n % 2 == 0:
+                ticket.labels.add(cls.label)
+        # A feature approved after 2 days, and not yet started.
+        ticket = Ticket.objects.create(user=cls.test_user, title='Feature', content='Test', ticket_type='Feature')
+        ticket.created = now - timedelta(days=2)
+        ticket.approved = now
+        ticket.save()
+        # A bug awaiting approval.
+        Ticket.objects.create(user=cls.test_user, title='Awaiting', content='Test', ticket_type='Bug')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_summarise(self):
+        '''
+        Summaries should have the count, mean and nearest rank median and percentiles of the durations.
+        '''
+        summary = summarise([float(n) for n in range(1, 101)])
+        self.assertEqual({'count': 100, 'mean': 50.5, 'median': 50, 'p90': 90, 'p99': 99}, summary)
+
+    def test_resolution_times_of_all_tickets(self):
+        '''
+        Each stage should be summarised from the tickets that have finished it.
+        '''
+        summaries = resolution_times()[None]
+        self.assertEqual(11, summaries['approval']['count'])
+        self.assertEqual(10, summaries['resolution']['count'])
+        self.assertAlmostEqual(5.5 * DAY, summaries['resolution']['mean'], delta=1)
+        self.assertAlmostEqual(5 * DAY, summaries['resolution']['median'], delta=1)
+        self.assertAlmostEqual(9 * DAY, summaries['resolution']['p90'], delta=1)
+        self.assertAlmostEqual(10 * DAY, summaries['resolution']['p99'], delta=1)
+        self.assertAlmostEqual(DAY, summaries['completion']['median'], delta=1)
+
+    def test_resolution_times_by_ticket_type(self):
+        '''
+        Grouping by ticket type should summarise each type's tickets, leaving out stages none of them have finished.
+        '''
+        summaries = resolution_times(group_by='ticket_type')
+        self.assertEqual({'Bug', 'Feature'}, set(summaries))
+        self.assertEqual(10, summaries['Bug']['resolution']['count'])
+        self.assertEqual({'approval'}, set(summaries['Feature']))
+        self.assertAlmostEqual(2 * DAY, summaries['Feature']['approval']['mean'], delta=1)
+
+    def test_resolution_times_by_ticket_type_with_total(self):
+        '''
+        The total should summarise all the groups' tickets together.
+        '''
+        summaries = resolution_times(group_by='ticket_type', total=True)
+        self.assertEqual(resolution_times()[None], summaries[None])
+
+    def test_resolution_times_by_label(self):
+        '''
+        Grouping by label should summarise each label's tickets, leaving out tickets without labels.
+        '''
+        summaries = resolution_times(group_by='labels__name')
+        self.assertEqual({'Label'}, set(summaries))
+        self.assertEqual(5, summaries['Label']['resolution']['count'])
+        self.assertAlmostEqual(6 * DAY, summaries['Label']['resolution']['mean'], delta=1)
+
+    def test_resolution_times_of_queryset(self):
+        '''
+        Only the tickets in the queryset given should be summarised.
+        '''
+        summaries = resolution_times(Ticket.objects.filter(ticket_type='Feature'))[None]
+        self.assertEqual(1, summaries['approval']['count'])
+        self.assertEqual({}, resolution_times(Ticket.objects.none())[None])
+
+    def test_grouped_resolution_times(self):
+        '''
+        The grouped summaries should be of all tickets, each ticket type and the labels, in that order.
+        '''
+        groups = get_grouped_resolution_times()
+        self.assertEqual(['All tickets', 'Bug Report', 'Feature Request', 'Label'], [name for name, summaries in groups])
+        self.assertEqual(resolution_times()[None], groups[0][1])
+
+    def test_grouped_resolution_times_cached(self):
+        '''
+        The grouped summaries should be cached, so no tickets are queried once they have been calculated.
+        '''
+        get_grouped_resolution_times()
+        with self.assertNumQueries(0):
+            get_grouped_resolution_times()
+
+    def test_grouped_resolution_times_recalculated(self):
+        '''
+        The cached grouped summaries should be recalculated when a ticket's status or labels change.
+        '''
+        self.assertEqual(10, get_grouped_resolution_times()[0][1]['resolution']['count'])
+        ticket = Ticket.objects.get(title='Feature')
+        ticket.doing = ticket.done = timezone.now()
+        ticket.save()
+        self.assertEqual(11, get_grouped_resolution_times()[0][1]['resolution']['count'])
+        ticket.labels.add(self.label)
+        self.assertEqual(6, get_grouped_resolution_times()[3][1]['resolution']['count'])
@@ -0,0 +1,135 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+from datetime import timedelta
+from tickets.models import Ticket, Comment, Vote, Pageview
+from tickets.pageviews import PageviewRecorder
+from credits.models import Wallet
+from stats.models import DailyTotal
+from stats.rollups import daily_totals, add_pageviews
+
+
+class DailyTotalsTestCase(TestCase):
+    '''
+    Class to test daily totals are kept up to date as events happen, and can be rebuilt.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+        cls.wallet = Wallet.objects.create(user=cls.test_user)
+
+        cls.test_ticket = Ticket.objects.create(user=cls.test_user, title='Test ticket', content='Test content', ticket_type='Feature')
+        cls.other_ticket = Ticket.objects.create(user=cls.test_user, title='Other ticket', content='Test content', ticket_type='Bug')
+
+    def setUp(self):
+        self.today = timezone.localdate().isoformat()
+
+    def test_events_added_to_site_wide_and_ticket_totals(self):
+        '''
+        Tickets, comments, pageviews and votes should be added to the day's site wide totals,
+        and the ticket's totals for comments, pageviews and votes.
+        '''
+        for ticket in (self.test_ticket, self.other_ticket):
+            Pageview.objects.create(ticket=ticket)
+            Comment.objects.create(user=self.test_user, ticket=ticket, content='Test comment')
+        Vote.objects.create(user=self.test_user, ticket=self.test_ticket, count=5)
+
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('bugs'))
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('features'))
+        self.assertEqual([{'date': self.today, 'total': 2}], daily_totals('comments'))
+        self.assertEqual([{'date': self.today, 'total': 2}], daily_totals('views'))
+        self.assertEqual([{'date': self.today, 'total': 5}], daily_totals('votes'))
+
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('comments', self.test_ticket))
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('views', self.other_ticket))
+        self.assertEqual([], daily_totals('votes', self.other_ticket))
+
+    def test_flushed_pageviews_added_to_totals(self):
+        '''
+        Pageviews written in a batch by the pageview recorder should be added to the totals.
+        '''
+        recorder = PageviewRecorder(batch_size=10, flush_interval=60)
+        for n in range(3):
+            recorder.record(self.test_ticket)
+        recorder.record(self.other_ticket)
+        recorder.flush()
+
+        self.assertEqual([{'date': self.today, 'total': 4}], daily_totals('views'))
+        self.assertEqual([{'date': self.today, 'total': 3}], daily_totals('views', self.test_ticket))
+
+    def test_pageviews_written_once_per_total(self):
+        '''
+        A batch of pageviews should be added with one write to the day's site wide total, and one to each ticket's.
+        '''
+        now = timezone.now()
+        pageviews = [Pageview(ticket=ticket, created=now) for ticket in (self.test_ticket, self.other_ticket) * 5]
+        add_pageviews(pageviews)
+        with self.assertNumQueries(3):
+            add_pageviews(pageviews)
+
+        self.assertEqual([{'date': self.today, 'total': 20}], daily_totals('views'))
+        self.assertEqual([{'date': self.today, 'total': 10}], daily_totals('views', self.other_ticket))
+
+    def test_transactions_with_real_value_added_to_totals(self):
+        '''
+        Credits and debits with a real value should be added to the sales and refunds totals.
+        '''
+        self.wallet.credit(10, 100)
+        self.wallet.credit(5)
+        self.wallet.debit(5, 50)
+        self.wallet.debit(5)
+
+        self.assertEqual([{'date': self.today, 'total': 100}], daily_totals('sales'))
+        self.assertEqual([{'date': self.today, 'total': 50}], daily_totals('refunds'))
+
+    def test_deletes_taken_off_totals(self):
+        '''
+        Deleting comments, votes and tickets should take them off the totals, including a deleted ticket's pageviews.
+        '''
+        comment = Comment.objects.create(user=self.test_user, ticket=self.test_ticket, content='Test comment')
+        Vote.objects.create(user=self.test_user, ticket=self.test_ticket, count=5).delete()
+        Pageview.objects.create(ticket=self.test_ticket)
+        Pageview.objects.create(ticket=self.other_ticket)
+        comment.delete()
+
+        self.assertEqual([{'date': self.today, 'total': 0}], daily_totals('comments', self.test_ticket))
+        self.assertEqual([{'date': self.today, 'total': 0}], daily_totals('votes'))
+
+        Ticket.objects.get(id=self.other_ticket.id).delete()
+
+        self.assertEqual([{'date': self.today, 'total': 0}], daily_totals('bugs'))
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('views'))
+
+    def test_totals_filtered_by_date(self):
+        '''
+        Only totals between the start and end dates should be returned.
+        '''
+        for days in range(5):
+            DailyTotal.objects.create(metric='views', date=timezone.localdate() - timedelta(days=days), total=days)
+
+        results = daily_totals('views', start=timezone.localdate() - timedelta(days=3), end=timezone.localdate() - timedelta(days=1))
+
+        self.assertEqual([3, 2, 1], [result['total'] for result in results])
+
+    def test_rebuild_daily_totals(self):
+        '''
+        The rebuild_daily_totals command should replace the totals with ones aggregated from the source tables.
+        '''
+        vote = Vote.objects.create(user=self.test_user, ticket=self.test_ticket, count=5)
+        vote.created = timezone.now() - timedelta(days=2)
+        vote.save()
+        Pageview.objects.create(ticket=self.test_ticket)
+        DailyTotal.objects.create(metric='views', date=timezone.localdate(), total=100)
+
+        out = StringIO()
+        call_command('rebuild_daily_totals', stdout=out)
+        self.assertIn('Rebuilt 6 daily totals.', out.getvalue())
+
+        two_days_ago = (timezone.localdate() - timedelta(days=2)).isoformat()
+        self.assertEqual([{'date': two_days_ago, 'total': 5}], daily_totals('votes'))
+        self.assertEqual([{'date': two_days_ago, 'total': 5}], daily_totals('votes', self.test_ticket))
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('views'))
+        self.assertEqual([{'date': self.today, 'total': 1}], daily_totals('bugs'))
@@ -1,104 +1,18 @@
 from django.test import TestCase, RequestFactory
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from django.db.models import Sum, Max
 from datetime import timedelta, datetime, date
-from tickets.models import Ticket, Comment, Vote, Pageview
+from tickets.models import Ticket, Comment, Vote, Pageview, Label
 from credits.models import Credit, Debit
-from stats.views import interval_string, filter_date_range, annotate_date, RoadmapView, DateRangeMixin
+from stats.views import DateRangeMixin
+from stats.dashboard import interval_string
 from stats.forms import DateRangeForm
 import json
 
 
-class FilterDateRangeTestCase(TestCase):
-    '''
-    Tests for filter_date_range.
-    '''
-    @classmethod
-    def setUpTestData(cls):
-        test_user = User.objects.create_user(username='TestUser', email='test@test.com',
-                                             password='tH1$isA7357')
-        test_user.save()
-
-        for day in range(45):
-            daily_ticket = Ticket.objects.create(user=test_user, title='Day {}'.format(day), content='Test ticket')
-            daily_ticket.created = timezone.now() - timedelta(days=60 - day)
-            daily_ticket.approved = timezone.now() - timedelta(days=45 - day)
-            daily_ticket.save()
-
-    def test_returns_objects_after_start_date(self):
-        '''
-        The function should return a queryset comprising of only objects for which the selected status is on or after the start date.
-        '''
-        self.assertQuerysetEqual(filter_date_range(Ticket.objects.all(), 'created', start=timezone.now() - timedelta(days=20)),
-                                 Ticket.objects.filter(created__date__gte=timezone.now() - timedelta(days=20)),
-                                 transform=lambda x: x)
-
-    def test_returns_objects_before_end_date(self):
-        '''
-        The function should return a queryset comprising of only objects for which the selected status is on or before the end date.
-        '''
-        self.assertQuerysetEqual(filter_date_range(Ticket.objects.all(), 'created', end=timezone.now() - timedelta(days=20)),
-                                 Ticket.objects.filter(created__date__lte=timezone.now() - timedelta(days=20)),
-                                 transform=lambda x: x)
-
-    def test_returns_objects_between_start_and_end_date(self):
-        '''
-        The function should return objects between the start and end date.
-        '''
-        self.assertQuerysetEqual(filter_date_range(Ticket.objects.all(), 'created', start=timezone.now() - timedelta(days=30),
-                                                   end=timezone.now() - timedelta(days=20)),
-                                 Ticket.objects.filter(created__date__gte=timezone.now() - timedelta(days=30),
-                                                       created__date__lte=timezone.now() - timedelta(days=20)),
-                                 transform=lambda x: x)
-
-    def test_no_start_or_end(self):
-        '''
-        If no start or end date is set the function should return the same queryset.
-        '''
-        self.assertQuerysetEqual(filter_date_range(Ticket.objects.all(), 'created'),
-                                 Ticket.objects.all(),
-                                 transform=lambda x: x)
-
-    def test_filters_using_named_field(self):
-        '''
-        The function filters using the named status field.
-        '''
-        self.assertQuerysetEqual(filter_date_range(Ticket.objects.all(), 'approved', start=timezone.now() - timedelta(days=20)),
-                                 Ticket.objects.filter(approved__date__gte=timezone.now() - timedelta(days=20)),
-                                 transform=lambda x: x)
-
-
-class AnnotateDateTestCase(TestCase):
-    '''
-    Adds rounded date annotation based off specified date field.
-    '''
-
-    @classmethod
-    def setUpTestData(cls):
-        test_user = User.objects.create_user(username='TestUser', email='test@test.com',
-                                             password='tH1$isA7357')
-        test_user.save()
-
-        for hour in range(12):
-            hourly_ticket = Ticket.objects.create(user=test_user, title='Test ticket', content='Test ticket')
-            hourly_ticket.created = hourly_ticket.created.replace(hour=hour)
-            hourly_ticket.save()
-
-    def test_adds_date_annotation(self):
-        '''
-        Function should add rounded date annotation based off specified date field.
-        '''
-        self.assertRegex(annotate_date(Ticket.objects.all(), 'created')[0].date, '^[0-9]{4}-[0-9]{2}-[0-9]{2}$')
-
-    def test_dates_same_day(self):
-        '''
-        Function should create date values for objects on the same day that are identical. This test is because PostgreSQL
-        returns full datetimes, as opposed to just the dates returned by SQLite.
-        '''
-        self.assertEqual(annotate_date(Ticket.objects.all(), 'created')[0].date, annotate_date(Ticket.objects.all(), 'created')[11].date)
-
-
 class IntervalStringTestCase(TestCase):
     '''
     Tests for interval string function, which composes a string.
@@ -139,6 +53,9 @@ class TestIndexTestCase(TestCase):
                                                  password='tH1$isA7357')
         cls.test_user.save()
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_index(self):
         '''
         The index page should return 200 and use the index.html template.
@@ -204,29 +121,58 @@ class TestIndexTestCase(TestCase):
         response = self.client.get('/')
         self.assertEqual(popular_feature.get_absolute_url(), response.context['most_requested_feature_url'])
 
+    def test_index_has_median_time_to_bugfix(self):
+        '''
+        The index page should show the median time taken to fix bugs, unskewed by the few that took much longer.
+        '''
+        response = self.client.get('/')
+        self.assertNotIn('median_time_to_bugfix', response.context)
 
-class TestDateRangeMixin(TestCase):
-    '''
-    Class to test the date range mixin.
-    '''
-    @classmethod
-    def setUpTestData(cls):
-        test_user = User.objects.create_user(username='TestUser', email='test@test.com',
-                                             password='tH1$isA7357')
-        test_user.save()
+        for days in (1, 2, 2, 3, 300):
+            done_bug = Ticket.objects.create(user=self.test_user, title='Test ticket', content='Test ticket', ticket_type='Bug')
+            done_bug.created = timezone.now() - timedelta(days=days)
+            done_bug.done = timezone.now()
+            done_bug.save()
 
-        voting_user = User.objects.create_user(username='VotingUser', email='test@test.com',
-                                               password='tH1$isA7357')
-        voting_user.save()
+        response = self.client.get('/')
+        self.assertEqual('2 days', response.context['median_time_to_bugfix'])
 
-        ticket = Ticket.objects.create(user=test_user, title='Test Ticket', content='Test ticket', ticket_type="Feature")
+    def test_index_stats_cached(self):
+        '''
+        The index page stats should be cached, so no tickets are queried once they have been calculated.
+        '''
+        self.client.get('/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/')
+        self.assertFalse(any('tickets_ticket' in query['sql'] for query in queries))
 
-        for n in range(7):
-            for i in range(n + 1):
-                vote = Vote.objects.create(user=voting_user, ticket=ticket, count=n + 1)
-                vote.created = timezone.make_aware(datetime(2019, 1, 1) + timedelta(days=n), timezone=timezone.get_current_timezone())
-                vote.save()
+    def test_index_stats_cleared_by_status_and_votes(self):
+        '''
+        The cached index page stats should be recalculated when tickets are added, their status is set, or they are voted for.
+        '''
+        response = self.client.get('/')
+        self.assertEqual(0, response.context['features_coming_soon'])
+        self.assertIsNone(response.context['most_requested_feature_url'])
 
+        feature = Ticket.objects.create(user=self.test_user, title='Test ticket', content='Test ticket', ticket_type='Feature')
+        feature.set_status('doing')
+
+        response = self.client.get('/')
+        self.assertEqual(1, response.context['features_coming_soon'])
+        self.assertEqual(feature.get_absolute_url(), response.context['most_requested_feature_url'])
+
+        other_feature = Ticket.objects.create(user=self.test_user, title='Other ticket', content='Test ticket', ticket_type='Feature')
+        other_feature.set_status('approved')
+        Vote.objects.create(user=self.test_user, ticket=other_feature, count=10)
+
+        response = self.client.get('/')
+        self.assertEqual(other_feature.get_absolute_url(), response.context['most_requested_feature_url'])
+
+
+class TestDateRangeMixin(TestCase):
+    '''
+    Class to test the date range mixin.
+    '''
     def setUp(self):
         self.factory = RequestFactory()
         self.view = DateRangeMixin()
@@ -259,55 +205,6 @@ class TestDateRangeMixin(TestCase):
         self.assertEqual(date(2019, 1, 1), self.view.form.cleaned_data['start_date'])
         self.assertTrue(date(2019, 2, 1), self.view.form.cleaned_data['end_date'])
 
-    def test_get_date_range_and_annotate_returns_list(self):
-        '''
-        The get_date_range_and_annotate method returns a list of dates and totals for that date range.
-        '''
-        self.view.request = self.factory.get('/date-range/?start_date=2019-01-01&end_date=2019-01-03')
-        self.view.get_form_kwargs()
-        results = self.view.get_date_range_and_annotate(Vote.objects.all())
-
-        self.assertIn({'date': '2019-01-01', 'total': 1}, results)
-        self.assertIn({'date': '2019-01-02', 'total': 2}, results)
-        self.assertIn({'date': '2019-01-03', 'total': 3}, results)
-        self.assertTrue(all(map(lambda result: result['date'] >= '2019-01-01' and result['date'] <= '2019-01-03', results)))
-
-    def test_get_date_range_and_annotate_total_returns_list(self):
-        '''
-        The get_date_range_and_annotate method returns a list of dates and totals for that date range, with total calculated using the prescribed method.
-        '''
-        self.view.request = self.factory.get('/date-range/?start_date=2019-01-01&end_date=2019-01-03')
-        self.view.get_form_kwargs()
-        results = self.view.get_date_range_and_annotate(Vote.objects.all(), total=Sum('count'))
-
-        self.assertIn({'date': '2019-01-01', 'total': 1}, results)
-        self.assertIn({'date': '2019-01-02', 'total': 4}, results)
-        self.assertIn({'date': '2019-01-03', 'total': 9}, results)
-
-        results = self.view.get_date_range_and_annotate(Vote.objects.all(), total=Max('count'))
-
-        self.assertIn({'date': '2019-01-01', 'total': 1}, results)
-        self.assertIn({'date': '2019-01-02', 'total': 2}, results)
-        self.assertIn({'date': '2019-01-03', 'total': 3}, results)
-
-    def test_get_date_range_and_annotate_returns_empty_list(self):
-        '''
-        The get_date_range_and_annotate method returns an empty list if no records are found between the dates,
-        or the date range form is invalid.
-        '''
-
-        self.view.request = self.factory.get('/date-range/?start_date=2019-02-01&end_date=2019-02-03')
-        self.view.get_form_kwargs()
-        results = self.view.get_date_range_and_annotate(Vote.objects.all())
-
-        self.assertEqual([], results)
-
-        self.view.request = self.factory.get('/date-range/?start_date=notadate&end_date=notadate')
-        self.view.get_form_kwargs()
-        results = self.view.get_date_range_and_annotate(Vote.objects.all())
-
-        self.assertEqual([], results)
-
     def test_get_context_data_adds_date_range_form(self):
         '''
         The get_context_data method should return a dictionary containing a DateRangeForm as date_range_form,
@@ -401,6 +298,33 @@ class TestTicketStatsView(TestCase):
         self.assertIn('views', chart_data.keys())
         self.assertIn('votes', chart_data.keys())
 
+    def test_get_ticket_stats_chart_data_from_daily_totals(self):
+        '''
+        The chart data should contain the ticket's daily totals for the date range.
+        '''
+        for n in range(3):
+            Comment.objects.create(user=self.other_user, ticket=self.test_ticket, content='Test comment')
+        Vote.objects.create(user=self.other_user, ticket=self.test_ticket, count=4)
+
+        self.client.login(username='AdminUser', password='tH1$isA7357')
+        response = self.client.get('/stats/{}/'.format(self.test_ticket.id))
+        chart_data = json.loads(response.context['chart_data'])
+        today = timezone.localdate().isoformat()
+
+        self.assertEqual([{'date': today, 'total': 3}], chart_data['comments'])
+        self.assertEqual([{'date': today, 'total': 4}], chart_data['votes'])
+        self.assertEqual([], chart_data['views'])
+
+    def test_get_ticket_stats_fetches_ticket_once(self):
+        '''
+        The ticket stats view should fetch the ticket once, reusing it for the permission check.
+        '''
+        self.client.login(username='TestUser', password='tH1$isA7357')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/stats/{}/'.format(self.test_ticket.id))
+
+        self.assertEqual(1, sum('FROM "tickets_ticket" WHERE' in query['sql'] for query in queries))
+
 
 class TestAllTicketsStatsView(TestCase):
     '''
@@ -509,6 +433,24 @@ class TestAllTicketsStatsView(TestCase):
         self.assertEqual('Test bug 6', response.context['top_5_bugs'][0].title)
         self.assertEqual('Test bug 2', response.context['top_5_bugs'][4].title)
 
+    def test_get_all_tickets_stats_context_contains_resolution_times(self):
+        '''
+        The context should contain the time tickets took over each stage, for all tickets, each ticket type and label.
+        '''
+        label = Label.objects.create(name='Test label')
+        ticket = Ticket.objects.create(user=self.test_user, title='Test bug', content='Test ticket', ticket_type='Bug')
+        ticket.labels.add(label)
+        ticket.created = timezone.now() - timedelta(days=3)
+        ticket.approved = timezone.now() - timedelta(days=2)
+        ticket.save()
+
+        self.client.login(username='AdminUser', password='tH1$isA7357')
+        response = self.client.get('/stats/')
+
+        self.assertEqual(['All tickets', 'Bug Report', 'Test label'], [group['name'] for group in response.context['resolution_times']])
+        self.assertEqual([{'stage': 'Approval', 'count': 1, 'mean': '1 day', 'median': '1 day', 'p90': '1 day', 'p99': '1 day'}],
+                         response.context['resolution_times'][0]['stages'])
+
 
 class TestTransactionStatsView(TestCase):
     '''
@@ -613,15 +555,18 @@ class TestRoadmapView(TestCase):
         self.assertGreater(datetime.strptime(ticket_list[7]['date'], '%d/%m/%y'), datetime.strptime(ticket_list[8]['date'], '%d/%m/%y'))
         self.assertGreater(datetime.strptime(ticket_list[8]['date'], '%d/%m/%y'), datetime.strptime(ticket_list[9]['date'], '%d/%m/%y'))
 
+    def get_json(self, cursor):
+        '''
+        Gets the roadmap page at the cursor as json, returning the response.
+        '''
+        return self.client.get('/roadmap/', {'cursor': cursor}, CONTENT_TYPE='application/json')
+
     def test_get_page_json_returns_ticket_list_and_done(self):
         '''
         Getting a page with request type as json should return a list of tickets ordered by date.
         '''
-        factory = RequestFactory()
-        request = factory.get('/roadmap/?page=1')
-        request.content_type = 'application/json'
-
-        response = RoadmapView.as_view()(request)
+        response = self.client.get('/roadmap/')
+        response = self.get_json(response.context['cursor'])
         response_data = json.loads(response.content.decode())
         ticket_list = response_data['tickets']
         self.assertFalse(response_data['done'])
@@ -638,29 +583,34 @@ class TestRoadmapView(TestCase):
 
     def test_get_page_json_returns_done_after_last_page(self):
         '''
-        Getting a page with request type as json should return a value for done of True for the final page or later.
+        Following the cursors should return each ticket once, with a value for done of True and no cursor for the final page.
         '''
-        factory = RequestFactory()
-        request = factory.get('/roadmap/?page=1')
-        request.content_type = 'application/json'
-
-        response = RoadmapView.as_view()(request)
-        response_data = json.loads(response.content.decode())
-        self.assertEqual(10, len(response_data['tickets']))
-        self.assertFalse(response_data['done'])
-
-        request = factory.get('/roadmap/?page=3')
-        request.content_type = 'application/json'
+        response = self.client.get('/roadmap/')
+        titles = [ticket['title'] for ticket in response.context['tickets']]
+        cursor = response.context['cursor']
+        page_sizes = []
+        while cursor is not None:
+            response_data = json.loads(self.get_json(cursor).content.decode())
+            titles.extend(ticket['title'] for ticket in response_data['tickets'])
+            page_sizes.append(len(response_data['tickets']))
+            self.assertEqual(response_data['done'], response_data['cursor'] is None)
+            cursor = response_data['cursor']
 
-        response = RoadmapView.as_view()(request)
-        response_data = json.loads(response.content.decode())
-        self.assertEqual(2, len(response_data['tickets']))
-        self.assertTrue(response_data['done'])
+        self.assertEqual([10, 10, 2], page_sizes)
+        self.assertEqual(['Coming Soon {}'.format(n) for n in reversed(range(7))] +
+                         ['Completed {}'.format(n) for n in reversed(range(25))], titles)
 
-        request = factory.get('/roadmap/?page=6')
-        request.content_type = 'application/json'
+    def test_get_page_json_makes_one_query(self):
+        '''
+        Getting a page within a section of the roadmap should take a single query.
+        '''
+        cursor = self.client.get('/roadmap/').context['cursor']
+        with self.assertNumQueries(1):
+            self.get_json(cursor)
 
-        response = RoadmapView.as_view()(request)
-        response_data = json.loads(response.content.decode())
-        self.assertEqual(0, len(response_data['tickets']))
-        self.assertTrue(response_data['done'])
+    def test_get_page_json_invalid_cursor_returns_404(self):
+        '''
+        Getting a page with a cursor that wasn't returned by the roadmap should return 404.
+        '''
+        self.assertEqual(404, self.get_json('done:invalid').status_code)
+        self.assertEqual(404, self.get_json('awaiting').status_code)
@@ -1,80 +1,19 @@
 from django.views.generic.base import TemplateView, ContextMixin
 from django.views.generic import DetailView
-from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.db.models import Avg, Sum, Count, TextField, DateField, F
-from django.db.models.functions import Cast, TruncDay, Coalesce
-from django.utils import timezone
-from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.contrib.auth.mixins import PermissionRequiredMixin, UserPassesTestMixin
+from django.views import View
+from django.conf import settings
+from django.http import JsonResponse, Http404
 from datetime import timedelta
 import json
-from tickets.models import Ticket, Pageview, Vote, Comment
+from tickets.models import Ticket, get_ticket_url
+from tickets.pagination import KeysetPaginator
 from tickets.views import AuthorOrAdminMixin
-from credits.models import Credit, Debit
 from stats.forms import DateRangeForm
-
-
-def filter_date_range(queryset, status, start=None, end=None):
-    '''
-    Filters a queryset for a given status between a date range
-    '''
-    query = {}
-    if start:
-        query[status + '__date__gte'] = start
-    if end:
-        query[status + '__date__lte'] = end
-    if query != {}:
-        return queryset.filter(**query)
-    else:
-        return queryset
-
-
-def last_x_days(queryset, status, days):
-    '''
-    Function for filtering a queryset for a given status being set in the last X days.
-    '''
-    start_date = timezone.now().date() - timedelta(days=days)
-    return filter_date_range(queryset, status, start=start_date)
-
-
-def annotate_date(queryset, status, field_name='date'):
-    '''
-    Annotates queryset with a 'date' field, created from the chosen status.
-    '''
-    annotation = {field_name: Cast(TruncDay(status, DateField()), TextField())}
-    return queryset.annotate(**annotation)
-
-
-def avg_time_taken(queryset, start_status, end_status):
-    '''
-    Returns a timedelta of the avg time taken between two statuses in a given queryset.
-    '''
-    return queryset.exclude(**{end_status: None}).annotate(time_taken=F(end_status) - F(start_status)).aggregate(Avg('time_taken'))['time_taken__avg']
-
-
-def interval_string(interval, limit=2):
-    '''
-    Converts a timedelta interval to a string of years, months, days, hours, minutes. Uses only largest results up to limit.
-    '''
-    intervals = (
-        ('year', timedelta(days=365).total_seconds()),
-        ('month', timedelta(days=30).total_seconds()),
-        # ('week', timedelta(days=7).total_seconds()),
-        ('day', timedelta(days=1).total_seconds()),
-        ('hour', timedelta(hours=1).total_seconds()),
-        ('minute', timedelta(minutes=1).total_seconds()),
-    )
-
-    seconds = interval.total_seconds()
-    result = []
-
-    for interval_name, interval_seconds in intervals:
-        if seconds >= interval_seconds:
-            count = seconds // interval_seconds
-            seconds %= interval_seconds
-            result.append('{:.0f} {}{}'.format(count, interval_name, 's' if count > 1 else ''))
-
-    return ' '.join(result[0:limit])
+from stats import rollups
+from stats.dashboard import get_index_stats, interval_string
+from stats.resolution import get_grouped_resolution_times, STAGES
+from stats.request_metrics import request_metrics
 
 
 class IndexView(TemplateView, ContextMixin):
@@ -85,19 +24,7 @@ class IndexView(TemplateView, ContextMixin):
 
     def get_context_data(self):
         context = super(IndexView, self).get_context_data()
-        context['bugs_this_week'] = last_x_days(Ticket.objects.filter(ticket_type='Bug'), 'done', 7).count()
-        context['features_coming_soon'] = Ticket.objects.exclude(doing=None).filter(ticket_type='Feature', done=None).count()
-        context['total_features_implemented'] = Ticket.objects.exclude(done=None).filter(ticket_type='Feature').count()
-        try:
-            avg_time_to_bugfix = avg_time_taken(Ticket.objects.filter(ticket_type='Bug'), 'created', 'done')
-            context['avg_time_to_bugfix'] = interval_string(avg_time_to_bugfix)
-        except NotImplementedError:
-            pass
-        try:
-            context['most_requested_feature_url'] = Ticket.objects.exclude(approved=None).filter(done=None, ticket_type='Feature') \
-                .annotate(vote_count=Coalesce(Sum('vote__count'), 0)).order_by('-vote_count')[0].get_absolute_url()
-        except (IndexError, Ticket.DoesNotExist):
-            context['most_requested_feature_url'] = None
+        context.update(get_index_stats())
         return context
 
 
@@ -105,22 +32,17 @@ class DateRangeMixin(ContextMixin):
     '''
     Abstract view for including date range queries for stats.
     '''
-    date_to_use = 'created'
-
     def get_form_kwargs(self):
         self.form = DateRangeForm(self.request.GET)
         self.form.is_valid()
 
-    def get_date_range_and_annotate(self, queryset, total=Count('date')):
+    def get_daily_totals(self, metric, ticket=None):
         '''
-        Filters the queryset by the date range, annotates the queryset with a date field base don the date_to_use (default 'created'),
-        groups the queryset by date, and annotates it with a total, based on the total annotation provided (default count).
+        Returns the pre-aggregated daily totals of a metric in the date range, site wide or for a ticket,
+        as a list of dictionaries of each date and its total.
         '''
         if self.form.is_valid():
-            queryset = filter_date_range(queryset, self.date_to_use, self.form.cleaned_data.get('start_date'), self.form.cleaned_data.get('end_date'))
-            queryset = annotate_date(queryset, self.date_to_use)
-            queryset = queryset.values('date').annotate(total=total)
-            return list(queryset)
+            return rollups.daily_totals(metric, ticket, self.form.cleaned_data.get('start_date'), self.form.cleaned_data.get('end_date'))
         else:
             return []
 
@@ -151,9 +73,9 @@ class TicketStatsView(AuthorOrAdminMixin, DateRangeMixin, DetailView):
 
         # Add stats to page context
         chart_data = {}
-        chart_data['comments'] = self.get_date_range_and_annotate(self.object.comment_set)
-        chart_data['views'] = self.get_date_range_and_annotate(self.object.pageview_set)
-        chart_data['votes'] = self.get_date_range_and_annotate(self.object.vote_set, total=Sum('count'))
+        chart_data['comments'] = self.get_daily_totals('comments', self.object)
+        chart_data['views'] = self.get_daily_totals('views', self.object)
+        chart_data['votes'] = self.get_daily_totals('votes', self.object)
 
         context['chart_data'] = json.dumps(chart_data)
 
@@ -168,21 +90,35 @@ class AllTicketStatsView(PermissionRequiredMixin, TemplateView, DateRangeMixin):
     raise_exception = True
     template_name = 'ticket_stats_all.html'
 
+    def get_resolution_times(self):
+        '''
+        Returns a list of how long tickets took over each stage, for all tickets, each ticket type and the most used labels.
+        Each is a dictionary of the group's name and a list of the stages' summaries, with durations formatted for display.
+        '''
+        rows = []
+        for name, summaries in get_grouped_resolution_times():
+            stages = []
+            for stage, verbose_name, start, end in STAGES:
+                if stage in summaries:
+                    row = {'stage': verbose_name, 'count': summaries[stage]['count']}
+                    for measure in ('mean', 'median', 'p90', 'p99'):
+                        row[measure] = interval_string(timedelta(seconds=summaries[stage][measure])) or 'Under a minute'
+                    stages.append(row)
+            if stages:
+                rows.append({'name': name, 'stages': stages})
+        return rows
+
     def get_context_data(self, **kwargs):
         context = super(AllTicketStatsView, self).get_context_data(**kwargs)
 
-        context['awaiting_approval'] = Ticket.objects.filter(approved=None).count()
-        context['top_5_features'] = Ticket.objects.exclude(approved=None).filter(ticket_type='Feature', done=None) \
-            .annotate(vote_count=Coalesce(Sum('vote__count'), 0)).order_by('-vote_count')[:5]
-        context['top_5_bugs'] = Ticket.objects.exclude(approved=None).filter(ticket_type='Bug', done=None) \
-            .annotate(vote_count=Coalesce(Sum('vote__count'), 0)).order_by('-vote_count')[:5]
+        context['awaiting_approval'] = Ticket.objects.filter(status='awaiting approval').count()
+        context['top_5_features'] = Ticket.objects.filter(status__in=('approved', 'doing'), ticket_type='Feature').order_by('-vote_total')[:5]
+        context['top_5_bugs'] = Ticket.objects.filter(status__in=('approved', 'doing'), ticket_type='Bug').order_by('-vote_total')[:5]
+        context['resolution_times'] = self.get_resolution_times()
 
         chart_data = {}
-        chart_data['bugs'] = self.get_date_range_and_annotate(Ticket.objects.filter(ticket_type='Bug'))
-        chart_data['features'] = self.get_date_range_and_annotate(Ticket.objects.filter(ticket_type='Feature'))
-        chart_data['comments'] = self.get_date_range_and_annotate(Comment.objects.all())
-        chart_data['views'] = self.get_date_range_and_annotate(Pageview.objects.all())
-        chart_data['votes'] = self.get_date_range_and_annotate(Vote.objects.all(), total=Sum('count'))
+        for metric in ('bugs', 'features', 'comments', 'views', 'votes'):
+            chart_data[metric] = self.get_daily_totals(metric)
 
         context['chart_data'] = json.dumps(chart_data)
 
@@ -201,8 +137,8 @@ class TransactionsStatsView(PermissionRequiredMixin, TemplateView, DateRangeMixi
         context = super(TransactionsStatsView, self).get_context_data(**kwargs)
 
         chart_data = {}
-        chart_data['sales'] = self.get_date_range_and_annotate(Credit.objects.filter(real_value__gte=1), total=Sum('real_value'))
-        chart_data['refunds'] = self.get_date_range_and_annotate(Debit.objects.filter(real_value__gte=1), total=Sum('real_value'))
+        chart_data['sales'] = self.get_daily_totals('sales')
+        chart_data['refunds'] = self.get_daily_totals('refunds')
 
         context['chart_data'] = json.dumps(chart_data)
 
@@ -212,35 +148,76 @@ class TransactionsStatsView(PermissionRequiredMixin, TemplateView, DateRangeMixi
 class RoadmapView(TemplateView, ContextMixin):
     '''
     View for displaying roadmap with features and bugs with statuses of done and doing.
+    Tickets being worked on are listed first, most recently started first, followed by those done, most recently done first.
+    Each section is read in turn with a KeysetPaginator along its status index, and pages after the first are requested
+    with the cursor returned for the page before, which is the section's name followed by its KeysetPaginator cursor.
     '''
     template_name = 'roadmap.html'
     tickets_per_page = 10
+    sections = (('doing', ('-doing', '-id')), ('done', ('-done', '-id')))
 
-    def get_context_data(self, page=0, **kwargs):
+    def get_tickets(self, cursor=None):
+        '''
+        Returns the page of tickets at the cursor, or the first page without one, and the cursor for the next page,
+        which is None after the last page. Raises 404 for invalid cursors.
+        '''
+        section_names = [name for name, ordering in self.sections]
+        section_name, _, keyset_cursor = (cursor or section_names[0]).partition(':')
+        if section_name not in section_names:
+            raise Http404('Invalid cursor.')
+
+        tickets = []
+        for name, ordering in self.sections[section_names.index(section_name):]:
+            queryset = Ticket.objects.filter(status=name).only('id', 'title', 'ticket_type', 'doing', 'done')
+            page = KeysetPaginator(queryset, ordering, self.tickets_per_page - len(tickets)).page(keyset_cursor or None)
+            tickets.extend(page)
+            if page.has_next:
+                return tickets, '{}:{}'.format(name, page.next_cursor)
+            keyset_cursor = None
+            if len(tickets) == self.tickets_per_page:
+                following = section_names.index(name) + 1
+                return tickets, section_names[following] if following < len(section_names) else None
+        return tickets, None
+
+    def get_context_data(self, cursor=None, **kwargs):
         context = super(RoadmapView, self).get_context_data(**kwargs)
-
-        no_doing_or_done_tickets = Ticket.objects.exclude(doing=None).count()
-        ticket_selection = Ticket.objects.exclude(doing=None).extra(select={'is_doing': 'done IS NULL'}) \
-            .extra(order_by=['-is_doing', '-done'])[page * self.tickets_per_page:(page + 1) * self.tickets_per_page] \
-            .values('id', 'done', 'title', 'ticket_type')
+        tickets, next_cursor = self.get_tickets(cursor)
 
         def create_roadmap_entry(ticket):
-            return {'title': ticket['title'],
-                    'type': ticket['ticket_type'],
-                    'url': str(reverse_lazy('ticket', kwargs={'pk': ticket['id']})),
-                    'date': ticket['done'].strftime('%d/%m/%y') if ticket['done'] is not None else 'Coming Soon'}
+            return {'title': ticket.title,
+                    'type': ticket.ticket_type,
+                    'url': get_ticket_url(ticket.id),
+                    'date': ticket.done.strftime('%d/%m/%y') if ticket.done is not None else 'Coming Soon'}
 
-        context['tickets'] = list(create_roadmap_entry(ticket) for ticket in ticket_selection)
-        context['done'] = no_doing_or_done_tickets - 1 < (page + 1) * self.tickets_per_page
+        context['tickets'] = list(create_roadmap_entry(ticket) for ticket in tickets)
+        context['cursor'] = next_cursor
+        context['done'] = next_cursor is None
 
         return context
 
     def get(self, request, *args, **kwargs):
-        # If Json request, return the tickets list and done variables from the context as json. Otherwise render the page as usual.
+        # If Json request, return the tickets list, next cursor and done variables from the context as json.
+        # Otherwise render the page as usual.
         if request.content_type == 'application/json':
-            page = int(self.request.GET['page'])
-            context = self.get_context_data(page=page)
-            data = {'tickets': context['tickets'], 'done': context['done']}
+            context = self.get_context_data(cursor=self.request.GET.get('cursor'))
+            data = {'tickets': context['tickets'], 'cursor': context['cursor'], 'done': context['done']}
             return JsonResponse(data, content_type='application/json')
         else:
             return super(RoadmapView, self).get(request, *args, **kwargs)
+
+
+class RequestMetricsView(UserPassesTestMixin, View):
+    '''
+    View returning percentiles of the recent requests' wall time, queries, SQL time and template render time for each view,
+    with its query budget, as json. Only accessible to staff users.
+    '''
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        summary = request_metrics.summary()
+        for url_name, view_summary in summary.items():
+            view_summary['query_budget'] = settings.QUERY_BUDGETS.get(url_name)
+        return JsonResponse(summary)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IssuesConfig(AppConfig):
     name = 'tickets'
+
+    def ready(self):
+        import tickets.signals  # noqa: F401
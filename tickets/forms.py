@@ -30,6 +30,8 @@ class FilterForm(forms.Form):
 
     FILTER_BY_TYPE_CHOICES = (('', 'All'),) + Ticket.TICKET_TYPE_CHOICES
 
+    q = forms.CharField(max_length=100, required=False, label='Search',
+                        help_text='Search titles, descriptions and comments. Results are ordered by best match unless ordered otherwise.')
     order_by = forms.ChoiceField(choices=ORDER_BY_CHOICES, required=False)
     status = forms.ChoiceField(choices=FILTER_BY_STATUS_CHOICES, required=False)
     ticket_type = forms.ChoiceField(choices=FILTER_BY_TYPE_CHOICES, required=False)
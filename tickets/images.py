@@ -0,0 +1,93 @@
+import posixpath
+from io import BytesIO
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Smaller copies of tickets' attached images, so pages don't load the multi-megabyte originals. Each image is resized to
+# each of the widths narrower than it, or just its own width if it's narrower than them all, and saved as WebP and as
+# JPEG for browsers without WebP. Renditions are saved afresh from the pixels alone, which strips the originals'
+# metadata, after turning them the way up their EXIF orientation says. They are stored alongside the original, in the
+# same storage, so on S3 when media is stored there. Their names follow from the original's, which the storage made
+# unique, so they're written straight to those names with write, without the S3 request save makes for each to check
+# whether the name is taken. Saving them afresh deletes the old ones first.
+
+WIDTHS = (320, 640, 1280)
+# (format, file extension, save options)
+FORMATS = (
+    ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('JPEG', 'jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+
+def rendition_name(name, width, extension):
+    '''
+    Returns the name a rendition of an image is stored under, in a directory named after the image.
+    '''
+    return posixpath.join('{}.renditions'.format(name), '{}w.{}'.format(width, extension))
+
+
+def rendition_widths(width):
+    '''
+    Returns the widths to resize an image of a width to.
+    '''
+    return [w for w in WIDTHS if w < width] or [width]
+
+
+def write(storage, name, content):
+    '''
+    Writes a file to storage under the name given, replacing any file already there, and returns the name. Storage.save
+    first calls exists() to find an unused name, where _save writes to S3 under the name given. A local storage only
+    saves under another name if a file was left under this one, which is then replaced.
+    '''
+    saved_name = storage._save(name, content)
+    if saved_name != name:
+        storage.delete(name)
+        storage.delete(saved_name)
+        saved_name = storage._save(name, content)
+    return saved_name
+
+
+def save_renditions(image_file, name, storage):
+    '''
+    Saves the renditions of an image file, named after the image's name in storage. Returns the widths they were saved at.
+    '''
+    image_file.open('rb')
+    try:
+        original = Image.open(image_file)
+        # JPEGs are decoded at a fraction of their size where that's still at least as big as the widest rendition,
+        # either way up, which is much quicker for large photos.
+        original.draft('RGB', (WIDTHS[-1], WIDTHS[-1]))
+        original = ImageOps.exif_transpose(original)
+    finally:
+        image_file.close()
+    if original.mode != 'RGB':
+        # Transparent images are put on white, as JPEG has no transparency.
+        rgba = original.convert('RGBA')
+        original = Image.new('RGB', original.size, (255, 255, 255))
+        original.paste(rgba, mask=rgba)
+
+    widths = rendition_widths(original.width)
+    for width in widths:
+        resized = original.resize((width, max(round(original.height * width / original.width), 1)), Image.LANCZOS)
+        for image_format, extension, options in FORMATS:
+            data = BytesIO()
+            resized.save(data, image_format, **options)
+            write(storage, rendition_name(name, width, extension), ContentFile(data.getvalue()))
+    return widths
+
+
+def delete_renditions(name, widths, storage):
+    '''
+    Deletes the renditions of an image saved at the widths given.
+    '''
+    for width in widths:
+        for image_format, extension, options in FORMATS:
+            storage.delete(rendition_name(name, width, extension))
+
+
+def srcset(image, widths, extension):
+    '''
+    Returns the srcset of an image's renditions at the widths in a format.
+    '''
+    return ', '.join('{} {}w'.format(image.storage.url(rendition_name(image.name, width, extension)), width)
+                     for width in widths)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tickets import search
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds the ticket search index.
+    '''
+    help = 'Rebuilds the full text search index of ticket titles, content and comments.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write('Rebuilt ticket search index.')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from tickets.models import Ticket, Pageview, Vote, Comment
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds tickets' view, vote and comment counters from the pageview, vote and comment tables.
+    '''
+    help = 'Rebuilds the view_count, vote_total and comment_count columns on tickets from their source tables.'
+
+    def handle(self, *args, **options):
+        views = dict(Pageview.objects.order_by().values_list('ticket').annotate(Count('id')))
+        votes = dict(Vote.objects.order_by().values_list('ticket').annotate(Sum('count')))
+        comments = dict(Comment.objects.order_by().values_list('ticket').annotate(Count('id')))
+
+        rebuilt = 0
+        with transaction.atomic():
+            for ticket in Ticket.objects.values('pk', *Ticket.COUNTER_FIELDS).iterator():
+                pk = ticket.pop('pk')
+                counters = {'view_count': views.get(pk, 0), 'vote_total': votes.get(pk, 0), 'comment_count': comments.get(pk, 0)}
+                # Only write to tickets whose counters have drifted.
+                if ticket != counters:
+                    Ticket.objects.filter(pk=pk).update(**counters)
+                    rebuilt += 1
+
+        self.stdout.write('Rebuilt counters for {} tickets.'.format(rebuilt))
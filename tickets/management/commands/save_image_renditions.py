@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from tickets.models import Ticket
+
+
+class Command(BaseCommand):
+    '''
+    Saves renditions of tickets' images that don't have them yet.
+    '''
+    help = 'Saves the resized WebP and JPEG renditions of images attached to tickets, for tickets without them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Save renditions of every ticket\'s image afresh.')
+
+    def handle(self, *args, **options):
+        tickets = Ticket.objects.exclude(image='').exclude(image=None).filter(image_status='stored')
+        if not options['all']:
+            tickets = tickets.filter(image_widths='')
+        saved = 0
+        for ticket in tickets.only('pk', 'image', 'image_widths').iterator():
+            ticket.save_image_renditions()
+            if ticket.image_widths:
+                saved += 1
+        self.stdout.write('Saved renditions of {} images.'.format(saved))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from issue_tracker.custom_storages import StagingStorage
+from tickets.models import Ticket
+from tickets.uploads import media_uploader
+
+
+class Command(BaseCommand):
+    '''
+    Uploads tickets' staged images to the media storage.
+    '''
+    help = ('Uploads images staged on this machine whose background uploads failed, or were interrupted by a restart, '
+            'to the media storage.')
+
+    def handle(self, *args, **options):
+        staging_storage = StagingStorage()
+        uploaded = failed = 0
+        for ticket in Ticket.objects.filter(image_status__in=('uploading', 'failed')).only('pk', 'image'):
+            if not staging_storage.exists(ticket.image.name):
+                continue
+            Ticket.objects.filter(pk=ticket.pk, image=ticket.image.name).update(image_status='uploading')
+            if media_uploader.upload(ticket.pk):
+                uploaded += 1
+            else:
+                failed += 1
+        self.stdout.write('Uploaded {} ticket images, {} failed.'.format(uploaded, failed))
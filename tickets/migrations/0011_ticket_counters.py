@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 02:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_engagement(apps, schema_editor):
+    '''
+    Fills the new counters for existing tickets from their pageviews, votes and comments.
+    '''
+    Ticket = apps.get_model('tickets', 'Ticket')
+    views = dict(apps.get_model('tickets', 'Pageview').objects.order_by().values_list('ticket').annotate(Count('id')))
+    votes = dict(apps.get_model('tickets', 'Vote').objects.order_by().values_list('ticket').annotate(Sum('count')))
+    comments = dict(apps.get_model('tickets', 'Comment').objects.order_by().values_list('ticket').annotate(Count('id')))
+
+    for pk in set(views) | set(votes) | set(comments):
+        Ticket.objects.filter(pk=pk).update(view_count=views.get(pk, 0), vote_total=votes.get(pk, 0),
+                                            comment_count=comments.get(pk, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0010_auto_20191113_2104'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='view_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='vote_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_engagement, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Creates the full text search index as tickets.search first built it, and fills it from the existing tickets and their
+# comments. The SQL is kept here, rather than taken from tickets.search, so later changes there don't change this.
+
+CREATE_SEARCH_INDEX = {
+    'postgresql': [
+        '''CREATE TABLE tickets_search (
+               ticket_id integer PRIMARY KEY REFERENCES tickets_ticket (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+               document tsvector NOT NULL)''',
+        'CREATE INDEX tickets_search_document ON tickets_search USING GIN (document)',
+        '''INSERT INTO tickets_search (ticket_id, document)
+           SELECT tickets_ticket.id,
+                  setweight(to_tsvector('english', tickets_ticket.title), 'A') ||
+                  setweight(to_tsvector('english', tickets_ticket.content), 'B') ||
+                  setweight(to_tsvector('english', coalesce((SELECT string_agg(tickets_comment.content, ' ')
+                                                             FROM tickets_comment
+                                                             WHERE tickets_comment.ticket_id = tickets_ticket.id), '')), 'C')
+           FROM tickets_ticket''',
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE tickets_search USING fts5(title, content, comments, tokenize = 'porter')",
+        '''INSERT INTO tickets_search (rowid, title, content, comments)
+           SELECT tickets_ticket.id, tickets_ticket.title, tickets_ticket.content,
+                  coalesce((SELECT group_concat(tickets_comment.content, ' ') FROM tickets_comment
+                            WHERE tickets_comment.ticket_id = tickets_ticket.id), '')
+           FROM tickets_ticket''',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SEARCH_INDEX:
+        raise NotImplementedError('Ticket search is not supported on {}.'.format(vendor))
+    for statement in CREATE_SEARCH_INDEX[vendor]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE tickets_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0012_pageview_created_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 03:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_ticket_statuses(apps, schema_editor):
+    Ticket = apps.get_model('tickets', 'Ticket')
+    Ticket.objects.exclude(approved=None).update(status='approved')
+    Ticket.objects.exclude(doing=None).update(status='doing')
+    Ticket.objects.exclude(done=None).update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0014_ticket_labels_label_ticket_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='status',
+            field=models.CharField(choices=[('awaiting approval', 'Awaiting Approval'), ('approved', 'Approved'), ('doing', 'Doing'), ('done', 'Done')], default='awaiting approval', editable=False, max_length=17),
+        ),
+        migrations.RunPython(set_ticket_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'ticket_type', 'created'], name='tickets_status_type_created'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'created'], name='tickets_status_created'),
+        ),
+    ]
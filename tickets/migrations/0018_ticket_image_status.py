@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 03:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0017_ticket_image_widths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='image_status',
+            field=models.CharField(choices=[('stored', 'Stored'), ('uploading', 'Uploading'), ('failed', 'Upload failed')], default='stored', editable=False, max_length=9),
+        ),
+    ]
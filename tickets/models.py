@@ -1,9 +1,45 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.urls import reverse
-from django.db.models import Sum
+from django.urls import reverse, get_script_prefix
 from django.utils import timezone
+from django.utils.functional import cached_property
+from functools import lru_cache
+import logging
 from credits.models import Wallet
+from issue_tracker.custom_storages import StagingStorage
+from tickets import images
+
+logger = logging.getLogger(__name__)
+
+
+def get_ticket_url(pk):
+    '''
+    Returns a ticket's url. Reversing urls is comparatively slow, so they are cached by ticket id and script prefix.
+    '''
+    return _reverse_ticket_url(pk, get_script_prefix())
+
+
+@lru_cache(maxsize=10000)
+def _reverse_ticket_url(pk, script_prefix):
+    return reverse('ticket', kwargs={'pk': pk})
+
+
+def get_comment_urls(ticket_pk, pk):
+    '''
+    Returns a dictionary of the urls to edit, delete and reply to a comment, cached like tickets' urls, as the ticket page
+    has them for every comment.
+    '''
+    return _reverse_comment_urls(ticket_pk, pk, get_script_prefix())
+
+
+@lru_cache(maxsize=10000)
+def _reverse_comment_urls(ticket_pk, pk, script_prefix):
+    return {
+        'edit': reverse('edit-comment', kwargs={'ticket_pk': ticket_pk, 'pk': pk}),
+        'delete': reverse('delete-comment', kwargs={'ticket_pk': ticket_pk, 'pk': pk}),
+        'reply': reverse('add-reply', kwargs={'ticket_pk': ticket_pk, 'comment_pk': pk}),
+    }
 
 
 class Label(models.Model):
@@ -24,6 +60,17 @@ class Ticket(models.Model):
         ('Bug', 'Bug Report'),
         ('Feature', 'Feature Request'),
     )
+    STATUS_CHOICES = (
+        ('awaiting approval', 'Awaiting Approval'),
+        ('approved', 'Approved'),
+        ('doing', 'Doing'),
+        ('done', 'Done'),
+    )
+    IMAGE_STATUS_CHOICES = (
+        ('stored', 'Stored'),
+        ('uploading', 'Uploading'),
+        ('failed', 'Upload failed'),
+    )
 
     user = models.ForeignKey(User)
     ticket_type = models.CharField(max_length=7, choices=TICKET_TYPE_CHOICES, default='Bug')
@@ -34,20 +81,146 @@ class Ticket(models.Model):
     approved = models.DateTimeField(null=True, default=None, blank=True)
     doing = models.DateTimeField(null=True, default=None, blank=True)
     done = models.DateTimeField(null=True, default=None, blank=True)
+    # The most advanced status with its date set, stored so tickets can be filtered by it using an index.
+    status = models.CharField(max_length=17, choices=STATUS_CHOICES, default='awaiting approval', editable=False)
     image = models.ImageField(null=True, blank=True)
+    # The widths the image's renditions were saved at, by tickets.images, separated by commas.
+    image_widths = models.CharField(max_length=50, blank=True, default='', editable=False)
+    # Whether the image is in the media storage, or still in the staging storage waiting to be uploaded there.
+    image_status = models.CharField(max_length=9, choices=IMAGE_STATUS_CHOICES, default='stored', editable=False)
     labels = models.ManyToManyField(Label, blank=True)
+    # Engagement counters, kept up to date in place by the signals in tickets.signals.
+    view_count = models.IntegerField(default=0, editable=False)
+    vote_total = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('view_count', 'vote_total', 'comment_count')
+    STATUS_FIELDS = ('approved', 'doing', 'done')
 
     class Meta:
         permissions = (('can_update_status', 'Update Ticket status.'),
                        ('can_edit_all_tickets', 'Edit any user\'s ticket'),
                        ('can_view_all_stats', 'View stats for any ticket'),)
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['status', 'ticket_type', 'created'], name='tickets_status_type_created'),
+            models.Index(fields=['status', 'created'], name='tickets_status_created'),
+            models.Index(fields=['status', 'doing'], name='tickets_status_doing'),
+            models.Index(fields=['status', 'done'], name='tickets_status_done'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        ticket = super(Ticket, cls).from_db(db, field_names, values)
+        # The staged image as loaded, so it can be removed from the staging storage if the image is cleared or replaced.
+        ticket._loaded_staged_image = ticket.image.name if 'image' in field_names and 'image_status' in field_names \
+            and ticket.image_status in ('uploading', 'failed') else None
+        return ticket
 
     def __str__(self):
         return '{0} - {1} - {2}'.format(self.id, self.title, self.noun)
 
     def get_absolute_url(self):
-        return reverse('ticket', kwargs={'pk': self.pk})
+        return get_ticket_url(self.pk)
+
+    def save(self, *args, **kwargs):
+        '''
+        Saves the ticket, updating its status from its status dates, and saving renditions of a newly uploaded image,
+        or staging it to be uploaded in the background if DEFER_MEDIA_UPLOADS is on. A staged image that is cleared or
+        replaced is removed from the staging storage once saved. Existing tickets don't write their engagement counters,
+        as they are updated in place, so saving a stale instance can't overwrite them.
+        '''
+        self.status = self.get_status_from_dates()
+        # Uploaded files are only committed to storage as the ticket is saved.
+        image_uploaded = bool(self.image) and not self.image._committed
+        self._image_staged = image_uploaded and settings.DEFER_MEDIA_UPLOADS
+        if self._image_staged:
+            self.stage_image()
+        elif image_uploaded or not self.image:
+            self.image_status = 'stored'
+        if image_uploaded or not self.image:
+            self.image_widths = ''
+        if kwargs.get('update_fields') is not None and set(kwargs['update_fields']) & set(self.STATUS_FIELDS):
+            kwargs['update_fields'] = list(kwargs['update_fields']) + ['status']
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super(Ticket, self).save(*args, **kwargs)
+        staged_image = getattr(self, '_loaded_staged_image', None)
+        if staged_image and staged_image != self.image.name:
+            self._loaded_staged_image = None
+            transaction.on_commit(lambda: StagingStorage().delete(staged_image))
+        if image_uploaded and not self._image_staged:
+            self.save_image_renditions()
+
+    def stage_image(self):
+        '''
+        Writes the ticket's newly uploaded image to the staging storage, in place of the media storage, to be uploaded
+        there by upload_image.
+        '''
+        self.image.name = StagingStorage().save(self.image.field.generate_filename(self, self.image.name), self.image.file)
+        self.image._committed = True
+        self.image_status = 'uploading'
+
+    def upload_image(self):
+        '''
+        Uploads the ticket's staged image and its renditions to the media storage, and once the ticket is updated to use
+        them removes it from the staging storage. Returns whether the ticket was updated, which it isn't if its image
+        has changed since it was read, when the uploaded copies are deleted instead, as nothing uses them.
+        '''
+        staging_storage = StagingStorage()
+        staged_name = self.image.name
+        with staging_storage.open(staged_name) as staged_file:
+            self.image.name = self.image.storage.save(staged_name, staged_file, max_length=self.image.field.max_length)
+            self.image_widths = self.get_image_widths(staged_file)
+        self.image_status = 'stored'
+        updated = Ticket.objects.filter(pk=self.pk, image=staged_name, image_status='uploading') \
+            .update(image=self.image.name, image_widths=self.image_widths, image_status=self.image_status)
+        if updated:
+            staging_storage.delete(staged_name)
+        else:
+            if self.image_widths:
+                images.delete_renditions(self.image.name, self.image_widths.split(','), self.image.storage)
+            self.image.storage.delete(self.image.name)
+        self.__dict__.pop('image_renditions', None)
+        return bool(updated)
+
+    def get_image_widths(self, image_file):
+        '''
+        Saves renditions of an image file, as the ticket's image, and returns their widths separated by commas. If the
+        image can't be read, it has no renditions and the original is used in their place.
+        '''
+        try:
+            widths = images.save_renditions(image_file, self.image.name, self.image.storage)
+        except (IOError, ValueError):
+            logger.exception('Couldn\'t save renditions of %s.', self.image.name)
+            widths = []
+        return ','.join(str(width) for width in widths)
+
+    def save_image_renditions(self):
+        '''
+        Saves renditions of the ticket's image and records their widths, deleting any renditions it had before.
+        '''
+        if self.image_widths:
+            images.delete_renditions(self.image.name, self.image_widths.split(','), self.image.storage)
+        self.image_widths = self.get_image_widths(self.image)
+        Ticket.objects.filter(pk=self.pk).update(image_widths=self.image_widths)
+        self.__dict__.pop('image_renditions', None)
+
+    @cached_property
+    def image_renditions(self):
+        '''
+        Returns the srcsets of the image's WebP and JPEG renditions, and the url of the smallest JPEG rendition, or None
+        if it has no renditions.
+        '''
+        if not self.image_widths:
+            return None
+        widths = [int(width) for width in self.image_widths.split(',')]
+        return {
+            'webp_srcset': images.srcset(self.image, widths, 'webp'),
+            'jpeg_srcset': images.srcset(self.image, widths, 'jpg'),
+            'src': self.image.storage.url(images.rendition_name(self.image.name, widths[0], 'jpg')),
+        }
 
     @property
     def noun(self):
@@ -72,14 +245,14 @@ class Ticket(models.Model):
         '''
         returns the number of views the ticket has recieved
         '''
-        return self.pageview_set.all().count()
+        return self.view_count
 
     @property
     def no_votes(self):
         '''
         Returns the sum of votes on an ticket.
         '''
-        return self.vote_set.all().aggregate(Sum('count'))['count__sum'] or 0
+        return self.vote_total
 
     @property
     def comments(self):
@@ -88,17 +261,37 @@ class Ticket(models.Model):
         '''
         return self.comment_set.filter(reply_to=None)
 
+    @cached_property
+    def comment_tree(self):
+        '''
+        Returns the ticket's comments, excluding replies, loaded along with their replies and users in a single query.
+        Each comment's replies are attached as reply_list, and the number of them as reply_count.
+        '''
+        comments = list(self.comment_set.select_related('user').order_by('created', 'id'))
+        replies = {}
+        for comment in comments:
+            comment.ticket = self
+            if comment.reply_to_id is not None:
+                replies.setdefault(comment.reply_to_id, []).append(comment)
+
+        tree = [comment for comment in comments if comment.reply_to_id is None]
+        for comment in tree:
+            comment.reply_list = replies.get(comment.id, [])
+            comment.reply_count = len(comment.reply_list)
+            for reply in comment.reply_list:
+                reply.reply_to = comment
+        return tree
+
     @property
     def no_comments(self):
         '''
         Returns total number of comments and replies.
         '''
-        return self.comment_set.all().count()
+        return self.comment_count
 
-    @property
-    def status(self):
+    def get_status_from_dates(self):
         '''
-        Returns the ticket's status.
+        Returns the ticket's status, the most advanced one with its date set.
         '''
         return 'done' if self.done else 'doing' if self.doing else 'approved' if self.approved else 'awaiting approval'
 
@@ -121,22 +314,24 @@ class Ticket(models.Model):
                 return {'success': False, 'message': 'Already voted for bug fix.'}
 
         elif self.ticket_type == 'Feature':  # Users require credits to vote for Features
-            try:
-                transaction = user.wallet.debit(credits)
-            except Wallet.DoesNotExist:
-                transaction = False
-            if transaction:
-                vote = Vote(user=user, ticket=self, count=credits, transaction=transaction)
-                vote.save()
-                return {'success': True, 'message': 'Successfully voted for feature.'}
-            else:
-                return {'success': False, 'message': 'Insufficient credits to vote for feature.'}
+            # The debit and vote are saved together, so credits are never taken without the vote being counted.
+            with transaction.atomic():
+                try:
+                    debit = user.wallet.debit(credits)
+                except Wallet.DoesNotExist:
+                    debit = False
+                if debit:
+                    vote = Vote(user=user, ticket=self, count=credits, transaction=debit)
+                    vote.save()
+                    return {'success': True, 'message': 'Successfully voted for feature.'}
+                else:
+                    return {'success': False, 'message': 'Insufficient credits to vote for feature.'}
 
     def set_status(self, status):
         '''
         Sets the ticket's status by setting it's date, and the date of any preceding statuses, if it isn't already set.
         '''
-        options = ('approved', 'doing', 'done')
+        options = self.STATUS_FIELDS
         if status in options and getattr(self, status) is None:
             for option in options[:options.index(status) + 1]:
                 if getattr(self, option) is None:
@@ -149,7 +344,8 @@ class Ticket(models.Model):
 
 class Pageview(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
-    created = models.DateTimeField(auto_now_add=True)
+    # Defaults to now rather than using auto_now_add, so views buffered by the PageviewRecorder keep the time they were made.
+    created = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return 'View of ticket {0} at {1}'.format(self.ticket.id, self.created)
@@ -183,6 +379,13 @@ class Comment(models.Model):
     class Meta:
         permissions = (('can_edit_all_comments', 'Edit any user\'s comments.'),)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        comment = super(Comment, cls).from_db(db, field_names, values)
+        # The content as loaded, so saving a comment only updates the search index if its content changed.
+        comment._loaded_content = comment.content if 'content' in field_names else None
+        return comment
+
     def __str__(self):
         return 'By {0} on ticket {1} @ {2}'.format(self.user.username, self.ticket.id, self.created.strftime('%d/%m/%y %H:%M'))
 
@@ -194,6 +397,13 @@ class Comment(models.Model):
     def noun(self):
         return 'reply' if self.reply_to is not None else 'comment'
 
+    @property
+    def urls(self):
+        '''
+        Returns a dictionary of the urls to edit, delete and reply to the comment.
+        '''
+        return get_comment_urls(self.ticket_id, self.pk)
+
     @property
     def replies(self):
         return self.reply_to_set.all()
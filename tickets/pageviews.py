@@ -0,0 +1,168 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from tickets.models import Ticket, Pageview
+from tickets.signals import pageviews_flushed
+
+logger = logging.getLogger(__name__)
+
+
+class PageviewRecorder(object):
+    '''
+    Buffers ticket pageviews in process and writes them to the DB in batches using bulk_create, once either
+    the batch size is reached or the flush interval has passed. Batches are written by a background thread, so no
+    request waits on one. If writing fails the batch is kept to retry, up to max_pending views, after which the oldest
+    views are dropped and counted.
+    '''
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._due = threading.Event()
+        self.dropped = 0
+        self.flushed = 0
+
+    # Settings are read when used, rather than on creation, so they can be overridden.
+
+    @property
+    def batch_size(self):
+        return self._batch_size or settings.PAGEVIEW_BATCH_SIZE
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval or settings.PAGEVIEW_FLUSH_INTERVAL
+
+    @property
+    def max_pending(self):
+        return self._max_pending or settings.PAGEVIEW_MAX_PENDING
+
+    @property
+    def pending(self):
+        '''
+        Returns the number of views waiting to be written.
+        '''
+        return len(self._pending)
+
+    def _drop_overflow(self):
+        '''
+        Drops the oldest pending views beyond max_pending. Must be called holding the lock.
+        '''
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.warning('Dropped %s buffered pageviews.', overflow)
+
+    def record(self, ticket):
+        '''
+        Records a view of a ticket, waking the timer thread to write the buffered views if the batch size or flush
+        interval has been reached. With a batch size of 1 nothing is buffered, and the view is written straight away.
+        '''
+        with self._lock:
+            self._pending.append(Pageview(ticket_id=ticket.id, created=timezone.now()))
+            self._drop_overflow()
+            due = len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval
+
+        if self.batch_size == 1:
+            self.flush()
+            return
+        if due:
+            self._due.set()
+        self._start_timer()
+
+    def flush(self):
+        '''
+        Writes all pending views and adds them to their tickets' view counts. Returns the number of views written.
+        As bulk_create doesn't send post_save, pageviews_flushed is sent with the batch instead.
+        '''
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                Pageview.objects.bulk_create(batch)
+                for ticket_id, views in Counter(view.ticket_id for view in batch).items():
+                    Ticket.objects.filter(pk=ticket_id).update(view_count=F('view_count') + views)
+                pageviews_flushed.send(sender=Pageview, pageviews=batch)
+        except DatabaseError:
+            logger.exception('Failed to write %s buffered pageviews.', len(batch))
+            with self._lock:
+                self._pending = batch + self._pending
+                self._drop_overflow()
+            return 0
+
+        self.flushed += len(batch)
+        return len(batch)
+
+    def _start_timer(self):
+        '''
+        Starts a background thread to flush views after the flush interval, or as soon as a view makes them due.
+        The thread keeps flushing until no views are pending, which it checks holding the lock, so any view recorded
+        as it stops starts another.
+        '''
+        with self._lock:
+            if self._timer is None or not self._timer.is_alive():
+                self._timer = threading.Thread(target=self._flush_periodically, name='pageview-recorder', daemon=True)
+                self._timer.start()
+
+    def _flush_periodically(self):
+        while True:
+            self._due.wait(self.flush_interval)
+            self._due.clear()
+            self.flush()
+            connection.close()
+            with self._lock:
+                if not self._pending:
+                    self._timer = None
+                    return
+
+
+class ViewedTickets(object):
+    '''
+    The tickets a visitor has viewed, so each is only counted once. They're kept in a signed cookie rather than the visitor's
+    session, so counting a view doesn't write to the session. Up to PAGEVIEW_COOKIE_MAX_TICKETS are remembered,
+    after which the least recently viewed are forgotten.
+    '''
+    cookie_name = 'viewed_tickets'
+    salt = 'tickets.pageviews.ViewedTickets'
+
+    def __init__(self, request):
+        value = request.get_signed_cookie(self.cookie_name, default='', salt=self.salt)
+        self.ticket_ids = [int(ticket_id) for ticket_id in value.split('.') if ticket_id.isdigit()]
+        self.changed = False
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self.ticket_ids
+
+    def add(self, ticket_id):
+        if ticket_id in self.ticket_ids:
+            self.ticket_ids.remove(ticket_id)
+        self.ticket_ids = (self.ticket_ids + [ticket_id])[-settings.PAGEVIEW_COOKIE_MAX_TICKETS:]
+        self.changed = True
+
+    def set_cookie(self, response):
+        '''
+        Sets the cookie on the response, if any tickets have been added.
+        '''
+        if self.changed:
+            response.set_signed_cookie(self.cookie_name, '.'.join(str(ticket_id) for ticket_id in self.ticket_ids), salt=self.salt,
+                                       max_age=settings.SESSION_COOKIE_AGE, httponly=True)
+
+
+pageview_recorder = PageviewRecorder()
+
+# Write any remaining views when the process exits, gunicorn workers also flush them in the worker_exit hook.
+atexit.register(pageview_recorder.flush)
@@ -0,0 +1,121 @@
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPage(object):
+    '''
+    A page of results from the KeysetPaginator, with cursors for the pages either side of it.
+    '''
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(object):
+    '''
+    Paginates a queryset by seeking past the ordering values of the first or last object on the current page,
+    rather than using an OFFSET, so deep pages cost the same as the first, and no count is needed.
+    The final field of the ordering must be unique, eg ('-created', '-id').
+    Cursors are signed, so are opaque to users and can't be tampered with.
+    '''
+    salt = 'tickets.pagination.KeysetPaginator'
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def encode_cursor(self, obj, direction):
+        '''
+        Creates a cursor to seek from an object's ordering values in the given direction, 'next' or 'previous'.
+        '''
+        values = [getattr(obj, field) for field, descending in self.fields]
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        return signing.dumps([direction, values], salt=self.salt)
+
+    def decode_cursor(self, cursor):
+        '''
+        Returns the direction and ordering values from a cursor. Raises 404 for invalid cursors.
+        '''
+        try:
+            direction, values = signing.loads(cursor, salt=self.salt)
+        except (signing.BadSignature, ValueError, TypeError):
+            raise Http404('Invalid cursor.')
+        if direction not in ('next', 'previous') or len(values) != len(self.fields):
+            raise Http404('Invalid cursor.')
+
+        return direction, [parse_datetime(value) if self.is_datetime(field) else value
+                           for (field, descending), value in zip(self.fields, values)]
+
+    def is_datetime(self, field):
+        '''
+        Returns whether an ordering field is a DateTimeField, annotations aren't.
+        '''
+        try:
+            return self.queryset.model._meta.get_field(field).get_internal_type() == 'DateTimeField'
+        except FieldDoesNotExist:
+            return False
+
+    def seek(self, values, direction):
+        '''
+        Returns a Q object matching rows that come after the given ordering values, or before them when seeking backwards.
+        '''
+        query = Q()
+        equal = {}
+        for (field, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending == (direction == 'next') else 'gt'
+            query |= Q(**equal) & Q(**{'{}__{}'.format(field, lookup): value})
+            equal[field] = value
+        return query
+
+    def page(self, cursor=None):
+        '''
+        Returns the page the cursor points to, or the first page if there is no cursor.
+        '''
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = 'next', None
+
+        if direction == 'next':
+            queryset = self.queryset.order_by(*self.ordering)
+        else:
+            queryset = self.queryset.order_by(*(name[1:] if name.startswith('-') else '-' + name for name in self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, direction))
+
+        # Fetch one extra result to find out if there is another page beyond this one.
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if direction == 'next':
+            has_next, has_previous = has_more, values is not None
+        else:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+
+        if not object_list:
+            return KeysetPage(object_list)
+        return KeysetPage(object_list,
+                          self.encode_cursor(object_list[-1], 'next') if has_next else None,
+                          self.encode_cursor(object_list[0], 'previous') if has_previous else None)
@@ -0,0 +1,144 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+# Full text search index for tickets, covering their title, content and comments.
+# PostgreSQL stores a weighted tsvector per ticket in a GIN indexed table, SQLite uses an FTS5 virtual table
+# with the ticket id as its rowid. Either way the index has a row per ticket, which is rebuilt whenever
+# the ticket or one of its comments is saved or deleted (see tickets.signals).
+
+
+class RawSubquery(RawSQL):
+    '''
+    Raw SQL subquery for filtering with __in. The lookup puts the subquery in parentheses itself, and a subquery in a
+    second pair, as RawSQL would add, is read as a single value.
+    '''
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class PostgreSQLSearchIndex(object):
+    document = '''
+        setweight(to_tsvector('english', tickets_ticket.title), 'A') ||
+        setweight(to_tsvector('english', tickets_ticket.content), 'B') ||
+        setweight(to_tsvector('english', coalesce((SELECT string_agg(tickets_comment.content, ' ') FROM tickets_comment
+                                                   WHERE tickets_comment.ticket_id = tickets_ticket.id), '')), 'C')
+    '''
+
+    def create(self, cursor):
+        cursor.execute('''CREATE TABLE tickets_search (
+                              ticket_id integer PRIMARY KEY REFERENCES tickets_ticket (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+                              document tsvector NOT NULL)''')
+        cursor.execute('CREATE INDEX tickets_search_document ON tickets_search USING GIN (document)')
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE tickets_search')
+
+    def rebuild(self, cursor):
+        cursor.execute('TRUNCATE tickets_search')
+        cursor.execute('INSERT INTO tickets_search (ticket_id, document) SELECT tickets_ticket.id, {} FROM tickets_ticket'
+                       .format(self.document))
+
+    def update(self, cursor, ticket_id):
+        cursor.execute('''INSERT INTO tickets_search (ticket_id, document)
+                          SELECT tickets_ticket.id, {} FROM tickets_ticket WHERE tickets_ticket.id = %s
+                          ON CONFLICT (ticket_id) DO UPDATE SET document = EXCLUDED.document'''.format(self.document), [ticket_id])
+
+    def remove(self, cursor, ticket_id):
+        cursor.execute('DELETE FROM tickets_search WHERE ticket_id = %s', [ticket_id])
+
+    def search(self, queryset, query):
+        matches = RawSubquery("SELECT ticket_id FROM tickets_search WHERE document @@ plainto_tsquery('english', %s)", [query])
+        rank = RawSQL('''SELECT ts_rank(document, plainto_tsquery('english', %s)) FROM tickets_search
+                         WHERE tickets_search.ticket_id = tickets_ticket.id''', [query])
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+class SQLiteSearchIndex(object):
+    comments = '''coalesce((SELECT group_concat(tickets_comment.content, ' ') FROM tickets_comment
+                            WHERE tickets_comment.ticket_id = tickets_ticket.id), '')'''
+
+    def create(self, cursor):
+        cursor.execute("CREATE VIRTUAL TABLE tickets_search USING fts5(title, content, comments, tokenize = 'porter')")
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE tickets_search')
+
+    def rebuild(self, cursor):
+        cursor.execute('DELETE FROM tickets_search')
+        cursor.execute('''INSERT INTO tickets_search (rowid, title, content, comments)
+                          SELECT tickets_ticket.id, tickets_ticket.title, tickets_ticket.content, {} FROM tickets_ticket'''
+                       .format(self.comments))
+
+    def update(self, cursor, ticket_id):
+        self.remove(cursor, ticket_id)
+        cursor.execute('''INSERT INTO tickets_search (rowid, title, content, comments)
+                          SELECT tickets_ticket.id, tickets_ticket.title, tickets_ticket.content, {} FROM tickets_ticket
+                          WHERE tickets_ticket.id = %s'''.format(self.comments), [ticket_id])
+
+    def remove(self, cursor, ticket_id):
+        cursor.execute('DELETE FROM tickets_search WHERE rowid = %s', [ticket_id])
+
+    @staticmethod
+    def match_expression(query):
+        '''
+        Quotes each word of the query, so FTS5 treats them as terms to match rather than query syntax.
+        '''
+        return ' '.join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        matches = RawSubquery('SELECT rowid FROM tickets_search WHERE tickets_search MATCH %s', [expression])
+        # bm25 scores are lower for better matches, so are negated to rank the best matches highest.
+        rank = RawSQL('''SELECT -bm25(tickets_search, 10.0, 5.0, 1.0) FROM tickets_search
+                         WHERE tickets_search MATCH %s AND tickets_search.rowid = tickets_ticket.id''', [expression])
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+SEARCH_INDEXES = {
+    'postgresql': PostgreSQLSearchIndex,
+    'sqlite': SQLiteSearchIndex,
+}
+
+
+def get_search_index(connection):
+    '''
+    Returns the search index for a database connection.
+    '''
+    try:
+        return SEARCH_INDEXES[connection.vendor]()
+    except KeyError:
+        raise NotImplementedError('Ticket search is not supported on {}.'.format(connection.vendor))
+
+
+def update_ticket(ticket_id, using='default'):
+    '''
+    Rebuilds a ticket's entry in the search index from its title, content and comments.
+    '''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        get_search_index(connection).update(cursor, ticket_id)
+
+
+def remove_ticket(ticket_id, using='default'):
+    '''
+    Removes a ticket from the search index.
+    '''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        get_search_index(connection).remove(cursor, ticket_id)
+
+
+def rebuild(using='default'):
+    '''
+    Rebuilds the whole search index.
+    '''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        get_search_index(connection).rebuild(cursor)
+
+
+def search_tickets(queryset, query):
+    '''
+    Filters a ticket queryset to those matching a search query, annotated with their search_rank, higher ranks matching best.
+    '''
+    return get_search_index(connections[queryset.db]).search(queryset, query)
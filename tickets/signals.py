@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
+from tickets.models import Ticket, Pageview, Vote, Comment
+from tickets import search
+from tickets.uploads import media_uploader
+import threading
+
+# Sent by the pageview recorder with each batch of pageviews it writes.
+pageviews_flushed = Signal(providing_args=['pageviews'])
+
+# The ids of the tickets each thread is deleting. Their comments are deleted along with them, and needn't each rebuild
+# the ticket's search index entry, as the entry is removed with the ticket.
+deleting = threading.local()
+
+
+def deleting_tickets():
+    if not hasattr(deleting, 'ticket_ids'):
+        deleting.ticket_ids = set()
+    return deleting.ticket_ids
+
+
+def adjust_counter(instance, counter, amount):
+    '''
+    Adjusts one of the engagement counters on an object's ticket in place in the DB,
+    and on the object's cached ticket instance if it has one.
+    '''
+    Ticket.objects.filter(pk=instance.ticket_id).update(**{counter: F(counter) + amount})
+    if type(instance).ticket.is_cached(instance):
+        setattr(instance.ticket, counter, getattr(instance.ticket, counter) + amount)
+
+
+# Pageviews are only ever deleted along with their ticket, so they have no post_delete receiver,
+# which leaves Django free to bulk delete them when a ticket is deleted.
+@receiver(post_save, sender=Pageview)
+def count_pageview(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        adjust_counter(instance, 'view_count', 1)
+
+
+@receiver(post_save, sender=Vote)
+def count_vote(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        adjust_counter(instance, 'vote_total', instance.count)
+
+
+@receiver(post_delete, sender=Vote)
+def uncount_vote(sender, instance, **kwargs):
+    adjust_counter(instance, 'vote_total', -instance.count)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        adjust_counter(instance, 'comment_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    # Also fires for each reply deleted along with its comment.
+    adjust_counter(instance, 'comment_count', -1)
+
+
+@receiver(post_save, sender=Ticket)
+def index_ticket(sender, instance, raw, using, **kwargs):
+    if not raw:
+        search.update_ticket(instance.id, using)
+
+
+@receiver(post_save, sender=Ticket)
+def upload_staged_image(sender, instance, raw, **kwargs):
+    # Staged images are uploaded once the ticket is committed, so the upload thread can read it.
+    if not raw and getattr(instance, '_image_staged', False):
+        ticket_id = instance.pk
+        transaction.on_commit(lambda: media_uploader.submit(ticket_id))
+
+
+@receiver(pre_delete, sender=Ticket)
+def start_deleting_ticket(sender, instance, **kwargs):
+    deleting_tickets().add(instance.id)
+
+
+@receiver(post_delete, sender=Ticket)
+def unindex_ticket(sender, instance, using, **kwargs):
+    search.remove_ticket(instance.id, using)
+    deleting_tickets().discard(instance.id)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, raw, using, **kwargs):
+    if not raw and (created or instance.content != getattr(instance, '_loaded_content', None)):
+        search.update_ticket(instance.ticket_id, using)
+    instance._loaded_content = instance.content
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, using, **kwargs):
+    if instance.ticket_id not in deleting_tickets():
+        search.update_ticket(instance.ticket_id, using)
@@ -0,0 +1,47 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.six import StringIO
+from tickets.models import Ticket, Comment, Vote, Pageview
+
+
+class RebuildTicketCountersTestCase(TestCase):
+    '''
+    Class to test the rebuild_ticket_counters management command.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+
+        cls.test_ticket = Ticket.objects.create(user=cls.test_user, title='Test ticket', content='Test content')
+        cls.other_ticket = Ticket.objects.create(user=cls.test_user, title='Other ticket', content='Test content')
+
+        for n in range(3):
+            Pageview.objects.create(ticket=cls.test_ticket)
+            Vote.objects.create(user=cls.test_user, ticket=cls.test_ticket, count=2)
+            Comment.objects.create(user=cls.test_user, ticket=cls.test_ticket, content='Test comment')
+
+    def test_rebuild_corrects_drifted_counters(self):
+        '''
+        Counters that have drifted from their source tables should be rebuilt from them.
+        '''
+        Ticket.objects.filter(id=self.test_ticket.id).update(view_count=100, vote_total=0, comment_count=7)
+        Ticket.objects.filter(id=self.other_ticket.id).update(view_count=5)
+
+        out = StringIO()
+        call_command('rebuild_ticket_counters', stdout=out)
+        self.assertIn('2 tickets', out.getvalue())
+
+        ticket = Ticket.objects.get(id=self.test_ticket.id)
+        self.assertEqual((3, 6, 3), (ticket.no_views, ticket.no_votes, ticket.no_comments))
+        ticket = Ticket.objects.get(id=self.other_ticket.id)
+        self.assertEqual((0, 0, 0), (ticket.no_views, ticket.no_votes, ticket.no_comments))
+
+    def test_rebuild_leaves_correct_counters_alone(self):
+        '''
+        Tickets whose counters are correct should not be rewritten.
+        '''
+        out = StringIO()
+        call_command('rebuild_ticket_counters', stdout=out)
+        self.assertIn('0 tickets', out.getvalue())
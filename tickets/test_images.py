@@ -0,0 +1,177 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+import shutil
+import tempfile
+from tickets.models import Ticket
+from tickets.images import rendition_name, rendition_widths, write
+
+
+def image_file(size, image_format='JPEG', mode='RGB', exif=None):
+    '''
+    Returns an uploaded image file of a size.
+    '''
+    data = BytesIO()
+    options = {'exif': exif} if exif else {}
+    Image.new(mode, size, 'red').save(data, image_format, **options)
+    return SimpleUploadedFile('photo.{}'.format(image_format.lower()), data.getvalue())
+
+
+def exif_orientation(orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return exif.tobytes()
+
+
+class TicketImageTestCase(TestCase):
+    '''
+    Tests for the renditions of tickets' attached images.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com', password='tH1$isA7357')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_ticket(self, image):
+        return Ticket.objects.create(user=self.test_user, title='Test', content='Test', image=image)
+
+    def open_rendition(self, ticket, width, extension):
+        return Image.open(default_storage.open(rendition_name(ticket.image.name, width, extension)))
+
+    def test_rendition_widths(self):
+        '''
+        Images should be resized to each width narrower than them, or their own width if they're narrower than all.
+        '''
+        self.assertEqual([320, 640, 1280], rendition_widths(4000))
+        self.assertEqual([320, 640], rendition_widths(1280))
+        self.assertEqual([200], rendition_widths(200))
+
+    def test_renditions_saved_on_upload(self):
+        '''
+        Uploaded images should be saved as WebP and JPEG renditions at each width, keeping their aspect ratio and
+        dropping their metadata.
+        '''
+        ticket = self.create_ticket(image_file((2000, 1000), exif=exif_orientation(1)))
+        self.assertEqual('320,640,1280', ticket.image_widths)
+        self.assertEqual('320,640,1280', Ticket.objects.get(pk=ticket.pk).image_widths)
+        for width in (320, 640, 1280):
+            webp = self.open_rendition(ticket, width, 'webp')
+            jpeg = self.open_rendition(ticket, width, 'jpg')
+            self.assertEqual(('WEBP', (width, width // 2)), (webp.format, webp.size))
+            self.assertEqual(('JPEG', (width, width // 2)), (jpeg.format, jpeg.size))
+            self.assertNotIn('exif', jpeg.info)
+
+    def test_renditions_turned_by_exif_orientation(self):
+        '''
+        Renditions should be turned the way up the image's EXIF orientation says.
+        '''
+        ticket = self.create_ticket(image_file((400, 200), exif=exif_orientation(6)))
+        self.assertEqual('200', ticket.image_widths)
+        self.assertEqual((200, 400), self.open_rendition(ticket, 200, 'jpg').size)
+
+    def test_transparent_images_saved_as_jpeg(self):
+        '''
+        Transparent images should have JPEG renditions too.
+        '''
+        ticket = self.create_ticket(image_file((100, 100), 'PNG', 'RGBA'))
+        self.assertEqual('100', ticket.image_widths)
+        self.assertEqual('RGB', self.open_rendition(ticket, 100, 'jpg').mode)
+
+    def test_unreadable_image_has_no_renditions(self):
+        '''
+        Tickets whose images can't be read should use the original image.
+        '''
+        with self.assertLogs('tickets.models', 'ERROR'):
+            ticket = self.create_ticket(SimpleUploadedFile('photo.jpg', b'not an image'))
+        self.assertEqual('', ticket.image_widths)
+        self.assertIsNone(ticket.image_renditions)
+
+    def test_removing_image_clears_renditions(self):
+        '''
+        Removing a ticket's image should clear its rendition widths.
+        '''
+        ticket = self.create_ticket(image_file((100, 100)))
+        ticket.image = None
+        ticket.save()
+        self.assertEqual('', Ticket.objects.get(pk=ticket.pk).image_widths)
+
+    def test_ticket_page_uses_renditions(self):
+        '''
+        The ticket page should show the renditions with srcsets, lazily loaded, rather than the original.
+        '''
+        ticket = self.create_ticket(image_file((1000, 500)))
+        ticket.approved = ticket.created
+        ticket.save()
+        response = self.client.get(ticket.get_absolute_url())
+        webp = ', '.join('{} {}w'.format(default_storage.url(rendition_name(ticket.image.name, width, 'webp')), width)
+                         for width in (320, 640))
+        self.assertContains(response, 'srcset="{}"'.format(webp), count=2)
+        self.assertContains(response, 'src="{}"'.format(default_storage.url(rendition_name(ticket.image.name, 320, 'jpg'))),
+                            count=2)
+        self.assertContains(response, 'loading="lazy"', count=2)
+        self.assertNotContains(response, 'src="{}"'.format(ticket.image.url))
+
+    def test_image_modal_rendered_afresh_when_ticket_changes(self):
+        '''
+        The image modal is cached, and should be rendered again when the ticket's title or image changes.
+        '''
+        ticket = self.create_ticket(image_file((100, 100)))
+        ticket.approved = ticket.created
+        ticket.save()
+        self.assertContains(self.client.get(ticket.get_absolute_url()), 'Attached image for {}'.format(ticket), count=3)
+        ticket.title = 'New title'
+        ticket.save()
+        self.assertContains(self.client.get(ticket.get_absolute_url()), 'Attached image for {}'.format(ticket), count=3)
+
+    def test_save_image_renditions_command(self):
+        '''
+        The save_image_renditions command should save renditions of images without them.
+        '''
+        ticket = self.create_ticket(image_file((100, 100)))
+        Ticket.objects.filter(pk=ticket.pk).update(image_widths='')
+        out = StringIO()
+        call_command('save_image_renditions', stdout=out)
+        self.assertEqual('Saved renditions of 1 images.', out.getvalue().strip())
+        self.assertEqual('100', Ticket.objects.get(pk=ticket.pk).image_widths)
+
+    def test_save_image_renditions_command_all(self):
+        '''
+        The save_image_renditions command should save renditions of every image afresh with --all, replacing the old ones.
+        '''
+        ticket = self.create_ticket(image_file((100, 100)))
+        call_command('save_image_renditions', '--all', stdout=StringIO())
+        self.assertEqual('100', Ticket.objects.get(pk=ticket.pk).image_widths)
+        self.assertEqual(['100w.jpg', '100w.webp'],
+                         sorted(default_storage.listdir('{}.renditions'.format(ticket.image.name))[1]))
+
+    def test_renditions_written_without_checking_names(self):
+        '''
+        Renditions should be written under their names, without checking whether the names are taken.
+        '''
+        with mock.patch.object(FileSystemStorage, 'exists', wraps=default_storage.exists) as exists:
+            ticket = self.create_ticket(image_file((1000, 500)))
+        self.assertEqual([mock.call(ticket.image.name)], exists.call_args_list)
+        self.assertEqual('320,640', ticket.image_widths)
+
+    def test_write_replaces_file_left_under_name(self):
+        '''
+        Writing a file under a name a file was left under should replace it, rather than saving under another name.
+        '''
+        name = rendition_name('photo.jpeg', 320, 'jpg')
+        default_storage.save(name, ContentFile(b'old'))
+        self.assertEqual(name, write(default_storage, name, ContentFile(b'new')))
+        with default_storage.open(name) as rendition:
+            self.assertEqual(b'new', rendition.read())
+        self.assertEqual(['320w.jpg'], default_storage.listdir('photo.jpeg.renditions')[1])
@@ -1,8 +1,9 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.urls import reverse, set_script_prefix
 from django.utils import timezone
 from datetime import timedelta
-from tickets.models import Ticket, Comment, Vote, Label
+from tickets.models import Ticket, Comment, Vote, Label, get_ticket_url
 from credits.models import Wallet
 
 
@@ -47,6 +48,18 @@ class TicketModelTestCase(TestCase):
         self.assertTemplateUsed(response, 'ticket_detail.html')
         self.assertEqual(response.context['object'], ticket)
 
+    def test_absolute_url_includes_script_prefix(self):
+        '''
+        Test cached ticket urls are reversed again for each script prefix.
+        '''
+        self.assertEqual('/tickets/1/', get_ticket_url(1))
+        set_script_prefix('/prefix/')
+        try:
+            self.assertEqual('/prefix/tickets/1/', get_ticket_url(1))
+        finally:
+            set_script_prefix('/')
+        self.assertEqual('/tickets/1/', get_ticket_url(1))
+
     def test_noun_returns_verbose_ticket_type(self):
         ticket = Ticket.objects.get(id=self.bug_ticket.id)
         self.assertEqual(ticket.noun, 'Bug Report')
@@ -60,6 +73,7 @@ class TicketModelTestCase(TestCase):
         '''
         test_ticket = Ticket(user=self.test_user, title='Views', content='Test content')
         test_ticket.save()
+        test_ticket.set_status('approved')
 
         test_ticket = Ticket.objects.get(id=test_ticket.id)
         self.assertEqual(0, test_ticket.no_views)
@@ -118,6 +132,37 @@ class TicketModelTestCase(TestCase):
         self.assertQuerysetEqual(test_ticket.comments, Comment.objects.filter(ticket=test_ticket, reply_to=None),
                                  transform=lambda x: x, ordered=False)
 
+    def test_comment_tree_loads_comments_and_replies_in_one_query(self):
+        '''
+        Test the comment_tree property returns the Ticket's comments with their replies and reply counts attached,
+        loading them, and their users, in a single query.
+        '''
+        test_ticket = Ticket(user=self.test_user, title='Test Comment Tree', content='Test content')
+        test_ticket.save()
+
+        comment1 = Comment(user=self.test_user, ticket=test_ticket, content='Test comment 1')
+        comment1.save()
+
+        comment2 = Comment(user=self.test_user, ticket=test_ticket, content='Test comment 2')
+        comment2.save()
+
+        reply1 = Comment(user=self.test_user, ticket=test_ticket, reply_to=comment2, content='Test reply 1')
+        reply1.save()
+
+        reply2 = Comment(user=self.test_user, ticket=test_ticket, reply_to=comment2, content='Test reply 2')
+        reply2.save()
+
+        test_ticket = Ticket.objects.get(id=test_ticket.id)
+        with self.assertNumQueries(1):
+            tree = test_ticket.comment_tree
+            self.assertEqual([comment1, comment2], tree)
+            self.assertEqual([], tree[0].reply_list)
+            self.assertEqual(0, tree[0].reply_count)
+            self.assertEqual([reply1, reply2], tree[1].reply_list)
+            self.assertEqual(2, tree[1].reply_count)
+            self.assertEqual('TestUser', tree[1].reply_list[0].user.username)
+            self.assertEqual(tree[1], tree[1].reply_list[0].reply_to)
+
     def test_no_comments_returns_total_comments(self):
         '''
         Test the no_comments property returns a count of all comments on an Ticket.
@@ -140,9 +185,42 @@ class TicketModelTestCase(TestCase):
         self.assertEqual(0, test_ticket_wo_comments.no_comments)
         self.assertEqual(3, test_ticket_comments.no_comments)
 
+    def test_deleting_comment_decreases_comment_count_including_replies(self):
+        '''
+        Deleting a comment should decrease the ticket's comment count by the comment and all of its replies.
+        '''
+        test_ticket = Ticket(user=self.test_user, title='Delete Comments', content='Test content')
+        test_ticket.save()
+
+        comment = Comment(user=self.test_user, ticket=test_ticket, content='Test comment')
+        comment.save()
+        Comment(user=self.test_user, ticket=test_ticket, content='Test comment 2').save()
+        Comment(user=self.test_user, ticket=test_ticket, reply_to=comment, content='Test reply').save()
+        Comment(user=self.test_user, ticket=test_ticket, reply_to=comment, content='Test reply 2').save()
+
+        self.assertEqual(4, Ticket.objects.get(id=test_ticket.id).no_comments)
+
+        comment.delete()
+        self.assertEqual(1, Ticket.objects.get(id=test_ticket.id).no_comments)
+
+    def test_saving_stale_ticket_does_not_overwrite_counters(self):
+        '''
+        Saving a ticket loaded before votes were cast should not reset its engagement counters.
+        '''
+        test_ticket = Ticket(user=self.test_user, title='Stale Ticket', content='Test content')
+        test_ticket.save()
+        stale_ticket = Ticket.objects.get(id=test_ticket.id)
+
+        Vote.objects.create(user=self.test_user, ticket=test_ticket, count=4)
+        stale_ticket.set_status('approved')
+
+        test_ticket = Ticket.objects.get(id=test_ticket.id)
+        self.assertEqual(4, test_ticket.no_votes)
+        self.assertEqual('approved', test_ticket.status)
+
     def test_status_returns_most_recent_status(self):
         '''
-        Test the status property returns the most advanced status that has been logged.
+        Test the stored status is the most advanced status that has been logged.
         '''
         test_ticket = Ticket(user=self.test_user, title='Status', content='Test content')
         test_ticket.save()
@@ -165,6 +243,17 @@ class TicketModelTestCase(TestCase):
         test_ticket = Ticket.objects.get(id=test_ticket.id)
         self.assertEqual('done', test_ticket.status)
 
+    def test_status_saved_with_update_fields(self):
+        '''
+        Test saving only a status date also saves the status.
+        '''
+        test_ticket = Ticket(user=self.test_user, title='Status', content='Test content')
+        test_ticket.save()
+
+        test_ticket.approved = timezone.now()
+        test_ticket.save(update_fields=['approved'])
+        self.assertTrue(Ticket.objects.filter(id=test_ticket.id, status='approved').exists())
+
 # TEST TICKET HAS_VOTED METHOD #
 
     def test_has_voted_returns_false_if_user_has_not_voted(self):
@@ -482,6 +571,16 @@ class CommentModelTestCase(TestCase):
         comment2 = Comment.objects.get(id=self.comment2.id)
         self.assertEqual(comment2.no_replies, 1)
 
+    def test_comment_urls_return_edit_delete_and_reply_urls(self):
+        '''
+        Test the urls property returns the urls to edit, delete and reply to the comment.
+        '''
+        comment = Comment.objects.get(id=self.comment1.id)
+        kwargs = {'ticket_pk': self.test_ticket.id, 'pk': comment.id}
+        self.assertEqual({'edit': reverse('edit-comment', kwargs=kwargs), 'delete': reverse('delete-comment', kwargs=kwargs),
+                          'reply': reverse('add-reply', kwargs={'ticket_pk': self.test_ticket.id, 'comment_pk': comment.id})},
+                         comment.urls)
+
 
 class LabelModelTestCase(TestCase):
     '''
@@ -0,0 +1,155 @@
+from django.test import TestCase, RequestFactory, override_settings
+from django.http import HttpResponse
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from unittest import mock
+from tickets.models import Ticket, Pageview
+from tickets.pageviews import PageviewRecorder, ViewedTickets
+
+
+class PageviewRecorderTestCase(TestCase):
+    '''
+    Class to test the buffered PageviewRecorder.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+        cls.test_ticket = Ticket.objects.create(user=cls.test_user, title='Test ticket', content='Test content')
+        cls.other_ticket = Ticket.objects.create(user=cls.test_user, title='Other ticket', content='Test content')
+
+    def setUp(self):
+        self.recorder = PageviewRecorder(batch_size=5, flush_interval=3600, max_pending=8)
+        # The timer thread is run by the tests that need it, so it doesn't write to the DB from another thread.
+        timer = mock.patch.object(self.recorder, '_start_timer')
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def test_views_are_buffered_until_batch_size(self):
+        '''
+        Views should be held until the batch size is reached, then written together by the timer thread,
+        without writing anything in the request recording them.
+        '''
+        with self.assertNumQueries(0):
+            for n in range(4):
+                self.recorder.record(self.test_ticket)
+            self.assertEqual(4, self.recorder.pending)
+            self.assertFalse(self.recorder._due.is_set())
+
+            self.recorder.record(self.other_ticket)
+            self.assertEqual(5, self.recorder.pending)
+            self.assertTrue(self.recorder._due.is_set())
+
+        with mock.patch('tickets.pageviews.connection'):
+            self.recorder._flush_periodically()
+        self.assertFalse(self.recorder._due.is_set())
+        self.assertEqual(0, self.recorder.pending)
+        self.assertEqual(5, Pageview.objects.count())
+        self.assertEqual(5, self.recorder.flushed)
+
+    def test_unbuffered_views_written_straight_away(self):
+        '''
+        With a batch size of 1, each view should be written as it's recorded.
+        '''
+        recorder = PageviewRecorder(batch_size=1, flush_interval=3600, max_pending=8)
+        recorder.record(self.test_ticket)
+        self.assertEqual(0, recorder.pending)
+        self.assertEqual(1, Pageview.objects.count())
+        self.assertIsNone(recorder._timer)
+
+    def test_flush_updates_view_counts(self):
+        '''
+        Flushing should add the written views to each ticket's view count.
+        '''
+        for n in range(3):
+            self.recorder.record(self.test_ticket)
+        self.recorder.record(self.other_ticket)
+        self.assertEqual(4, self.recorder.flush())
+
+        self.assertEqual(3, Ticket.objects.get(id=self.test_ticket.id).no_views)
+        self.assertEqual(1, Ticket.objects.get(id=self.other_ticket.id).no_views)
+
+    def test_views_are_flushed_after_interval(self):
+        '''
+        A view recorded after the flush interval has passed should wake the timer thread, whatever the buffer's size.
+        '''
+        recorder = PageviewRecorder(batch_size=5, flush_interval=1, max_pending=8)
+        with mock.patch.object(recorder, '_start_timer'), \
+                mock.patch('tickets.pageviews.time.monotonic', return_value=recorder._last_flush + 2):
+            recorder.record(self.test_ticket)
+        self.assertEqual(1, recorder.pending)
+        self.assertTrue(recorder._due.is_set())
+
+    def test_timer_restarted_after_it_stops(self):
+        '''
+        Once the timer thread has flushed the pending views and stopped, the next view should start another.
+        '''
+        recorder = PageviewRecorder(batch_size=5, flush_interval=3600, max_pending=8)
+        recorder.record(self.test_ticket)
+        with mock.patch.object(recorder._due, 'wait'), mock.patch('tickets.pageviews.connection'):
+            recorder._flush_periodically()
+        self.assertEqual(1, Pageview.objects.count())
+        self.assertIsNone(recorder._timer)
+
+        recorder.record(self.test_ticket)
+        self.assertTrue(recorder._timer.is_alive())
+
+    def test_failed_flush_keeps_views_and_drops_overflow(self):
+        '''
+        Views should be kept to retry when writing fails, with the oldest dropped and counted beyond max_pending.
+        '''
+        with mock.patch.object(Pageview.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('tickets.pageviews'):
+            for n in range(10):
+                self.recorder.record(self.test_ticket)
+            self.assertEqual(0, self.recorder.flush())
+        self.assertEqual(8, self.recorder.pending)
+        self.assertEqual(2, self.recorder.dropped)
+
+        self.assertEqual(8, self.recorder.flush())
+        self.assertEqual(8, Ticket.objects.get(id=self.test_ticket.id).no_views)
+
+
+class ViewedTicketsTestCase(TestCase):
+    '''
+    Class to test the viewed tickets cookie.
+    '''
+    def viewed_tickets_after(self, response):
+        request = RequestFactory().get('/')
+        request.COOKIES[ViewedTickets.cookie_name] = response.cookies[ViewedTickets.cookie_name].value
+        return ViewedTickets(request)
+
+    def test_viewed_tickets_kept_in_signed_cookie(self):
+        '''
+        Added tickets should be read back from the cookie, and tampered cookies ignored.
+        '''
+        viewed_tickets = ViewedTickets(RequestFactory().get('/'))
+        self.assertNotIn(1, viewed_tickets)
+        viewed_tickets.add(1)
+        viewed_tickets.add(12)
+        response = HttpResponse()
+        viewed_tickets.set_cookie(response)
+
+        viewed_tickets = self.viewed_tickets_after(response)
+        self.assertEqual([1, 12], viewed_tickets.ticket_ids)
+
+        response.cookies[ViewedTickets.cookie_name] = response.cookies[ViewedTickets.cookie_name].value.replace('12', '13')
+        self.assertEqual([], self.viewed_tickets_after(response).ticket_ids)
+
+    def test_cookie_only_set_when_changed(self):
+        '''
+        The cookie should only be set if tickets have been added.
+        '''
+        response = HttpResponse()
+        ViewedTickets(RequestFactory().get('/')).set_cookie(response)
+        self.assertNotIn(ViewedTickets.cookie_name, response.cookies)
+
+    @override_settings(PAGEVIEW_COOKIE_MAX_TICKETS=3)
+    def test_least_recently_viewed_forgotten(self):
+        '''
+        Only the most recently viewed tickets should be remembered.
+        '''
+        viewed_tickets = ViewedTickets(RequestFactory().get('/'))
+        for ticket_id in (1, 2, 3, 1, 4):
+            viewed_tickets.add(ticket_id)
+        self.assertEqual([3, 1, 4], viewed_tickets.ticket_ids)
@@ -0,0 +1,116 @@
+from django.test import TestCase
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.utils.six import StringIO
+from tickets.models import Ticket, Comment
+from tickets.search import search_tickets
+
+
+class SearchTestCase(TestCase):
+    '''
+    Class to test the ticket search index.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com',
+                                                 password='tH1$isA7357')
+
+        cls.title_ticket = Ticket.objects.create(user=cls.test_user, title='Unicorns fly backwards', content='Test content')
+        cls.content_ticket = Ticket.objects.create(user=cls.test_user, title='Movement bug',
+                                                   content='My unicorn is flying backwards')
+        cls.comment_ticket = Ticket.objects.create(user=cls.test_user, title='Another ticket', content='Test content')
+        Comment.objects.create(user=cls.test_user, ticket=cls.comment_ticket, content='Unicorns are flying backwards here too')
+        cls.other_ticket = Ticket.objects.create(user=cls.test_user, title='Dragons', content='Test content')
+
+    def search(self, query):
+        return list(search_tickets(Ticket.objects.all(), query).order_by('-search_rank', '-id'))
+
+    def test_search_matches_title_content_and_comments(self):
+        '''
+        Searching should match tickets by their titles, content and comments, and not match other tickets.
+        '''
+        results = self.search('unicorn')
+        self.assertEqual(3, len(results))
+        self.assertNotIn(self.other_ticket, results)
+
+    def test_search_ranks_title_matches_highest(self):
+        '''
+        Title matches should rank above content matches, which rank above comment matches.
+        '''
+        self.assertEqual([self.title_ticket, self.content_ticket, self.comment_ticket], self.search('unicorns backwards'))
+
+    def test_search_requires_all_words(self):
+        '''
+        Tickets should only match when they contain every word in the query.
+        '''
+        self.assertEqual([self.content_ticket], self.search('unicorn movement'))
+
+    def test_search_ignores_query_syntax(self):
+        '''
+        Query syntax characters should be searched for as text rather than raising errors.
+        '''
+        self.assertEqual([], self.search('"unicorn* OR (NEAR'))
+
+    def test_index_updates_on_ticket_edit_and_delete(self):
+        '''
+        Editing a ticket should update its entry in the index, and deleting it should remove it.
+        '''
+        ticket = Ticket.objects.get(id=self.other_ticket.id)
+        ticket.title = 'Griffins'
+        ticket.save()
+        self.assertEqual([ticket], self.search('griffin'))
+        self.assertEqual([], self.search('dragons'))
+
+        ticket.delete()
+        self.assertEqual([], self.search('griffin'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM tickets_search')
+            self.assertEqual(3, cursor.fetchone()[0])
+
+    def test_index_updates_on_comment_save_and_delete(self):
+        '''
+        Adding and deleting comments should update their ticket's entry in the index.
+        '''
+        comment = Comment.objects.create(user=self.test_user, ticket=self.other_ticket, content='Breathes fire')
+        self.assertEqual([self.other_ticket], self.search('fire'))
+
+        comment.delete()
+        self.assertEqual([], self.search('fire'))
+
+    def test_index_only_updates_on_comment_content_change(self):
+        '''
+        Saving a comment should only update the index if its content changed.
+        '''
+        comment = Comment.objects.create(user=self.test_user, ticket=self.other_ticket, content='Breathes fire')
+        comment = Comment.objects.get(pk=comment.pk)
+        with mock.patch('tickets.search.update_ticket') as update_ticket:
+            comment.save()
+            update_ticket.assert_not_called()
+            comment.content = 'Breathes ice'
+            comment.save()
+            update_ticket.assert_called_once_with(self.other_ticket.id, 'default')
+
+    def test_index_not_updated_for_comments_deleted_with_ticket(self):
+        '''
+        Deleting a ticket should remove it from the index without updating it for each of its comments.
+        '''
+        ticket = Ticket.objects.create(user=self.test_user, title='Dragons', content='Test content')
+        for n in range(3):
+            Comment.objects.create(user=self.test_user, ticket=ticket, content='Breathes fire')
+        with mock.patch('tickets.search.update_ticket') as update_ticket:
+            ticket.delete()
+        update_ticket.assert_not_called()
+        self.assertEqual([], self.search('fire'))
+
+    def test_rebuild_search_index(self):
+        '''
+        The rebuild_search_index command should restore entries missing from the index.
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM tickets_search')
+        self.assertEqual([], self.search('unicorn'))
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(3, len(self.search('unicorn')))
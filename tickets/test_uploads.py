@@ -0,0 +1,161 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
+import os
+import shutil
+import tempfile
+from issue_tracker.custom_storages import StagingStorage
+from tickets.models import Ticket
+from tickets.images import rendition_name
+from tickets.uploads import media_uploader
+from tickets.test_images import image_file
+
+
+class FlakyStorage(FileSystemStorage):
+    '''
+    Local stand-in for the media storage on S3, which fails to save the next failures files.
+    '''
+    failures = 0
+
+    def _save(self, name, content):
+        if FlakyStorage.failures:
+            FlakyStorage.failures -= 1
+            raise ConnectionError('Upload failed.')
+        return super(FlakyStorage, self)._save(name, content)
+
+
+def run_on_commit():
+    '''
+    Runs callbacks registered with on_commit straight away, as the transaction around each test never commits.
+    '''
+    return mock.patch('tickets.models.transaction.on_commit', side_effect=lambda func, using=None: func())
+
+
+class MediaUploadTestCase(TestCase):
+    '''
+    Tests for uploading tickets' images in the background.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='TestUser', email='test@test.com', password='tH1$isA7357')
+
+    def setUp(self):
+        media_root, staging_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, staging_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, MEDIA_STAGING_ROOT=staging_root, DEFER_MEDIA_UPLOADS=True,
+                                              DEFAULT_FILE_STORAGE='tickets.test_uploads.FlakyStorage',
+                                              MEDIA_UPLOAD_RETRY_DELAY=0, MEDIA_UPLOAD_MAX_ATTEMPTS=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        FlakyStorage.failures = 0
+
+    def create_ticket(self):
+        return Ticket.objects.create(user=self.test_user, title='Test', content='Test', image=image_file((1000, 500)))
+
+    def test_image_staged_on_save(self):
+        '''
+        Uploaded images should be written to the staging storage, rather than the media storage, as the ticket is saved.
+        '''
+        ticket = self.create_ticket()
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        self.assertEqual('uploading', ticket.image_status)
+        self.assertEqual('', ticket.image_widths)
+        self.assertTrue(StagingStorage().exists(ticket.image.name))
+        self.assertFalse(default_storage.exists(ticket.image.name))
+
+    def test_upload_image(self):
+        '''
+        Uploading a staged image should save it and its renditions to the media storage, and remove it from staging.
+        '''
+        ticket = self.create_ticket()
+        self.assertTrue(media_uploader.upload(ticket.pk))
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        self.assertEqual('stored', ticket.image_status)
+        self.assertEqual('320,640', ticket.image_widths)
+        self.assertTrue(default_storage.exists(ticket.image.name))
+        self.assertTrue(default_storage.exists(rendition_name(ticket.image.name, 640, 'webp')))
+        self.assertEqual([], os.listdir(StagingStorage().location))
+
+    def test_upload_image_retried(self):
+        '''
+        Failed uploads should be retried.
+        '''
+        ticket = self.create_ticket()
+        FlakyStorage.failures = 2
+        with self.assertLogs('tickets.uploads', 'ERROR') as logs:
+            self.assertTrue(media_uploader.upload(ticket.pk))
+        self.assertEqual(2, len(logs.records))
+        self.assertEqual('stored', Ticket.objects.get(pk=ticket.pk).image_status)
+
+    def test_upload_image_fails_after_max_attempts(self):
+        '''
+        Images should be marked as failed after failing to upload MEDIA_UPLOAD_MAX_ATTEMPTS times, keeping the staged
+        image for the upload_ticket_images command to upload.
+        '''
+        ticket = self.create_ticket()
+        FlakyStorage.failures = 3
+        with self.assertLogs('tickets.uploads', 'ERROR'):
+            self.assertFalse(media_uploader.upload(ticket.pk))
+        self.assertEqual('failed', Ticket.objects.get(pk=ticket.pk).image_status)
+        self.assertTrue(StagingStorage().exists(ticket.image.name))
+
+        out = StringIO()
+        call_command('upload_ticket_images', stdout=out)
+        self.assertEqual('Uploaded 1 ticket images, 0 failed.', out.getvalue().strip())
+        self.assertEqual('stored', Ticket.objects.get(pk=ticket.pk).image_status)
+
+    def test_upload_image_leaves_changed_image(self):
+        '''
+        A ticket whose image has changed since it was read shouldn't have its image replaced by the upload.
+        '''
+        ticket = self.create_ticket()
+        staged_name = ticket.image.name
+        Ticket.objects.filter(pk=ticket.pk).update(image='other.jpg')
+        self.assertFalse(ticket.upload_image())
+        self.assertEqual('other.jpg', Ticket.objects.get(pk=ticket.pk).image.name)
+        self.assertTrue(StagingStorage().exists(staged_name))
+        self.assertEqual([], [name for path, directories, names in os.walk(default_storage.location) for name in names])
+
+    def test_ticket_page_while_uploading(self):
+        '''
+        The ticket page should say the image is uploading, rather than link to the image before it's uploaded.
+        '''
+        ticket = self.create_ticket()
+        ticket.approved = ticket.created
+        ticket.save()
+        response = self.client.get(ticket.get_absolute_url())
+        self.assertContains(response, 'Image uploading')
+        self.assertNotContains(response, 'imageModal')
+
+    @override_settings(DEFER_MEDIA_UPLOADS=False)
+    def test_image_stored_on_save_without_deferred_uploads(self):
+        '''
+        Without DEFER_MEDIA_UPLOADS, as by default, images should be saved to the media storage as the ticket is saved.
+        '''
+        ticket = Ticket.objects.get(pk=self.create_ticket().pk)
+        self.assertEqual('stored', ticket.image_status)
+        self.assertTrue(default_storage.exists(ticket.image.name))
+        self.assertEqual([], os.listdir(StagingStorage().location))
+
+    def test_staged_image_removed_when_cleared(self):
+        '''
+        Clearing or replacing a ticket's image while it's staged should remove it from the staging storage.
+        '''
+        ticket = Ticket.objects.get(pk=self.create_ticket().pk)
+        staged_name = ticket.image.name
+        ticket.image = image_file((100, 100))
+        with run_on_commit():
+            ticket.save()
+        self.assertFalse(StagingStorage().exists(staged_name))
+
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        staged_name = ticket.image.name
+        ticket.image = None
+        with run_on_commit():
+            ticket.save()
+        self.assertFalse(StagingStorage().exists(staged_name))
+        self.assertEqual([], os.listdir(StagingStorage().location))
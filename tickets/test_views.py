@@ -1,10 +1,13 @@
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.auth.models import User, Permission, AnonymousUser
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.contrib.messages import get_messages
 from django.shortcuts import reverse
 from django.utils import timezone
 from django.db.models import Q
+from django.db import connection
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
 from datetime import timedelta
 from tickets.models import Ticket, Comment, Vote, Pageview, Label
 from tickets.forms import CommentForm, TicketForm, BugForm, FeatureForm, VoteForm, FilterForm, LabelForm
@@ -72,6 +75,28 @@ class TicketViewsTestCase(TicketsTestCase):
         response = self.client.get('/tickets/1/')
         self.assertEqual(response.context['object'], Ticket.objects.get(pk=1))
 
+    def test_ticket_detail_counts_each_visitors_view_once(self):
+        '''
+        Each visitor's views of a ticket should only be counted once, remembered in a cookie rather than their session.
+        '''
+        for n in range(3):
+            self.client.get('/tickets/1/')
+        self.assertEqual(1, Ticket.objects.get(pk=1).no_views)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+        self.client.cookies.clear()
+        self.client.get('/tickets/1/')
+        self.assertEqual(2, Ticket.objects.get(pk=1).no_views)
+
+    def test_ticket_detail_doesnt_count_forbidden_views(self):
+        '''
+        Visitors turned away from a ticket awaiting approval shouldn't have their views counted.
+        '''
+        for n in range(3):
+            response = self.client.get('/tickets/2/')
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(0, Ticket.objects.get(pk=2).no_views)
+
     def test_ticket_detail_has_comment_form_if_logged_in(self):
         '''
         The ticket detail view should pass the comment form to the page context only if the
@@ -135,6 +160,44 @@ class TicketViewsTestCase(TicketsTestCase):
         response = self.client.get('/tickets/1/')
         self.assertIsNone(response.context.get('vote_form'))
 
+    def test_ticket_detail_query_count_does_not_grow_with_comments(self):
+        '''
+        The ticket detail view should make the same number of queries however many comments and replies a ticket has.
+        '''
+        def count_queries(ticket):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/tickets/{}/'.format(ticket.id))
+            return len(queries)
+
+        def create_commented_ticket(no_comments):
+            ticket = Ticket.objects.create(user=self.test_user, title='Comments', content='Test content')
+            ticket.set_status('approved')
+            for n in range(no_comments):
+                comment = Comment.objects.create(user=self.other_user, ticket=ticket, content='Test comment')
+                Comment.objects.create(user=self.test_user, ticket=ticket, reply_to=comment, content='Test reply')
+            return ticket
+
+        self.client.login(username='OtherUser', password='tH1$isA7357')
+        # The day's first view also creates its site wide daily views total.
+        count_queries(create_commented_ticket(0))
+        few_comments_queries = count_queries(create_commented_ticket(1))
+        many_comments_queries = count_queries(create_commented_ticket(20))
+        self.assertEqual(few_comments_queries, many_comments_queries)
+
+    def test_ticket_detail_fetches_ticket_once(self):
+        '''
+        The ticket detail view should fetch the ticket once, however many times its permission checks need it,
+        and count the view once.
+        '''
+        self.client.login(username='TestUser', password='tH1$isA7357')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/tickets/{}/'.format(self.test_ticket2.id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, sum(query['sql'].startswith('SELECT') and 'FROM "tickets_ticket" WHERE' in query['sql']
+                                for query in queries))
+        self.assertEqual(self.test_ticket2.view_count + 1, response.context['ticket'].view_count)
+
 # ADD TICKET TESTS #
 
     def test_get_add_ticket(self):
@@ -499,6 +562,15 @@ class TicketListViewTestCase(TicketsTestCase):
                                  Ticket.objects.exclude(approved=None).filter(labels__in=[self.label_1]).filter(labels__in=[self.label_2])[:10],
                                  transform=lambda x: x)
 
+    def test_get_tickets_list_filters_by_multiple_labels_in_one_subquery(self):
+        '''
+        Filtering by multiple labels should read the labels table once, rather than joining it for each label.
+        '''
+        response = self.client.get('/tickets/?labels=1&labels=2')
+        sql = str(response.context['object_list'].query)
+        self.assertEqual(sql.count('"tickets_ticket_labels"'), 1)
+        self.assertIn('HAVING', sql)
+
     def test_get_tickets_list_order_by_oldest(self):
         '''
         Ordering results by oldest first should return the oldest tickets first.
@@ -624,6 +696,69 @@ class TicketListViewTestCase(TicketsTestCase):
         response = self.client.get('/tickets/?order_by=-vote_count&status=approved&ticket_type=Bug')
         self.assertEqual('?order_by=-vote_count&status=approved&ticket_type=Bug&page=', response.context['query_string'])
 
+    def test_get_tickets_list_search(self):
+        '''
+        Searching should include only matching tickets, ordered by best match unless another ordering is chosen,
+        and the url encoded search should be kept in the query string.
+        '''
+        searched_ticket = Ticket.objects.create(user=self.test_user, title='Searching for unicorns', content='Test content')
+        searched_ticket.set_status('approved')
+        commented_ticket = Ticket.objects.create(user=self.test_user, title='Test title', content='Test content')
+        commented_ticket.set_status('approved')
+        Comment.objects.create(user=self.other_user, ticket=commented_ticket, content='I like unicorns')
+        unapproved_ticket = Ticket.objects.create(user=self.test_user, title='Unapproved unicorns', content='Test content')
+
+        response = self.client.get('/tickets/?q=unicorns')
+        self.assertEqual([searched_ticket, commented_ticket], list(response.context['object_list']))
+        self.assertNotIn(unapproved_ticket, response.context['object_list'])
+        self.assertEqual(2, response.context['no_tickets'])
+
+        response = self.client.get('/tickets/?q=unicorns&order_by=-comment_count')
+        self.assertEqual([commented_ticket, searched_ticket], list(response.context['object_list']))
+
+        response = self.client.get('/tickets/?q=unicorns+%26+more&ticket_type=Bug')
+        self.assertEqual('?q=unicorns+%26+more&ticket_type=Bug&page=', response.context['query_string'])
+
+    @override_settings(TICKETS_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_walks_all_tickets_in_order(self):
+        '''
+        With cursor pagination enabled, following next cursors should visit every ticket once, in order,
+        for each order_by option, and previous cursors should return to the page before.
+        '''
+        for order_by, ordering in (('', ('-created', '-id')), ('created', ('created', 'id')),
+                                   ('-vote_count', ('-vote_total', '-id')), ('-view_count', ('-view_count', '-id')),
+                                   ('-comment_count', ('-comment_count', '-id'))):
+            response = self.client.get('/tickets/?order_by={}'.format(order_by))
+            pages = [list(response.context['object_list'])]
+            self.assertFalse(response.context['page_obj'].has_previous)
+            while response.context['page_obj'].has_next:
+                response = self.client.get('/tickets/' + response.context['query_string'] + response.context['page_obj'].next_cursor)
+                pages.append(list(response.context['object_list']))
+
+            self.assertEqual([ticket for page in pages for ticket in page],
+                             list(Ticket.objects.exclude(approved=None).order_by(*ordering)))
+
+            response = self.client.get('/tickets/' + response.context['query_string'] + response.context['page_obj'].previous_cursor)
+            self.assertEqual(pages[-2], list(response.context['object_list']))
+
+    @override_settings(TICKETS_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_query_string_and_no_count(self):
+        '''
+        With cursor pagination enabled the query string should end with the cursor argument, and the tickets shouldn't be counted.
+        '''
+        response = self.client.get('/tickets/?ticket_type=Bug')
+        self.assertEqual('?ticket_type=Bug&cursor=', response.context['query_string'])
+        self.assertIsNone(response.context.get('no_tickets'))
+        self.assertIsNone(response.context.get('page_range'))
+
+    @override_settings(TICKETS_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_invalid_cursor_not_found(self):
+        '''
+        Cursors that have been tampered with should return 404 not found.
+        '''
+        response = self.client.get('/tickets/?cursor=notacursor')
+        self.assertEqual(response.status_code, 404)
+
 
 class LabelViewsTestCase(TestCase):
     '''
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+import logging
+import threading
+import time
+from tickets.models import Ticket
+
+logger = logging.getLogger(__name__)
+
+
+class MediaUploader(object):
+    '''
+    Uploads tickets' staged images to the media storage with a pool of background threads, so requests don't wait on
+    the upload. Failed uploads are retried after MEDIA_UPLOAD_RETRY_DELAY seconds, up to MEDIA_UPLOAD_MAX_ATTEMPTS times,
+    after which the ticket's image is marked as failed, to be retried by the upload_ticket_images command.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, ticket_id):
+        '''
+        Uploads a ticket's staged image in one of the background threads, returning its future.
+        '''
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=settings.MEDIA_UPLOAD_THREADS)
+            return self._executor.submit(self._upload_in_thread, ticket_id)
+
+    def _upload_in_thread(self, ticket_id):
+        try:
+            return self.upload(ticket_id)
+        finally:
+            connection.close()
+
+    def upload(self, ticket_id):
+        '''
+        Uploads a ticket's staged image, retrying if it fails. Returns whether it was uploaded.
+        '''
+        for attempt in range(1, settings.MEDIA_UPLOAD_MAX_ATTEMPTS + 1):
+            try:
+                ticket = Ticket.objects.get(pk=ticket_id, image_status='uploading')
+            except Ticket.DoesNotExist:
+                # The ticket has been deleted, or its image changed or uploaded already.
+                return False
+            try:
+                return ticket.upload_image()
+            # Storage backends raise their own errors, such as botocore's, so any error is retried.
+            except Exception:
+                logger.exception('Failed to upload the image of ticket %s, attempt %s.', ticket_id, attempt)
+            if attempt < settings.MEDIA_UPLOAD_MAX_ATTEMPTS:
+                time.sleep(settings.MEDIA_UPLOAD_RETRY_DELAY)
+
+        Ticket.objects.filter(pk=ticket_id, image_status='uploading').update(image_status='failed')
+        return False
+
+    def shutdown(self):
+        '''
+        Waits for the uploads in progress and queued to finish.
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+media_uploader = MediaUploader()
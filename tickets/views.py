@@ -7,16 +7,52 @@ from django.utils import timezone
 from django.core.exceptions import PermissionDenied, SuspiciousOperation
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
-from django.db.models.functions import Coalesce
+from django.db.models import Q, Count
 from django.http import HttpResponseBadRequest
-from tickets.models import Ticket, Comment, Pageview, Label
+from django.conf import settings
+from django.utils.http import urlencode
+from django.utils.functional import cached_property
+from tickets.models import Ticket, Comment, Label
+from tickets.pageviews import pageview_recorder, ViewedTickets
+from tickets.pagination import KeysetPaginator
+from tickets.search import search_tickets
 from tickets.forms import CommentForm, TicketForm, FeatureForm, BugForm, VoteForm, FilterForm, LabelForm
 
 
+def filter_labels(queryset, labels):
+    '''
+    Filters a ticket queryset for tickets with all of the given labels. Tickets are matched with a single subquery,
+    counting each ticket's matching labels, rather than a join per label. The subquery is covered by the
+    (label_id, ticket_id) index on the labels table.
+    '''
+    label_ids = set(label.id for label in labels)
+    matching = Ticket.labels.through.objects.filter(label_id__in=label_ids).values('ticket_id') \
+        .annotate(matches=Count('label_id')).filter(matches=len(label_ids)).values('ticket_id')
+    return queryset.filter(id__in=matching)
+
+
 # MIXINS #
 
-class AuthorOrAdminMixin(PermissionRequiredMixin, SingleObjectMixin):
+class MemoizedObjectMixin(SingleObjectMixin):
+    '''
+    Mixin for fetching a view's object once per request. Permission checks and the view itself can call get_object
+    as often as they need, and get the same instance back.
+    Views with side effects on loading the object should override fetch_object, so they only happen once.
+    '''
+    _object = None
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super(MemoizedObjectMixin, self).get_object(queryset)
+        if self._object is None:
+            self._object = self.fetch_object()
+        return self._object
+
+    def fetch_object(self):
+        return super(MemoizedObjectMixin, self).get_object()
+
+
+class AuthorOrAdminMixin(PermissionRequiredMixin, MemoizedObjectMixin):
     '''
     Mixin for checking whether a user is the author of an object, or they have
     permission to access it. Otherwise returns 403 Forbidden.
@@ -36,6 +72,15 @@ class TicketsListView(ListView):
     queryset = Ticket.objects.all()
     template_name = 'ticket_list.html'
     paginate_by = 10
+    # Orderings for each FilterForm order_by option, ending in a unique field so they can be used for cursor pagination.
+    orderings = {
+        '': ('-created', '-id'),
+        'created': ('created', 'id'),
+        '-vote_count': ('-vote_total', '-id'),
+        '-view_count': ('-view_count', '-id'),
+        '-comment_count': ('-comment_count', '-id'),
+    }
+    search_ordering = ('-search_rank', '-id')
 
     def get_form_kwargs(self):
         self.form = FilterForm(self.request.GET)
@@ -44,63 +89,68 @@ class TicketsListView(ListView):
         queryset = super(TicketsListView, self).get_queryset()
 
         if not self.request.user.is_authenticated:  # If user is not authenticated exclude tickets awaiting approval.
-            queryset = queryset.exclude(approved=None)
+            queryset = queryset.exclude(status='awaiting approval')
         else:
             # If user is not admin exclude tickets awaiting approval thet they are not the author of.
             if not self.request.user.has_perm('tickets.can_update_status'):
-                queryset = queryset.exclude(Q(approved=None) & ~Q(user=self.request.user))
+                queryset = queryset.exclude(Q(status='awaiting approval') & ~Q(user=self.request.user))
 
         if self.form.is_valid():
             filters = self.form.cleaned_data
+            if filters['q']:
+                queryset = search_tickets(queryset, filters['q'])
             if filters['ticket_type'] != '':
                 queryset = queryset.filter(ticket_type=filters['ticket_type'])
-            # If ticket status specified, filter for that status by filtering for the following status being unset
-            # and excluding the current status being none.
             if filters['status'] != '':
-                if filters['status'] == 'awaiting':
-                    queryset = queryset.filter(approved=None)
-                elif filters['status'] == 'approved':
-                    queryset = queryset.filter(doing=None).exclude(approved=None)
-                elif filters['status'] == 'doing':
-                    queryset = queryset.filter(done=None).exclude(doing=None)
-                elif filters['status'] == 'done':
-                    queryset = queryset.exclude(done=None)
+                queryset = queryset.filter(status='awaiting approval' if filters['status'] == 'awaiting' else filters['status'])
 
             if filters['labels']:
-                for label in filters['labels']:
-                    queryset = queryset.filter(labels__in=[label])
+                queryset = filter_labels(queryset, filters['labels'])
 
-            if filters['order_by']:
-                if filters['order_by'] == '-view_count':
-                    queryset = queryset.annotate(view_count=Count('pageview'))
-                elif filters['order_by'] == '-vote_count':
-                    queryset = queryset.annotate(vote_count=Coalesce(Sum('vote__count'), 0))
-                elif filters['order_by'] == '-comment_count':
-                    queryset = queryset.annotate(comment_count=Count('comment'))
+        return queryset.order_by(*self.get_ticket_ordering())
 
-                queryset = queryset.order_by(filters['order_by'])
+    def get_ticket_ordering(self):
+        '''
+        Returns the ordering for the selected order_by option, or by best match for searches without one.
+        '''
+        filters = self.form.cleaned_data if self.form.is_valid() else {}
+        if filters.get('q') and not filters.get('order_by'):
+            return self.search_ordering
+        return self.orderings[filters.get('order_by', '')]
 
-        return queryset
+    def paginate_queryset(self, queryset, page_size):
+        '''
+        Paginates using cursors from the query string instead of page numbers, if cursor pagination is enabled.
+        '''
+        if not settings.TICKETS_CURSOR_PAGINATION:
+            return super(TicketsListView, self).paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, self.get_ticket_ordering(), page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_next or page.has_previous)
 
     def get_context_data(self, **kwargs):
         context = super(TicketsListView, self).get_context_data(**kwargs)
+        context['cursor_pagination'] = settings.TICKETS_CURSOR_PAGINATION
 
         # Build query string for pagination
         queries = []
         for key, value in self.form.cleaned_data.items():
-            if key == 'labels':  # If the query is labels, add the ids to the query list individually, else add the key and value verbatim
+            if key == 'labels':  # If the query is labels, add the ids to the query list individually, else add the key and url encoded value
                 for label_id in value.values_list('id', flat=True):
                     queries.append(key + '=' + str(label_id))
             elif value != '':
-                queries.append(key + '=' + value)
-        queries.append('page=')
+                queries.append(urlencode({key: value}))
+        queries.append('cursor=' if context['cursor_pagination'] else 'page=')
         context['query_string'] = '?' + '&'.join(queries)
 
-        # Work out range of pages to show in pagination. Max of 5, +- 2 pages in each direction if possible, otherwise up to +- 4 at ends of range.
-        context['page_range'] = range(max(min(context['page_obj'].number - 2, context['paginator'].num_pages - 4), 1),
-                                      min(max(context['page_obj'].number + 2, 5), context['paginator'].num_pages) + 1)
+        # Cursor pagination skips counting the tickets, page numbers and total are only available with page pagination.
+        if not context['cursor_pagination']:
+            # Work out range of pages to show in pagination. Max of 5, +- 2 pages in each direction if possible, otherwise up to +- 4 at ends of range.
+            context['page_range'] = range(max(min(context['page_obj'].number - 2, context['paginator'].num_pages - 4), 1),
+                                          min(max(context['page_obj'].number + 2, 5), context['paginator'].num_pages) + 1)
 
-        context['no_tickets'] = self.get_queryset().count()
+            context['no_tickets'] = context['paginator'].count
 
         context['filter_form'] = self.form if self.form.has_changed() else FilterForm()
 
@@ -122,14 +172,21 @@ class TicketView(AuthorOrAdminMixin, DetailView):
     template_name = 'ticket_detail.html'
     permission_required = 'tickets.can_update_status'
 
-    def get_object(self, queryset=None):
-        ticket = super(TicketView, self).get_object(queryset)
-        # If ticket hasn't already been viewed this session, create a new pageview for it.
-        if not self.request.session.get('ticket-{}-viewed'.format(ticket.id), False):
-            view = Pageview(ticket=ticket)
-            view.save()
-            self.request.session['ticket-{}-viewed'.format(ticket.id)] = True
-        return ticket
+    @cached_property
+    def viewed_tickets(self):
+        return ViewedTickets(self.request)
+
+    def get(self, request, *args, **kwargs):
+        # If the visitor hasn't already viewed the ticket, record a new pageview for it. This is only reached once
+        # they've been allowed to view it, so visitors turned away aren't counted.
+        ticket = self.get_object()
+        if ticket.id not in self.viewed_tickets:
+            pageview_recorder.record(ticket)
+            ticket.view_count += 1
+            self.viewed_tickets.add(ticket.id)
+        response = super(TicketView, self).get(request, *args, **kwargs)
+        self.viewed_tickets.set_cookie(response)
+        return response
 
     def has_permission(self):
         '''
@@ -217,7 +274,7 @@ class DeleteTicketView(AuthorOrAdminMixin, DeleteView):
         return super(DeleteTicketView, self).get_success_url()
 
 
-class SetTicketStatusView(SingleObjectMixin, PermissionRequiredMixin, View):
+class SetTicketStatusView(MemoizedObjectMixin, PermissionRequiredMixin, View):
     '''
     View that sets an Ticket's status to the given status_field.
     Can only be accessed by users with the can_update_status permission.
@@ -238,7 +295,7 @@ class SetTicketStatusView(SingleObjectMixin, PermissionRequiredMixin, View):
         return redirect(ticket.get_absolute_url())
 
 
-class VoteForTicketView(SingleObjectMixin, LoginRequiredMixin, View):
+class VoteForTicketView(MemoizedObjectMixin, LoginRequiredMixin, View):
     '''
     View to add a vote to a ticket, gets credits to spend on vote from submitted form
     if type is feature. Posts success message and redirects to ticket page.
@@ -366,7 +423,7 @@ class AddLabelView(LabelPermissions, CreateView):
     success_url = reverse_lazy('labels')
 
 
-class EditLabelView(LabelPermissions, UpdateView):
+class EditLabelView(LabelPermissions, MemoizedObjectMixin, UpdateView):
     '''
     View to create labels for tickets. Requires create_edit_delete_labels permission.
     '''
@@ -376,7 +433,7 @@ class EditLabelView(LabelPermissions, UpdateView):
     success_url = reverse_lazy('labels')
 
 
-class DeleteLabelView(LabelPermissions, DeleteView):
+class DeleteLabelView(LabelPermissions, MemoizedObjectMixin, DeleteView):
     '''
     View to create labels for tickets. Requires create_edit_delete_labels permission.
     '''